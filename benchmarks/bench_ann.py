@@ -0,0 +1,94 @@
+"""
+Benchmark for approximate index types against the exact flat index.
+
+Generates clustered, normalized vectors (close to how policy clauses embed:
+many near-duplicates around a few topics), builds every index type through
+embedder.create_faiss_index and prints one JSON line per type with build
+time, index size, query latency and recall@k of the TOP_K_INITIAL shortlist,
+with and without exact re-scoring.
+
+    python benchmarks/bench_ann.py --vectors 200000 --dim 1024 --types flat hnsw ivf_sq ivf_pq
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import config
+from modules.embedder import INDEX_TYPES, create_faiss_index, rescore
+
+def clustered_vectors(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    vectors = centers[rng.integers(0, clusters, count)] + 0.35 * rng.standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def index_bytes(index: faiss.Index) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.index")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.TOP_K_INITIAL)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args()
+
+    data = clustered_vectors(args.vectors + args.queries, args.dim, args.clusters, seed=7)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = create_faiss_index(vectors, index_type=index_type)
+        build_time = time.perf_counter() - start
+
+        fetch = args.k if index_type == "flat" else args.k * config.RESCORE_FACTOR
+        latencies, shortlist, rescored = [], [], []
+        for query in queries:
+            query = query.reshape(1, -1)
+            start = time.perf_counter()
+            _, ids = index.search(query, fetch)
+            candidates = [int(i) for i in ids[0] if i >= 0]
+            scores = rescore(query, vectors, candidates)
+            top = [candidates[i] for i in np.argsort(-scores)[:args.k]]
+            latencies.append(time.perf_counter() - start)
+            shortlist.append(candidates[:args.k])
+            rescored.append(top)
+
+        print(json.dumps({
+            "benchmark": "ann_index",
+            "index": type(index).__name__,
+            "type": index_type,
+            "vectors": args.vectors,
+            "dim": args.dim,
+            "k": args.k,
+            "build_s": round(build_time, 3),
+            "index_mb": round(index_bytes(index) / 2**20, 1),
+            "query_ms_p50": round(1000 * float(np.percentile(latencies, 50)), 3),
+            "query_ms_p95": round(1000 * float(np.percentile(latencies, 95)), 3),
+            "recall_at_k": round(recall(shortlist, truth), 4),
+            "recall_at_k_rescored": round(recall(rescored, truth), 4),
+        }))
+
+if __name__ == "__main__":
+    main()
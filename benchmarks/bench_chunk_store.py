@@ -0,0 +1,115 @@
+"""
+Benchmark for the columnar chunk store against the pickled TextNode list.
+
+Chunks a synthetic policy, writes the chunks both as chunks.pkl and as a
+chunk store, then measures in a fresh process per format what a query pays:
+loading the chunks and fetching --hits of them (TextNodes built from the
+store on demand). Prints one JSON line per format with the load and fetch
+time, the resident memory the load added and the size on disk.
+
+    python benchmarks/bench_chunk_store.py --pages 2000 --hits 15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+
+FORMATS = ("pickle", "store")
+
+def rss_mb() -> float:
+    # resident set size of this process, from /proc (Linux)
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def measure(fmt: str, cache_path: str, hits: int) -> dict:
+    # runs in its own process so earlier loads don't skew the memory numbers
+    # everything both paths import goes before the baseline
+    import faiss  # noqa: F401, load_data imports it
+    from llama_index.core.schema import TextNode  # noqa: F401
+    from modules.chunk_store import ChunkStore
+    from modules.persistence import load_data
+
+    before = rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if fmt == "pickle":
+            nodes = load_data(cache_path, "chunks.pkl", serializer='pickle_frames')
+        else:
+            nodes = ChunkStore(cache_path)
+    loaded = time.perf_counter() - start
+
+    positions = random.Random(0).sample(range(len(nodes)), min(hits, len(nodes)))
+    start = time.perf_counter()
+    fetched = [nodes[i].get_content() for i in positions]
+    fetch = time.perf_counter() - start
+    return {
+        "load_ms": round(1000 * loaded, 2),
+        "fetch_ms": round(1000 * fetch, 3),
+        "rss_added_mb": round(rss_mb() - before, 1),
+        "chunks": len(nodes),
+        "fetched_chars": sum(map(len, fetched)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--hits", type=int, default=15, help="chunks fetched after loading, like one query's candidates")
+    parser.add_argument("--measure", nargs=2, metavar=("FORMAT", "CACHE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], args.measure[1], args.hits)))
+        return
+
+    from llama_index.core.schema import TextNode
+    from modules.chunk_store import write_store
+    from modules.chunker import get_text_nodes
+    from modules.loader import extract_and_clean_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        caches = {fmt: os.path.join(tmp, fmt) for fmt in FORMATS}
+        with contextlib.redirect_stdout(io.StringIO()):
+            nodes = get_text_nodes(extract_and_clean_pdf(pdf_path), pdf_path)
+            os.makedirs(caches["pickle"])
+            # the TextNode list caches used to pickle
+            with open(os.path.join(caches["pickle"], "chunks.pkl"), "wb") as f:
+                pickle.dump([TextNode(text=node.text, metadata=node.metadata) for node in nodes], f)
+            write_store(caches["store"], nodes)
+
+        sizes = {fmt: sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) for fmt, path in caches.items()}
+        results = {}
+        for fmt in FORMATS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--hits", str(args.hits), "--measure", fmt, caches[fmt]],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            results[fmt] = json.loads(output.strip().splitlines()[-1])
+
+        for fmt in FORMATS:
+            print(json.dumps({
+                "benchmark": "chunk_store",
+                "format": fmt,
+                "pages": args.pages,
+                **results[fmt],
+                "disk_mb": round(sizes[fmt] / 2**20, 2),
+                "load_speedup": round(results["pickle"]["load_ms"] / max(results[fmt]["load_ms"], 1e-3), 1),
+                "same_chunks": results[fmt]["fetched_chars"] == results["pickle"]["fetched_chars"],
+            }))
+
+if __name__ == "__main__":
+    main()
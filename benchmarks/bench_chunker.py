@@ -0,0 +1,113 @@
+"""
+Benchmark for the native chunker against llama_index's SentenceSplitter.
+
+Extracts a synthetic policy once, then chunks it with CHUNKER = "llama_index"
+and with CHUNKER = "native" for each --workers count. Prints one JSON line
+per run with pages/s and chunks, and an output comparison measured with the
+embedding model's tokenizer: the largest and mean chunk in tokens, chunks
+over CHUNK_SIZE (which the embedder truncates), the share of page words that
+made it into some chunk, and whether the metadata layout (keys, pages,
+chunk numbering) matches SentenceSplitter's.
+
+    python benchmarks/bench_chunker.py --pages 500 --workers 1 2 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.models import use_fake_models
+
+def layout(nodes) -> tuple:
+    # the metadata keys, the pages in order, and whether every page numbers
+    # its chunks 1..n
+    pages = {}
+    for node in nodes:
+        pages.setdefault(node.metadata["page_number"], []).append(node.metadata["chunk_number"])
+    keys = sorted({key for node in nodes for key in node.metadata})
+    numbered = all(numbers == list(range(1, len(numbers) + 1)) for numbers in pages.values())
+    return keys, list(pages), numbered
+
+def coverage(processed, nodes) -> float:
+    # share of page words that appear in a chunk of their page
+    words = found = 0
+    chunk_words = {}
+    for node in nodes:
+        chunk_words.setdefault(node.metadata["page_number"], set()).update(re.findall(r"\w+", node.get_content()))
+    pages = [{"page_number": "Document Header", "text": processed.get("doc_context", "")}] + processed["pages"]
+    for page in pages:
+        page_words = re.findall(r"\w+", page["text"])
+        words += len(page_words)
+        found += sum(word in chunk_words.get(page["page_number"], ()) for word in page_words)
+    return found / max(words, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fake-models", action="store_true", help="deterministic offline models instead of the real ones")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        use_fake_models()
+
+    from modules.chunker import _token_counts, get_text_nodes
+    from modules.loader import extract_and_clean_pdf
+    from modules.models import get_tokenizer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed = extract_and_clean_pdf(pdf_path)
+
+    tokenizer = get_tokenizer()  # loaded outside the timings
+    special = tokenizer.num_special_tokens_to_add()
+
+    def timed(workers):
+        best, nodes = None, None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            nodes = get_text_nodes(processed, pdf_path, workers=workers)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, nodes
+
+    runs = []
+    config.CHUNKER = "llama_index"
+    runs.append(("llama_index", 1) + timed(1))
+    config.CHUNKER = "native"
+    for workers in args.workers:
+        runs.append(("native", workers) + timed(workers))
+
+    baseline_time, baseline_nodes = runs[0][2], runs[0][3]
+    baseline_layout = layout(baseline_nodes)
+    for chunker, workers, elapsed, nodes in runs:
+        tokens = [count + special for count in _token_counts(tokenizer, [node.get_content() for node in nodes])]
+        print(json.dumps({
+            "benchmark": "chunker",
+            "chunker": chunker,
+            "workers": workers,
+            "pages": args.pages,
+            "seconds": round(elapsed, 4),
+            "pages_per_s": round(args.pages / elapsed, 1),
+            "speedup": round(baseline_time / elapsed, 2),
+            "chunks": len(nodes),
+            "max_tokens": max(tokens),
+            "mean_tokens": round(sum(tokens) / len(tokens), 1),
+            "over_chunk_size": sum(count > config.CHUNK_SIZE for count in tokens),
+            "word_coverage": round(coverage(processed, nodes), 4),
+            "same_layout": layout(nodes) == baseline_layout,
+        }))
+
+if __name__ == "__main__":
+    main()
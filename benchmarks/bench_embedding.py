@@ -0,0 +1,113 @@
+"""
+Benchmark for the embedding engine against a single model.encode call.
+
+Chunks a synthetic policy and embeds the chunk texts the old way (one
+encode call, default batching, then L2 normalization) and through
+encode_texts with each --workers count, and once with EMBED_BITWISE_PARITY.
+Prints one JSON line per run with chunks/s, the padded tokens the batches
+cost, the speedup over the single call and whether the vectors are
+bit-for-bit equal to it.
+
+With --fake-models the vectors don't depend on batching, so every run must
+match exactly; the real model can differ in the last bits between batch
+compositions, which max_abs_diff shows. Only the parity run is guaranteed
+to match the single call with the real model.
+
+    python benchmarks/bench_embedding.py --pages 200 --workers 1 2 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.models import use_fake_models
+
+def single_call(texts):
+    # what encode_texts did before the engine
+    import faiss
+    import numpy as np
+    from modules.models import get_embedder
+    embeddings = np.ascontiguousarray(get_embedder().encode(texts), dtype='float32')
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fake-models", action="store_true", help="deterministic offline models instead of the real ones")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        use_fake_models()
+    config.EMBEDDING_STORE_ENABLED = False
+
+    import numpy as np
+    from modules import embed_engine
+    from modules.chunker import get_text_nodes
+    from modules.embedder import encode_texts
+    from modules.loader import extract_and_clean_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        with contextlib.redirect_stdout(io.StringIO()):
+            texts = [node.get_content() for node in get_text_nodes(extract_and_clean_pdf(pdf_path), pdf_path)]
+
+    single_call(texts[:8])  # loads the model outside the timings
+    lengths = embed_engine.token_lengths(embed_engine.get_embedder(), texts)
+
+    def timed(fn):
+        best, result = None, None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    baseline_time, baseline = timed(lambda: single_call(texts))
+    # model.encode's own batching: 32 texts at a time, longest (in characters) first
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    single_padded = sum(int(lengths[order[i:i + 32]].max()) * len(order[i:i + 32]) for i in range(0, len(order), 32))
+    runs = [("single_call", None, baseline_time, baseline, single_padded)]
+
+    config.EMBED_PARALLEL_MIN_TEXTS = 1
+    for workers in args.workers:
+        config.EMBED_WORKERS = workers
+        stats = {}
+        encode_texts(texts[:config.EMBED_MAX_BATCH * workers])  # starts the pool outside the timings
+        elapsed, result = timed(lambda: encode_texts(texts))
+        embed_engine.encode(texts, stats=stats)
+        runs.append(("engine", workers, elapsed, result, stats["padded_tokens"]))
+    embed_engine.shutdown()
+    config.EMBED_BITWISE_PARITY = True
+    elapsed, result = timed(lambda: encode_texts(texts))
+    runs.append(("engine_parity", 1, elapsed, result, single_padded))
+
+    for name, workers, elapsed, result, padded in runs:
+        print(json.dumps({
+            "benchmark": "embedding",
+            "method": name,
+            "workers": workers,
+            "pages": args.pages,
+            "chunks": len(texts),
+            "seconds": round(elapsed, 4),
+            "chunks_per_s": round(len(texts) / elapsed, 1),
+            "tokens": int(lengths.sum()),
+            "padded_tokens": padded,
+            "speedup": round(baseline_time / elapsed, 2),
+            "bitwise_equal": bool(np.array_equal(result, baseline)),
+            "max_abs_diff": float(np.abs(result - baseline).max()),
+        }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark for hybrid (BM25 + vector) retrieval against vector-only retrieval.
+
+Indexes a synthetic policy, then runs every question through
+retrieve_top_k_chunks in three configurations:
+
+    dense        vector search, TOP_K_INITIAL candidates
+    hybrid       vector + BM25 fused by reciprocal rank, HYBRID_CANDIDATES
+    fast_path    hybrid, plus the BM25-only path for decisive matches
+
+Quality is measured against the reranker itself: a reranker pass over every
+chunk gives the TOP_K_FINAL-th best score of each question, and recall is the
+share of selected chunks scoring at least that (ties count as found). Prints
+one JSON line per configuration with candidates and scored pairs per
+question, rerank and retrieval time, fast path hits and recall.
+
+    python benchmarks/bench_hybrid.py --pages 200 --fake-models
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import SUBJECTS, generate_policy_pdf
+from modules import config
+from modules.models import use_fake_models
+
+CONFIGURATIONS = {
+    "dense": {"RETRIEVAL_MODE": "dense", "LEXICAL_FAST_PATH": False},
+    "hybrid": {"RETRIEVAL_MODE": "hybrid", "LEXICAL_FAST_PATH": False},
+    "fast_path": {"RETRIEVAL_MODE": "hybrid", "LEXICAL_FAST_PATH": True},
+}
+
+def questions(pages: int, count: int, seed: int = 0) -> list:
+    # topic questions plus questions quoting clause numbers, the exact
+    # terms vector search tends to miss
+    rng = random.Random(seed)
+    asked = []
+    for i in range(count):
+        subject = rng.choice(SUBJECTS)
+        if i % 2:
+            clause = f"{rng.randint(1, pages)}.{rng.randint(1, 12)}"
+            asked.append(f"What does clause {clause} say about {subject}?")
+        else:
+            asked.append(rng.choice([
+                f"Is {subject} covered?",
+                f"What is the waiting period for {subject}?",
+                f"Is there a co-payment on {subject}?",
+            ]))
+    return asked
+
+def reranker_scores(question: str, texts: list) -> list:
+    from modules.models import get_reranker
+    return list(get_reranker().predict([(question, text) for text in texts]))
+
+def ideal_score(question: str, store, top_n: int) -> float:
+    # the TOP_K_FINAL-th best reranker score over every chunk; a selected
+    # chunk scoring at least this is as good as an ideal one (ties included)
+    scores = sorted(reranker_scores(question, [store.text(i) for i in range(len(store))]), reverse=True)
+    return scores[min(top_n, len(scores)) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--fake-models", action="store_true", help="deterministic offline models instead of the real ones")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        use_fake_models()
+    config.VERBOSE = False
+
+    from modules.index_registry import get_index
+    from modules.ingest import ingest_pdf
+    from modules.lexical import get_lexical
+    from modules.reranker import clear_cache
+    from modules.retriever import retrieve_top_k_chunks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHED_DIR = tmp
+        config.CORPUS_DIR = os.path.join(tmp, "_corpus")
+        config.EMBEDDING_STORE_PATH = os.path.join(tmp, "embeddings.sqlite")
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        cache_path = os.path.join(tmp, "policy_cache")
+        with contextlib.redirect_stdout(io.StringIO()):
+            ingest_pdf(pdf_path, cache_path)
+        _, store = get_index(cache_path)
+        get_lexical(cache_path)
+
+        asked = questions(args.pages, args.questions)
+        ideal = [ideal_score(question, store, config.TOP_K_FINAL) for question in asked]
+
+        for name, settings in CONFIGURATIONS.items():
+            for key, value in settings.items():
+                setattr(config, key, value)
+            clear_cache()
+            totals = {"candidates": 0, "pairs_scored": 0, "rerank_time": 0.0, "fast_path": 0, "found": 0}
+            start = time.perf_counter()
+            for question, expected in zip(asked, ideal):
+                stats = {}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    nodes = retrieve_top_k_chunks(question, cache_path, stats=stats)
+                totals["candidates"] += stats["pairs_scored"] + stats["pairs_cached"] + stats["pairs_skipped"]
+                totals["pairs_scored"] += stats["pairs_scored"]
+                totals["rerank_time"] += stats["rerank_time"]
+                totals["fast_path"] += bool(stats.get("lexical_fast_path"))
+                selected = reranker_scores(question, [node.get_content() for node in nodes or []])
+                totals["found"] += sum(score >= expected for score in selected)
+            elapsed = time.perf_counter() - start
+
+            n = len(asked)
+            print(json.dumps({
+                "benchmark": "hybrid_retrieval",
+                "configuration": name,
+                "pages": args.pages,
+                "chunks": len(store),
+                "questions": n,
+                "candidates_per_query": round(totals["candidates"] / n, 2),
+                "pairs_scored_per_query": round(totals["pairs_scored"] / n, 2),
+                "rerank_ms_per_query": round(1000 * totals["rerank_time"] / n, 3),
+                "retrieve_ms_per_query": round(1000 * elapsed / n, 3),
+                "fast_path_queries": totals["fast_path"],
+                "recall_at_final": round(totals["found"] / (n * config.TOP_K_FINAL), 3),
+            }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark for serial vs parallel PDF extraction and cleaning.
+
+Generates a multi-hundred-page synthetic policy, runs extract_and_clean_pdf
+with 1 worker and with increasing process counts, checks that every run
+returns the same pages, and prints one JSON line per run.
+
+    python benchmarks/bench_loader.py --pages 600 --workers 1 2 4 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.loader import extract_and_clean_pdf
+
+def timed_extract(pdf_path: str, workers: int):
+    # the loader prints progress, keep the benchmark output machine-readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = extract_and_clean_pdf(pdf_path, workers=workers)
+        elapsed = time.perf_counter() - start
+    return elapsed, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # benchmark every worker count, however small the document
+    config.PARALLEL_MIN_PAGES = 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+
+        baseline_time, baseline = None, None
+        for workers in args.workers:
+            runs = [timed_extract(pdf_path, workers) for _ in range(args.repeat)]
+            elapsed = min(run[0] for run in runs)
+            result = runs[0][1]
+            if baseline is None:
+                baseline_time, baseline = elapsed, result
+            print(json.dumps({
+                "benchmark": "extract_and_clean_pdf",
+                "pages": args.pages,
+                "workers": workers,
+                "seconds": round(elapsed, 4),
+                "pages_per_s": round(args.pages / elapsed, 1),
+                "speedup": round(baseline_time / elapsed, 2),
+                "matches_baseline": result == baseline,
+            }))
+
+if __name__ == "__main__":
+    main()
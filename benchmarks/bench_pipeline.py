@@ -0,0 +1,187 @@
+"""
+End-to-end pipeline benchmark, stage by stage.
+
+For each page count, generates a synthetic policy PDF (repeated headers and
+footers included) and times every stage separately: extract_and_clean_pdf,
+get_text_nodes, embed_chunks, create_faiss_index, saving and loading the
+index and chunk store, then per question retrieval, reranking and prompt
+building (means over --queries questions). Each stage reports the median of
+--repeat runs. Prints one JSON line per page count.
+
+--fake-models swaps in the deterministic embedder and reranker from
+modules.models so the suite runs offline and fast; their timings measure the
+pipeline around the models, not the models. --output saves the results, and
+--compare checks them against saved results from another commit, exiting
+with status 1 when a stage got slower than --tolerance allows.
+
+    python benchmarks/bench_pipeline.py --pages 50 200 --fake-models --output bench.jsonl
+    python benchmarks/bench_pipeline.py --pages 50 200 --fake-models --compare bench.jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.models import use_fake_models
+
+QUESTIONS = [
+    "Is cataract surgery covered?",
+    "What is the waiting period for pre-existing diseases?",
+    "Are ambulance charges reimbursed?",
+    "Is day care treatment covered under this policy?",
+    "What is excluded for maternity expenses?",
+    "Is room rent capped for ICU admission?",
+    "Are AYUSH treatments covered?",
+    "Is bariatric surgery covered after the waiting period?",
+]
+
+# stages faster than this are within timer noise and never flagged
+NOISE_FLOOR_S = 0.005
+
+def commit_id() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+class Timer:
+    # accumulates wall time per stage
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+def run_pipeline(pdf_path: str, cache_path: str, queries: int) -> dict:
+    from modules.chunk_store import ChunkStore, write_store
+    from modules.chunker import get_text_nodes
+    from modules.embedder import create_faiss_index, embed_chunks
+    from modules.index_registry import get_index, invalidate
+    from modules.llm_interface import build_prompt
+    from modules.loader import extract_and_clean_pdf
+    from modules.persistence import load_data, save_data
+    from modules.reranker import clear_cache, score_candidates
+    from modules.retriever import embed_query, hit_nodes, search_candidates
+
+    timer = Timer()
+    with timer.stage("extract_and_clean_pdf"):
+        processed = extract_and_clean_pdf(pdf_path)
+    with timer.stage("get_text_nodes"):
+        nodes = get_text_nodes(processed, pdf_path)
+    with timer.stage("embed_chunks"):
+        embeddings = embed_chunks(nodes)
+    with timer.stage("create_faiss_index"):
+        index = create_faiss_index(embeddings)
+    with timer.stage("save_data"):
+        save_data(cache_path, "faiss.index", index, serializer='faiss')
+        write_store(cache_path, nodes)
+    with timer.stage("load_data"):
+        load_data(cache_path, "faiss.index", serializer='faiss')
+        ChunkStore(cache_path)
+
+    invalidate(cache_path)
+    get_index(cache_path)
+    clear_cache()
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(queries)]
+    for question in questions:
+        with timer.stage("retrieval"):
+            hits = search_candidates(embed_query(question), cache_path)
+            candidates = hit_nodes(hits)
+        with timer.stage("reranking"):
+            scores = score_candidates(question, candidates, config.TOP_K_FINAL)
+        top = [candidates[i] for i in sorted(scores, key=scores.get, reverse=True)[:config.TOP_K_FINAL]]
+        with timer.stage("prompt_building"):
+            build_prompt(question, top)
+
+    for stage in ("retrieval", "reranking", "prompt_building"):
+        timer.stages[stage] /= max(queries, 1)
+    return {"pages": len(processed["pages"]), "chunks": len(nodes), "stages": timer.stages}
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    # stages slower than baseline * tolerance, matched by page count
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {record["pages"]: record for record in map(json.loads, filter(str.strip, f))}
+    regressions = []
+    for record in results:
+        before = baseline.get(record["pages"])
+        if before is None:
+            continue
+        for stage, seconds in record["stage_seconds"].items():
+            old = before["stage_seconds"].get(stage)
+            if old is None or max(old, seconds) < NOISE_FLOOR_S:
+                continue
+            ratio = seconds / old if old else float("inf")
+            if ratio > tolerance:
+                regressions.append({"pages": record["pages"], "stage": stage, "baseline_s": old, "seconds": seconds, "ratio": round(ratio, 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--queries", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per page count, stages report the median")
+    parser.add_argument("--fake-models", action="store_true", help="deterministic stand-ins instead of the configured models")
+    parser.add_argument("--output", help="write the JSON lines to this file as well")
+    parser.add_argument("--compare", help="JSON lines from an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown ratio per stage")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        use_fake_models()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # measure the real work: no shared embedding store, nothing cached
+        config.EMBEDDING_STORE_ENABLED = False
+        config.RERANK_ADAPTIVE = False
+        config.CACHED_DIR = tmp
+        config.CORPUS_DIR = os.path.join(tmp, "_corpus")
+        config.EMBEDDING_STORE_PATH = os.path.join(tmp, "embeddings.sqlite")
+        for pages in args.pages:
+            pdf_path = generate_policy_pdf(os.path.join(tmp, f"policy_{pages}.pdf"), pages)
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                runs = [
+                    run_pipeline(pdf_path, os.path.join(tmp, f"cache_{pages}_{i}"), args.queries)
+                    for i in range(max(args.repeat, 1))
+                ]
+            record = {
+                "benchmark": "pipeline",
+                "commit": commit_id(),
+                "models": "fake" if args.fake_models else config.EMBED_MODEL,
+                "pages": pages,
+                "chunks": runs[0]["chunks"],
+                "queries": args.queries,
+                "repeat": len(runs),
+                "stage_seconds": {
+                    stage: round(statistics.median(run["stages"][stage] for run in runs), 5)
+                    for stage in runs[0]["stages"]
+                },
+            }
+            results.append(record)
+            print(json.dumps(record))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in results)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        print(json.dumps({"benchmark": "pipeline_compare", "baseline": args.compare, "tolerance": args.tolerance, "regressions": regressions}))
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark for the prompt layout: prompt tokens and prompt evaluation before
+and after context assembly and the stable instruction prefix.
+
+Indexes a synthetic policy and, for every --top-k, retrieves that many chunks
+per question and builds each prompt twice: the way build_prompt did before
+(chunks verbatim, the query and rules after the context) and the way it does
+now. Each layout's prompts are then sent in order to a fresh backend. Prints
+one JSON line per top-k and layout with the estimated prompt tokens, the
+prompt tokens the backend evaluated and, from Ollama, the prompt evaluation
+time.
+
+The fake backend models Ollama's prefix reuse: it counts only the prompt
+after the prefix shared with the previous one. --backend ollama measures the
+real thing (prompt_eval_count and prompt_eval_duration).
+
+    python benchmarks/bench_prompt.py --fake-models --top-k 3 8
+    python benchmarks/bench_prompt.py --fake-models --backend ollama --questions 6
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import QUESTIONS
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.llm_backends import FakeBackend, create_backend
+from modules.models import use_fake_models
+
+def legacy_prompt(user_query: str, context_nodes: list) -> str:
+    # build_prompt before context assembly: chunks verbatim, query and rules after them
+    context_text = "\n\n---\n\n".join([node.get_content() for node in context_nodes])
+
+    prompt = f"""
+You are a strict, rule-based insurance analyst. You NEVER infer or make assumptions. Your decisions are based ONLY on explicit text found in the provided CONTEXT.
+
+Your task is to follow these steps precisely:
+1.  Analyze the user's query to understand the core question.
+2.  Scrutinize the CONTEXT for clauses that EXPLICITLY approve or deny the user's request.
+3.  Based on your analysis, make a final decision by following the rules below.
+
+--- START OF CONTEXT ---
+{context_text}
+--- END OF CONTEXT ---
+
+User Query: "{user_query}"
+
+--- DECISION RULES ---
+- **RULE A (Approval/Denial):** If the CONTEXT contains explicit text that confirms coverage or denial, your 'Decision' MUST be "Approved" or "Not Approved". In this case, the 'Clarifying Questions' section MUST be left completely blank.
+- **RULE B (Insufficient Information):** If the CONTEXT is vague, does not mention the specific procedure, or requires ANY assumption on your part, your 'Decision' MUST be "Insufficient Information".
+- **RULE C (Clarification):** IF AND ONLY IF your 'Decision' is "Insufficient Information", you MUST provide a numbered list of questions under 'Clarifying Questions' to resolve the ambiguity.
+
+Respond using the following format EXACTLY:
+
+Justification:
+<Your detailed explanation here, citing ONLY explicit text from the context.>
+
+Decision: <Approved / Not Approved / Insufficient Information> — <A brief, factual reason for your decision.>
+
+Clarifying Questions:
+<A numbered list of questions ONLY if the Decision is "Insufficient Information". This section MUST NOT BE SHOWN otherwise.>
+
+---
+Disclaimer: This decision is based solely on the policy clauses provided and is for informational purposes only.
+"""
+    return prompt.strip()
+
+def evaluate(prompts: list, backend_name: str) -> list:
+    # (prompt tokens evaluated, prompt eval seconds) per prompt, sent in order
+    backend = FakeBackend() if backend_name == "fake" else create_backend(backend_name)
+    results = []
+    for prompt in prompts:
+        stats = {}
+        backend.generate(prompt, stats=stats)
+        duration = stats.get("prompt_eval_duration")
+        results.append((stats.get("prompt_eval_count"), duration / 1e9 if duration is not None else None))
+    backend.close()
+    return results
+
+def mean(values: list):
+    values = [value for value in values if value is not None]
+    return round(statistics.mean(values), 4) if values else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS))
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 8], help="chunks retrieved per prompt")
+    parser.add_argument("--backend", default="fake", help="LLM backend to evaluate the prompts with")
+    parser.add_argument("--fake-models", action="store_true", help="deterministic offline models instead of the real ones")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        use_fake_models()
+    config.VERBOSE = False
+
+    from modules.context_assembler import estimate_tokens
+    from modules.ingest import ingest_pdf
+    from modules.llm_interface import build_prompt
+    from modules.retriever import retrieve_top_k_chunks
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHED_DIR = tmp
+        config.CORPUS_DIR = os.path.join(tmp, "_corpus")
+        config.EMBEDDING_STORE_PATH = os.path.join(tmp, "embeddings.sqlite")
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        cache_path = os.path.join(tmp, "policy_cache")
+        with contextlib.redirect_stdout(io.StringIO()):
+            ingest_pdf(pdf_path, cache_path)
+
+        for top_k in args.top_k:
+            config.TOP_K_FINAL = top_k
+            with contextlib.redirect_stdout(io.StringIO()):
+                selections = [retrieve_top_k_chunks(question, cache_path) or [] for question in questions]
+
+            baseline = None
+            for layout, build in (("before", legacy_prompt), ("after", build_prompt)):
+                prompts = [build(question, nodes) for question, nodes in zip(questions, selections)]
+                evaluated = evaluate(prompts, args.backend)
+                record = {
+                    "benchmark": "prompt",
+                    "layout": layout,
+                    "backend": args.backend,
+                    "top_k": top_k,
+                    "questions": len(prompts),
+                    "prompt_tokens_est": mean([estimate_tokens(prompt) for prompt in prompts]),
+                    "prompt_tokens_evaluated": mean([tokens for tokens, _ in evaluated]),
+                    "prompt_eval_s": mean([seconds for _, seconds in evaluated]),
+                }
+                if baseline is None:
+                    baseline = record
+                else:
+                    for key in ("prompt_tokens_est", "prompt_tokens_evaluated", "prompt_eval_s"):
+                        if record[key] is not None and baseline[key]:
+                            record[f"{key}_change"] = round(record[key] / baseline[key] - 1, 3)
+                print(json.dumps(record))
+
+if __name__ == "__main__":
+    main()
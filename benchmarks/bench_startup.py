@@ -0,0 +1,68 @@
+"""
+Startup-time benchmark for the interactive CLI.
+
+Launches `main.py` several times, measures how long it takes until the file
+prompt is shown, then answers 'exit'. Exits non-zero when the median is over
+the budget so it can guard against import-time regressions.
+
+    python benchmarks/bench_startup.py --runs 5 --budget 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = "Enter the path to a PDF file"
+
+def time_to_prompt() -> float:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        bufsize=0,
+    )
+    seen = ""
+    try:
+        while PROMPT not in seen:
+            char = proc.stdout.read(1)
+            if not char:
+                raise RuntimeError("main.py exited before showing the file prompt")
+            seen += char
+        elapsed = time.perf_counter() - start
+        proc.stdin.write("exit\n")
+        proc.stdin.flush()
+        proc.wait(timeout=30)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="max median seconds to the file prompt")
+    args = parser.parse_args()
+
+    timings = [time_to_prompt() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(json.dumps({
+        "benchmark": "startup",
+        "runs": args.runs,
+        "median_s": round(median, 4),
+        "min_s": round(min(timings), 4),
+        "max_s": round(max(timings), 4),
+        "budget_s": args.budget,
+    }))
+    if median > args.budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
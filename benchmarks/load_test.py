@@ -0,0 +1,146 @@
+"""
+Load test for the HTTP query service.
+
+Starts the service in-process with the fake LLM backend (a fixed per-reply
+latency stands in for generation) and, unless --real-models is given, the
+fake embedder and reranker, indexes a synthetic policy, then runs increasing
+numbers of concurrent clients against /query. Prints one JSON line per
+client count with throughput, latency percentiles and the mean size of the
+coalesced encode / rerank batches.
+
+    python benchmarks/load_test.py --clients 1 2 4 8 16 --requests 40 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.llm_backends import FakeBackend, set_backend
+from modules.models import use_fake_models
+
+QUESTIONS = [
+    "Is cataract surgery covered?",
+    "What is the waiting period for pre-existing diseases?",
+    "Are ambulance charges reimbursed?",
+    "Is day care treatment covered under this policy?",
+    "What is excluded for maternity expenses?",
+    "Is room rent capped for ICU admission?",
+    "Are AYUSH treatments covered?",
+    "What documents are needed for a cashless claim?",
+]
+
+def start_service():
+    # runs the service on its own event loop thread, returns its port
+    from modules.service import QueryService
+
+    ready = threading.Event()
+    bound = {}
+
+    def run():
+        async def main():
+            service = QueryService()
+            server = await service.start("127.0.0.1", 0)
+            bound["port"] = server.sockets[0].getsockname()[1]
+            ready.set()
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
+
+    threading.Thread(target=run, name="service", daemon=True).start()
+    ready.wait()
+    return bound["port"]
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+def client(port: int, pdf_path: str, count: int, offset: int):
+    # one keep-alive connection, `count` sequential questions; returns latencies
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    latencies, failures = [], 0
+    for i in range(count):
+        # vary the wording so the answer cache doesn't serve everything
+        question = f"{QUESTIONS[(offset + i) % len(QUESTIONS)]} (case {offset}-{i})"
+        start = time.perf_counter()
+        status, _ = request(conn, "POST", "/query", {"pdf": pdf_path, "query": question})
+        latencies.append(time.perf_counter() - start)
+        failures += status != 200
+    conn.close()
+    return latencies, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32, help="requests per client count, split across the clients")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM reply")
+    parser.add_argument("--real-models", action="store_true", help="use the configured embedder and reranker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHED_DIR = tmp
+        config.CORPUS_DIR = os.path.join(tmp, "_corpus")
+        config.EMBEDDING_STORE_PATH = os.path.join(tmp, "embeddings.sqlite")
+        config.ANSWER_CACHE_ENABLED = False
+        if not args.real_models:
+            use_fake_models()
+        set_backend(FakeBackend(latency=args.llm_latency))
+
+        pdf_path = generate_policy_pdf(os.path.join(tmp, "policy.pdf"), args.pages)
+        with contextlib.redirect_stdout(io.StringIO()):
+            port = start_service()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+            status, built = request(conn, "POST", "/index", {"pdf": pdf_path})
+            if status != 200:
+                raise SystemExit(f"Indexing failed: {built}")
+            # warm-up: loads the index and the models
+            request(conn, "POST", "/query", {"pdf": pdf_path, "query": QUESTIONS[0]})
+
+        for clients in args.clients:
+            per_client = max(args.requests // clients, 1)
+            _, before = request(conn, "GET", "/stats")
+            with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=clients) as pool:
+                start = time.perf_counter()
+                results = list(pool.map(lambda c: client(port, pdf_path, per_client, c * 1000), range(clients)))
+                elapsed = time.perf_counter() - start
+            _, after = request(conn, "GET", "/stats")
+
+            latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+            batches = {
+                stage: (after[stage]["items"] - before[stage]["items"]) / max(after[stage]["batches"] - before[stage]["batches"], 1)
+                for stage in ("encode", "rerank")
+            }
+            print(json.dumps({
+                "benchmark": "service_load",
+                "clients": clients,
+                "requests": len(latencies),
+                "failures": sum(failures for _, failures in results),
+                "seconds": round(elapsed, 3),
+                "requests_per_s": round(len(latencies) / elapsed, 2),
+                "latency_ms_p50": round(1000 * float(np.percentile(latencies, 50)), 1),
+                "latency_ms_p95": round(1000 * float(np.percentile(latencies, 95)), 1),
+                "mean_encode_batch": round(batches["encode"], 2),
+                "mean_rerank_batch": round(batches["rerank"], 2),
+                "llm_concurrency": config.SERVICE_LLM_CONCURRENCY,
+                "llm_latency_s": args.llm_latency,
+            }))
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Generates synthetic insurance policy PDFs for benchmarks.
+
+Every page carries the same header and footer lines (with a changing page
+number), like real policy wordings, so header/footer removal has something
+to find. The text is deterministic for a given seed.
+
+    python benchmarks/synthetic_pdf.py --pages 500 --out /tmp/policy_500.pdf
+"""
+import argparse
+import random
+import fitz
+
+HEADER_LINES = [
+    "Acme General Insurance Company Limited",
+    "Health Guard Policy - Policy Wording",
+]
+FOOTER_TEMPLATE = "UIN: ACMHLIP21001V012021 | Page {page} of {total}"
+
+SUBJECTS = [
+    "cataract surgery", "hospitalisation expenses", "day care procedures", "maternity expenses",
+    "pre-existing diseases", "ambulance charges", "organ donor expenses", "domiciliary treatment",
+    "AYUSH treatment", "room rent", "ICU charges", "modern treatment methods", "dental treatment",
+    "cosmetic surgery", "bariatric surgery", "mental illness", "home care treatment", "road ambulance",
+]
+CLAUSES = [
+    "The Company shall indemnify the Insured Person for {subject} up to the Sum Insured specified in the Schedule.",
+    "Expenses related to {subject} are excluded until the expiry of {months} months of continuous coverage.",
+    "Claims for {subject} shall be admissible only if the treatment is taken on the written advice of a Medical Practitioner.",
+    "A waiting period of {months} months applies to {subject}, except where the claim arises due to an Accident.",
+    "The maximum liability for {subject} shall not exceed {percent}% of the Sum Insured per Policy Year.",
+    "{subject} is covered subject to a co-payment of {percent}% on each and every admissible claim.",
+    "No claim for {subject} shall be payable if the Insured Person was hospitalised for less than 24 hours.",
+]
+
+def _clause(rng: random.Random, number: str) -> str:
+    template = rng.choice(CLAUSES)
+    text = template.format(
+        subject=rng.choice(SUBJECTS),
+        months=rng.choice([12, 24, 36, 48]),
+        percent=rng.choice([5, 10, 20, 25]),
+    )
+    return f"{number} {text[0].upper()}{text[1:]}"
+
+def generate_policy_pdf(path: str, pages: int, clauses_per_page: int = 12, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_index in range(pages):
+        page = doc.new_page()
+        width, height = page.rect.width, page.rect.height
+
+        header = "\n".join(HEADER_LINES)
+        page.insert_textbox(fitz.Rect(50, 30, width - 50, 70), header, fontsize=9)
+
+        section = page_index + 1
+        body = "\n".join(_clause(rng, f"{section}.{i + 1}") for i in range(clauses_per_page))
+        page.insert_textbox(fitz.Rect(50, 80, width - 50, height - 60), body, fontsize=9)
+
+        footer = FOOTER_TEMPLATE.format(page=page_index + 1, total=pages)
+        page.insert_textbox(fitz.Rect(50, height - 45, width - 50, height - 25), footer, fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--clauses-per-page", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    generate_policy_pdf(args.out, args.pages, args.clauses_per_page, args.seed)
+    print(args.out)
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,90 @@
+import argparse
 import os
-import shutil
-from modules.loader import extract_and_clean_pdf
-from modules.chunker import get_text_nodes
-from modules.embedder import embed_chunks, create_faiss_index
-from modules.retriever import retrieve_top_k_chunks 
-from modules.llm_interface import query_llm_with_context
-from modules.persistence import save_data, cache_exists, get_cache_path
-
-def build_index(file_path: str):
-    print(f"\n🔄 Building index for {os.path.basename(file_path)}...")
-    cache_path = get_cache_path(file_path)
-    if os.path.exists(cache_path):
-        shutil.rmtree(cache_path)
-    processed_data = extract_and_clean_pdf(file_path)
-    if not processed_data or not processed_data.get("pages"):
+import sys
+import time
+from typing import List, Optional
+from modules import config
+from modules.models import warm_up
+from modules.persistence import get_cache_path
+from modules.index_registry import is_indexed
+from modules.indexer import BUILDING, PARTIAL_SUFFIX, QUEUED, Indexer, resolve
+from modules.telemetry import say
+
+# the pipeline modules pull in fitz, faiss, torch and llama_index, so they are
+# imported where they are first needed to keep the file prompt instant
+
+def build_index(file_path: str, resume: bool = False, incremental: bool = False, force: bool = False):
+    # streams the PDF into the index batch by batch; with resume=True an
+    # interrupted build of the same file continues where it stopped, with
+    # incremental=True only pages that changed since the last build are re-embedded
+    # builds are moved into place once complete and locked per document
+    # (see modules/indexer.py): an
+    # index another session finished meanwhile is used unless force=True
+    from modules.indexer import build_document
+
+    name = os.path.basename(file_path)
+    say(f"\n🔄 Building index for {name}...")
+    result = build_document(file_path, resume=resume, incremental=incremental, force=force)
+    if result is None:
         return None
-    nodes = get_text_nodes(processed_data, file_path)
-    if not nodes:
+    if not result["built"]:
+        say(f"✅ Index for {name} was built by another session.\n")
+    elif "reused" in result:
+        say(f"✅ Index for {name} updated: {result['reused']} chunks reused, "
+            f"{result['recomputed']} recomputed, {result['removed']} removed.\n")
+    else:
+        say(f"✅ Index for {name} built and saved.\n")
+    return result["cache_path"]
+
+def add_to_corpus(file_path: str, cache_path: str):
+    from modules.corpus import add_document
+    try:
+        add_document(cache_path, os.path.basename(file_path), os.path.abspath(file_path))
+    except Exception as e:
+        print(f"⚠️ Warning: Could not add '{os.path.basename(file_path)}' to the corpus. Reason: {e}")
+
+def open_document(file_path: str, indexer: Optional[Indexer] = None):
+    # returns the cache path of an indexed PDF, building the index if needed
+    # a PDF the background indexer is working on is opened as soon as it can
+    # be searched, possibly through the partial index of the pages done so far
+    if not os.path.exists(file_path) or not file_path.lower().endswith('.pdf'):
+        print(f"❌ Invalid path '{file_path}'. Please provide a valid path to a PDF file.")
         return None
-    embeddings = embed_chunks(nodes)
-    index = create_faiss_index(embeddings)
-    save_data(cache_path, "faiss.index", index, serializer='faiss')
-    save_data(cache_path, "chunks.pkl", nodes, serializer='pickle')
-    print(f"✅ Index for {os.path.basename(file_path)} built and saved.\n")
+    job = indexer.lookup(file_path) if indexer is not None else None
+    if job is not None and job["state"] in (QUEUED, BUILDING):
+        say(f"⏳ '{os.path.basename(file_path)}' is being indexed in the background, waiting until it can be searched...")
+        cache_path = indexer.wait(file_path)
+        if cache_path is None:
+            print(f"❌ Could not index '{os.path.basename(file_path)}'.")
+        elif cache_path.endswith(PARTIAL_SUFFIX):
+            say("🔎 Searching the pages indexed so far; the rest is added when the build finishes.")
+        return cache_path
+    cache_path = get_cache_path(file_path)
+    if not is_indexed(cache_path):
+        say(f"File '{os.path.basename(file_path)}' has not been indexed yet.")
+        cache_path = build_index(file_path, resume=True)
+        if not cache_path:
+            return None
+    else:
+        say(f"✅ Found existing index for '{os.path.basename(file_path)}'.")
+    add_to_corpus(file_path, cache_path)
     return cache_path
 
-def chat_session(file_path: str, cache_path: str):
-    print(f"\n--- Chatting with: {os.path.basename(file_path)} ---")
+def chat_session(file_paths: List[str], cache_paths: Optional[List[str]]):
+    # chats with one document, a selection of documents, or (cache_paths=None)
+    # every document in the corpus
+    from modules.retriever import embed_query
+    from modules.llm_interface import query_llm_with_context, stream_llm_with_context
+    from modules.answer_cache import get_cache
+    from modules.conversation import ConversationState
+
+    title = ", ".join(os.path.basename(path) for path in file_paths) if cache_paths is not None else "all indexed documents"
+    print(f"\n--- Chatting with: {title} ---")
     print("> Type 'exit' to quit, 'rebuild' to re-index, or 'back' to choose another file.\n")
 
     original_query = None
+    # candidates and LLM context of the clarification loop in progress
+    conversation = None
     
     while True:
         # new conversation
@@ -49,75 +104,247 @@ def chat_session(file_path: str, cache_path: str):
                 print("\n--- Returning to file selection menu ---")
                 break
             if command == "rebuild":
-                build_index(file_path)
+                if cache_paths is None:
+                    print("'rebuild' is only available when chatting with selected files.")
+                    continue
+                for i, file_path in enumerate(file_paths):
+                    # a changed file gets a new content-addressed cache path
+                    cache_paths[i] = build_index(file_path, incremental=True, force=True) or cache_paths[i]
+                    add_to_corpus(file_path, cache_paths[i])
                 continue
         
+        # a partial index gives way to the full one between questions
+        if cache_paths is not None and conversation is None:
+            for i, cache_path in enumerate(cache_paths):
+                if resolve(cache_path) != cache_path:
+                    cache_paths[i] = resolve(cache_path)
+                    say(f"✅ {os.path.basename(file_paths[i])} is fully indexed now, searching all of its pages.")
+
         query_to_send = original_query
+        target = cache_paths[0] if cache_paths is not None and len(cache_paths) == 1 else cache_paths
         
         try:
-            top_nodes = retrieve_top_k_chunks(query_to_send, cache_path)
-            if not top_nodes:
-                print("Could not retrieve relevant context. Please try another question.")
-                original_query = None # Reset for next question
-                continue
+            # follow-up turns depend on the exchange so far, they aren't cached
+            answers = get_cache(target) if conversation is None else None
+            cached = answers.lookup_exact(query_to_send) if answers else None
+            if cached is None:
+                if conversation is None:
+                    conversation = ConversationState(target, query_to_send)
+                    # only the answer cache needs the embedding up front,
+                    # without it a decisive lexical match skips encoding
+                    query_embedding = embed_query(query_to_send) if answers else None
+                    top_nodes = conversation.retrieve(query_embedding)
+                else:
+                    top_nodes = conversation.retrieve()
+                if not top_nodes:
+                    print("Could not retrieve relevant context. Please try another question.")
+                    original_query = None # Reset for next question
+                    conversation = None
+                    continue
+                cached = answers.lookup_similar(query_embedding, top_nodes) if answers else None
 
-            llm_response = query_llm_with_context(query_to_send, top_nodes)
-            
             print("\n📄 Answer:\n")
-            print(llm_response.get("answer"))
+            streamed = False
+            if cached is not None:
+                print("♻️ Answered before, reusing the cached answer.\n")
+                llm_response = cached["response"]
+                sources = cached["sources"]
+                print(llm_response.get("answer"))
+            else:
+                if config.STREAM_ANSWERS:
+                    llm_response = stream_llm_with_context(
+                        query_to_send, top_nodes,
+                        on_token=lambda text: print(text, end="", flush=True),
+                        conversation=conversation,
+                    )
+                    streamed = llm_response.get("status") != "error"
+                    if streamed:
+                        print()
+                    else:
+                        print(llm_response.get("answer"))
+                    if llm_response.get("ttft") is not None:
+                        print(f"\n⏱️ First token after {llm_response['ttft']:.2f}s, answer complete after {llm_response['total_time']:.2f}s.")
+                else:
+                    llm_response = query_llm_with_context(query_to_send, top_nodes, conversation=conversation)
+                    print(llm_response.get("answer"))
+                if llm_response.get("prompt_tokens") is not None:
+                    prompt_eval = llm_response.get("prompt_eval_time")
+                    say(f"🧮 Prompt: {llm_response['prompt_tokens']} tokens evaluated"
+                        + (f" in {prompt_eval:.2f}s." if prompt_eval is not None else "."))
+                sources = [node.metadata for node in top_nodes]
+                if answers:
+                    answers.store(query_to_send, query_embedding, top_nodes, llm_response)
 
             print("\nSources:")
-            for node in top_nodes:
-                metadata = node.metadata
+            for metadata in sources:
                 print(f"- {metadata['file_name']} (Page: {metadata['page_number']}, Chunk: {metadata['chunk_number']})")
             print("\n" + "=" * 50 + "\n")
 
             if llm_response.get("status") == "insufficient":
                 print("The chatbot needs more information to provide a final answer:")
-                for q in llm_response.get("questions", []):
-                    print(f"- {q}")
+                # the streamed answer already showed the questions
+                if not streamed:
+                    for q in llm_response.get("questions", []):
+                        print(f"- {q}")
                 
                 additional_info = input("\nPlease provide the requested details (or type 'skip' to ask a new question): ").strip()
 
                 if additional_info.lower() == 'skip':
                     original_query = None # Reset to ask a new question
+                    conversation = None
                     print("\n" + "="*50 + "\n")
                     continue
                 
-                # new query for next iteration
+                # new query for next iteration; the conversation only
+                # retrieves what the new details add
+                if conversation is not None:
+                    conversation.add_details(additional_info)
                 original_query = f"{original_query} [User has provided new information: {additional_info}]"
                 print("\n--- Thank you. Re-evaluating with new information... ---")
             else:
                 original_query = None
+                conversation = None
 
         except Exception as e:
             print(f"❌ An error occurred: {e}")
             original_query = None 
+            conversation = None
+
+def start_watcher() -> Optional[Indexer]:
+    # indexes the PDFs dropped into INDEXER_WATCH_DIR in the background while
+    # the user chats; their build progress stays out of the conversation
+    if not config.INDEXER_AUTOSTART or not os.path.isdir(config.INDEXER_WATCH_DIR):
+        return None
+    indexer = Indexer(quiet=True).start()
+    say(f"👀 Indexing the PDFs in '{config.INDEXER_WATCH_DIR}' in the background (type 'status' to see them).")
+    return indexer
+
+def show_status(indexer: Optional[Indexer]):
+    from modules.indexer import format_status
+    if indexer is None:
+        print(f"No folder is being watched. Turn on INDEXER_AUTOSTART in modules/config.py (or run 'python main.py watch') "
+              f"to index the PDFs dropped into '{config.INDEXER_WATCH_DIR}'.")
+        return
+    records = indexer.status()
+    print(f"{indexer.queue_depth()} documents queued or building." if records else f"No PDFs in '{indexer.folder}' yet.")
+    if records:
+        print(format_status(records))
 
 def main():
     print("\n=== Dynamic RAG Chatbot (v3.3) ===")
+    if config.WARMUP_MODELS:
+        # load the models in the background while the user types a path
+        warm_up(background=True)
+    indexer = start_watcher()
     while True:
-        file_path_input = input("Enter the path to a PDF file (or type 'exit' to quit): ").strip()
+        file_path_input = input("Enter the path to a PDF file, several paths separated by commas, or 'all' to use every indexed document (or type 'exit' to quit): ").strip()
         if file_path_input.lower() == 'exit':
             print("Goodbye!")
             break
-        if not os.path.exists(file_path_input) or not file_path_input.lower().endswith('.pdf'):
-            print("❌ Invalid path. Please provide a valid path to a PDF file.")
+        if file_path_input.lower() == 'status':
+            show_status(indexer)
             continue
-        cache_path = get_cache_path(file_path_input)
-        if not cache_exists(cache_path, ["faiss.index", "chunks.pkl"]):
-            print(f"File '{os.path.basename(file_path_input)}' has not been indexed yet.")
-            new_cache_path = build_index(file_path_input)
-            if not new_cache_path:
+        if file_path_input.lower() == 'all':
+            from modules.corpus import list_documents
+            documents = list_documents()
+            if not documents:
+                print("❌ The corpus is empty. Open a PDF first to index it.")
                 continue
-            cache_path = new_cache_path
+            file_paths = [entry["name"] for entry in documents.values()]
+            cache_paths = None
         else:
-            print(f"✅ Found existing index for '{os.path.basename(file_path_input)}'.")
+            file_paths = [path.strip() for path in file_path_input.split(',') if path.strip()]
+            cache_paths = [open_document(path, indexer) for path in file_paths]
+            if not file_paths or not all(cache_paths):
+                continue
         try:
-            chat_session(file_path_input, cache_path)
+            chat_session(file_paths, cache_paths)
         except SystemExit as e:
             print(e)
             break
 
+def add_output_options(parser: argparse.ArgumentParser):
+    parser.add_argument("--telemetry", action="store_true",
+                        help=f"log spans to {config.TELEMETRY_LOG_PATH} and write metrics to {config.METRICS_PATH}")
+    parser.add_argument("--quiet", action="store_true", help="no progress output, only results and errors")
+
+def apply_output_options(args: argparse.Namespace):
+    if args.telemetry:
+        config.TELEMETRY_ENABLED = True
+    if args.quiet:
+        config.VERBOSE = False
+
+def batch_main(argv: List[str]):
+    # non-interactive: python main.py batch QUESTIONS OUTPUT --pdf policy.pdf
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Evaluate a JSONL/CSV file of questions (a 'query' field, optional 'id') and write JSONL results.",
+    )
+    parser.add_argument("questions", help="input .jsonl or .csv file")
+    parser.add_argument("output", help="output .jsonl file, resumed if it exists")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--pdf", nargs="+", help="PDF files to ask against (indexed if needed)")
+    scope.add_argument("--all", action="store_true", help="ask against every indexed document")
+    parser.add_argument("--concurrency", type=int, default=None, help=f"concurrent LLM calls (default {config.BATCH_LLM_CONCURRENCY})")
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of skipping answered questions")
+    add_output_options(parser)
+    args = parser.parse_args(argv)
+    apply_output_options(args)
+
+    from modules.batch import run_batch
+    if args.all:
+        target = None
+    else:
+        cache_paths = [open_document(path) for path in args.pdf]
+        if not all(cache_paths):
+            raise SystemExit(1)
+        target = cache_paths[0] if len(cache_paths) == 1 else cache_paths
+    run_batch(args.questions, args.output, target, concurrency=args.concurrency, resume=not args.no_resume)
+
+def serve_main(argv: List[str]):
+    # python main.py serve [--host HOST] [--port PORT] [--watch [FOLDER]]
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Run the multi-user HTTP query service.")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument("--watch", nargs="?", const=config.INDEXER_WATCH_DIR, default=None, metavar="FOLDER",
+                        help=f"also index the PDFs dropped into FOLDER (default {config.INDEXER_WATCH_DIR})")
+    add_output_options(parser)
+    args = parser.parse_args(argv)
+    apply_output_options(args)
+
+    from modules.service import serve
+    if config.WARMUP_MODELS:
+        warm_up(background=True)
+    serve(args.host, args.port, watch=args.watch)
+
+def watch_main(argv: List[str]):
+    # python main.py watch [FOLDER] [--workers N]: indexes the PDFs dropped into a folder
+    parser = argparse.ArgumentParser(prog="main.py watch", description="Index the PDFs that appear or change in a folder until interrupted.")
+    parser.add_argument("folder", nargs="?", default=config.INDEXER_WATCH_DIR)
+    parser.add_argument("--workers", type=int, default=None, help=f"concurrent builds (default {config.INDEXER_WORKERS})")
+    add_output_options(parser)
+    args = parser.parse_args(argv)
+    apply_output_options(args)
+
+    from modules.indexer import format_status
+    from modules.telemetry import write_metrics
+    indexer = Indexer(args.folder, args.workers).start()
+    print(f"👀 Watching {indexer.folder} with {indexer.workers} workers (Ctrl+C to stop).")
+    try:
+        while True:
+            time.sleep(indexer.poll_seconds)
+            # keeps the queue depth in the metrics file current
+            if config.TELEMETRY_ENABLED:
+                write_metrics()
+    except KeyboardInterrupt:
+        indexer.stop(wait=False)
+        if indexer.status():
+            print(format_status(indexer.status()))
+        print("Goodbye!")
+
 if __name__ == '__main__':
-    main()
+    commands = {"batch": batch_main, "serve": serve_main, "watch": watch_main}
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        commands[sys.argv[1]](sys.argv[2:])
+    else:
+        main()
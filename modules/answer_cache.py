@@ -0,0 +1,166 @@
+"""
+Answers reused for a repeated question, or a rephrasing that retrieves the
+same chunks; a cache is reset when any of its indexes is rebuilt.
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+import numpy as np
+from . import config
+from .index_registry import index_version
+from .persistence import save_data, load_data
+from .reranker import chunk_id, normalize_query
+from .telemetry import count
+
+ANSWERS_FILE = "answers.pkl"
+
+# fields of a generation result that describe that one run, not the answer
+_RUN_FIELDS = ("ttft", "total_time", "stopped_early")
+
+class AnswerCache:
+    def __init__(self, directory: str, file_name: str, version: Any):
+        self.directory = directory
+        self.file_name = file_name
+        self.version = version
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        # recency changed since the file was last written
+        self._dirty = False
+        try:
+            stored = load_data(directory, file_name, serializer='pickle')
+        except FileNotFoundError:
+            stored = None
+        if stored and stored.get("version") == version:
+            self._entries = stored["entries"]
+            self._evict()
+
+    def _evict(self) -> bool:
+        # drops expired entries, then the least recently used over the limit;
+        # True when anything was dropped
+        now = time.time()
+        size = len(self._entries)
+        self._entries = [entry for entry in self._entries if now - entry["created"] <= config.ANSWER_CACHE_TTL]
+        self._entries.sort(key=lambda entry: entry["last_used"], reverse=True)
+        del self._entries[max(config.ANSWER_CACHE_SIZE, 0):]
+        return len(self._entries) != size
+
+    def _save(self):
+        save_data(self.directory, self.file_name, {"version": self.version, "entries": self._entries}, serializer='pickle', verbose=False)
+        self._dirty = False
+
+    def _expire(self):
+        # evicts before a lookup, writing the file only if something went
+        if self._evict():
+            self._save()
+
+    def _hit(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        entry["last_used"] = time.time()
+        self._dirty = True
+        return entry
+
+    def flush(self):
+        # writes out the recency of hits since the last write, unless the
+        # cache directory was removed in the meantime
+        with self._lock:
+            if self._dirty and os.path.isdir(self.directory):
+                self._save()
+
+    def lookup_exact(self, query: str) -> Optional[Dict[str, Any]]:
+        # the cached entry for the same question, asked before
+        normalized = normalize_query(query)
+        with self._lock:
+            self._expire()
+            for entry in self._entries:
+                if entry["query"] == normalized:
+                    count("rag_cache_hits_total", cache="answers_exact")
+                    return self._hit(entry)
+        count("rag_cache_misses_total", cache="answers_exact")
+        return None
+
+    def lookup_similar(self, query_embedding: np.ndarray, nodes: Sequence[Any]) -> Optional[Dict[str, Any]]:
+        # the closest cached question above the threshold that was answered
+        # from exactly the same chunks
+        chunks = sorted(chunk_id(node) for node in nodes)
+        query_vector = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        with self._lock:
+            self._expire()
+            best, best_score = None, config.ANSWER_CACHE_SIMILARITY
+            for entry in self._entries:
+                if entry["chunks"] != chunks:
+                    continue
+                score = float(entry["embedding"] @ query_vector)
+                if score >= best_score:
+                    best, best_score = entry, score
+            count("rag_cache_hits_total" if best is not None else "rag_cache_misses_total", cache="answers_similar")
+            return self._hit(best) if best is not None else None
+
+    def store(self, query: str, query_embedding: np.ndarray, nodes: Sequence[Any], response: Dict[str, Any]):
+        if response.get("status") == "error":
+            return
+        now = time.time()
+        normalized = normalize_query(query)
+        entry = {
+            "query": normalized,
+            "embedding": np.asarray(query_embedding, dtype='float32').reshape(-1),
+            "chunks": sorted(chunk_id(node) for node in nodes),
+            "response": {key: value for key, value in response.items() if key not in _RUN_FIELDS},
+            "sources": [dict(node.metadata) for node in nodes],
+            "created": now,
+            "last_used": now,
+        }
+        with self._lock:
+            self._entries = [existing for existing in self._entries if existing["query"] != normalized]
+            self._entries.append(entry)
+            self._evict()
+            self._save()
+
+# (directory, file name) -> open cache
+_open: Dict[tuple, AnswerCache] = {}
+_open_lock = threading.Lock()
+
+def _location(target: Union[str, Sequence[str], None]) -> tuple:
+    # (directory, file name, version) of the cache for a chat target
+    if isinstance(target, str):
+        return target, ANSWERS_FILE, index_version(target)
+    if target is None:
+        from .corpus import list_documents
+        documents = sorted((entry["cache_path"], entry.get("version")) for entry in list_documents().values())
+        return config.CORPUS_DIR, "answers_all.pkl", documents
+    paths = sorted(os.path.abspath(path) for path in target)
+    scope = hashlib.sha1("\0".join(paths).encode("utf-8")).hexdigest()[:16]
+    return config.CORPUS_DIR, f"answers_{scope}.pkl", [index_version(path) for path in paths]
+
+def get_cache(target: Union[str, Sequence[str], None]) -> Optional[AnswerCache]:
+    # the answer cache of one document (cache path), a selection of them
+    # (list of cache paths) or the whole corpus (None)
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    directory, file_name, version = _location(target)
+    with _open_lock:
+        cache = _open.get((directory, file_name))
+        if cache is None or cache.version != version:
+            cache = AnswerCache(directory, file_name, version)
+            _open[(directory, file_name)] = cache
+        return cache
+
+@atexit.register
+def flush_all():
+    # persists the recency of every open cache, run at exit
+    with _open_lock:
+        caches = list(_open.values())
+    for cache in caches:
+        try:
+            cache.flush()
+        except OSError as e:
+            print(f"⚠️ Warning: Could not save the answer cache in {cache.directory}. Reason: {e}")
+
+def invalidate(cache_path: str):
+    # forgets the answers cached for a document that is being rebuilt
+    with _open_lock:
+        _open.pop((cache_path, ANSWERS_FILE), None)
+    full_path = os.path.join(cache_path, ANSWERS_FILE)
+    if os.path.exists(full_path):
+        os.remove(full_path)
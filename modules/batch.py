@@ -0,0 +1,178 @@
+"""
+Batch claim evaluation: runs a file of questions against indexed documents
+and writes one JSON line per question, resuming an interrupted run.
+"""
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Union
+import faiss
+import numpy as np
+from . import config
+from .answer_cache import get_cache
+from .llm_interface import answer_sections, query_llm_with_context
+from .models import get_embedder
+from .reranker import score_many
+from .retriever import hit_nodes, search_candidates
+from .telemetry import say
+
+STAGES = ("embed", "search", "rerank", "llm")
+
+def read_queries(path: str) -> List[Dict[str, str]]:
+    # [{"id", "query"}] from a .jsonl file or a .csv file with a header row;
+    # rows without an id are numbered by their position in the file
+    queries = []
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for number, row in enumerate(rows, start=1):
+        query = (row.get("query") or "").strip()
+        if query:
+            queries.append({"id": str(row.get("id") or number), "query": query})
+    return queries
+
+def _completed_ids(output_path: str) -> set:
+    # ids already written by an earlier run; a torn last line is rewritten
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r+", encoding="utf-8") as f:
+        valid_bytes = 0
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            valid_bytes += len(line.encode("utf-8"))
+        f.truncate(valid_bytes)
+    return done
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+def run_batch(queries_path: str, output_path: str, target: Union[str, Sequence[str], None],
+              concurrency: Optional[int] = None, resume: bool = True) -> Dict[str, Any]:
+    # evaluates every question in queries_path against target (one cache
+    # path, a list of them, or None for the whole corpus) and returns the
+    # throughput / per-stage latency summary that is also printed
+
+    concurrency = max(concurrency or config.BATCH_LLM_CONCURRENCY, 1)
+    queries = read_queries(queries_path)
+    done = _completed_ids(output_path) if resume else set()
+    if not resume and os.path.exists(output_path):
+        os.remove(output_path)
+    pending = [q for q in queries if q["id"] not in done]
+    say(f"📋 {len(queries)} questions, {len(done)} already answered, {len(pending)} to go.")
+
+    answers = get_cache(target)
+    stage_times = {stage: 0.0 for stage in STAGES}
+    llm_latencies: List[float] = []
+    counts = {"answered": 0, "cached": 0, "errors": 0}
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        def write(record: Dict[str, Any]):
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+
+        def answer(item: Dict[str, str], nodes: List[Any], embedding: np.ndarray):
+            begin = time.perf_counter()
+            cached = answers.lookup_similar(embedding, nodes) if answers else None
+            if cached is not None:
+                response, sources = cached["response"], cached["sources"]
+            else:
+                response = query_llm_with_context(item["query"], nodes)
+                sources = [node.metadata for node in nodes]
+                if answers:
+                    answers.store(item["query"], embedding, nodes, response)
+            elapsed = time.perf_counter() - begin
+            if response.get("status") == "error":
+                print(f"❌ Question {item['id']} failed: {response.get('answer')}")
+                with write_lock:
+                    counts["errors"] += 1
+                return
+            write({
+                "id": item["id"],
+                "query": item["query"],
+                "status": response.get("status"),
+                **answer_sections(response.get("answer", "")),
+                "questions": response.get("questions", []),
+                "sources": [
+                    {key: metadata.get(key) for key in ("file_name", "page_number", "chunk_number")}
+                    for metadata in sources
+                ],
+                "cached": cached is not None,
+                "llm_seconds": round(elapsed, 3),
+            })
+            with write_lock:
+                counts["cached" if cached is not None else "answered"] += 1
+                if cached is None:
+                    llm_latencies.append(elapsed)
+
+        chunk_size = max(config.BATCH_CHUNK_SIZE, 1)
+        for begin in range(0, len(pending), chunk_size):
+            chunk = pending[begin:begin + chunk_size]
+
+            stage_start = time.perf_counter()
+            embeddings = get_embedder().encode([item["query"] for item in chunk], batch_size=config.EMBED_BATCH_SIZE).astype('float32')
+            faiss.normalize_L2(embeddings)
+            stage_times["embed"] += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            candidates = []
+            for item, embedding in zip(chunk, embeddings):
+                hits = search_candidates(embedding.reshape(1, -1), target, query=item["query"])
+                candidates.append(hit_nodes(hits))
+            stage_times["search"] += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            scores = score_many([(item["query"], nodes) for item, nodes in zip(chunk, candidates)])
+            stage_times["rerank"] += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            futures = []
+            for item, nodes, node_scores, embedding in zip(chunk, candidates, scores, embeddings):
+                if not nodes:
+                    print(f"❌ Question {item['id']}: no relevant context found.")
+                    with write_lock:
+                        counts["errors"] += 1
+                    continue
+                order = np.argsort(node_scores)[::-1][:config.TOP_K_FINAL]
+                top_nodes = [nodes[i] for i in order]
+                futures.append(pool.submit(answer, item, top_nodes, embedding))
+            for future in futures:
+                future.result()
+            stage_times["llm"] += time.perf_counter() - stage_start
+            say(f"📦 Answered {begin + len(chunk)}/{len(pending)} questions.")
+
+    total_time = time.perf_counter() - start
+    processed = len(pending)
+    summary = {
+        "questions": processed,
+        "skipped_done": len(done),
+        **counts,
+        "seconds": round(total_time, 3),
+        "questions_per_s": round(processed / total_time, 3) if total_time > 0 else 0.0,
+        "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stage_times.items()},
+        "stage_ms_per_question": {
+            stage: round(1000 * seconds / processed, 2) if processed else 0.0
+            for stage, seconds in stage_times.items()
+        },
+        "llm_ms_p50": round(1000 * _percentile(llm_latencies, 50), 1),
+        "llm_ms_p95": round(1000 * _percentile(llm_latencies, 95), 1),
+        "llm_concurrency": concurrency,
+    }
+    print(f"\n✅ Batch complete: {processed} questions in {total_time:.1f}s ({summary['questions_per_s']} questions/s).")
+    for stage in STAGES:
+        print(f"   {stage:<7} {summary['stage_seconds'][stage]:>9.2f}s  {summary['stage_ms_per_question'][stage]:>9.1f} ms/question")
+    print(json.dumps(summary))
+    return summary
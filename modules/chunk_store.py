@@ -0,0 +1,153 @@
+"""
+Columnar chunk store: chunk texts in chunks.txt and int64 (start, end, page,
+chunk, file) rows in chunks.npy, both memory-mapped.
+"""
+import mmap
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Sequence, Tuple, Union
+import numpy as np
+from .index_registry import CHUNK_META_FILE, CHUNK_TEXT_FILE, CHUNKS_FILE, LEGACY_CHUNKS_FILE
+from .persistence import append_data, load_data, save_data
+from .telemetry import say
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import TextNode
+
+FORMAT_VERSION = 1
+PARTIAL_TEXT = "chunks.txt.partial"
+PARTIAL_ROWS = "chunks.rows.partial"
+HEADER_PAGE = "Document Header"
+
+# column rows of chunks.npy
+START, END, PAGE, CHUNK, FILE = range(5)
+
+_migrate_lock = threading.Lock()
+
+def page_value(page_number: Any) -> int:
+    # the document context is page 0, real pages start at 1
+    return 0 if page_number == HEADER_PAGE else int(page_number)
+
+class ChunkStore:
+    """Read-only view of a cache's chunks; store[i] builds the i-th TextNode."""
+
+    def __init__(self, cache_path: str):
+        meta = load_data(cache_path, CHUNK_META_FILE, serializer='json', verbose=False)
+        if not meta or meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store in {cache_path}. Try 'rebuild'.")
+        self.files: List[str] = meta["files"]
+        self.columns = np.load(os.path.join(cache_path, CHUNKS_FILE), mmap_mode='r')
+        text_path = os.path.join(cache_path, CHUNK_TEXT_FILE)
+        with open(text_path, 'rb') as f:
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(text_path) else b""
+
+    def __len__(self) -> int:
+        return self.columns.shape[1]
+
+    def text(self, i: int) -> str:
+        return self._text[int(self.columns[START, i]):int(self.columns[END, i])].decode('utf-8')
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        page = int(self.columns[PAGE, i])
+        return {
+            "file_name": self.files[int(self.columns[FILE, i])],
+            "page_number": HEADER_PAGE if page == 0 else page,
+            "chunk_number": int(self.columns[CHUNK, i]),
+        }
+
+    @property
+    def pages(self) -> np.ndarray:
+        return self.columns[PAGE]
+
+    def __getitem__(self, i: Union[int, slice]) -> Union["TextNode", List["TextNode"]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        # the only place the pipeline builds TextNodes, so llama_index is
+        # imported on the first chunk read rather than with the modules
+        from llama_index.core.schema import TextNode
+        return TextNode(text=self.text(i), metadata=self.metadata(i))
+
+    def __iter__(self) -> Iterator["TextNode"]:
+        for i in range(len(self)):
+            yield self[i]
+
+def encode(nodes: Sequence[Any], files: List[str], offset: int = 0) -> Tuple[bytes, np.ndarray]:
+    # the text blob and (n, 5) rows of a batch; offset is where the blob
+    # starts in chunks.txt, file names not in `files` yet are appended to it
+    # nodes are chunker ChunkNodes, or the TextNodes of a chunks.pkl
+    blob = bytearray()
+    rows = np.empty((len(nodes), 5), dtype=np.int64)
+    for row, node in zip(rows, nodes):
+        data = node.get_content().encode('utf-8')
+        file_name = node.metadata["file_name"]
+        if file_name not in files:
+            files.append(file_name)
+        row[START] = offset + len(blob)
+        blob += data
+        row[END] = offset + len(blob)
+        row[PAGE] = page_value(node.metadata["page_number"])
+        row[CHUNK] = node.metadata["chunk_number"]
+        row[FILE] = files.index(file_name)
+    return bytes(blob), rows
+
+def append_batch(cache_path: str, nodes: Sequence[Any], files: List[str]) -> Tuple[int, int]:
+    # appends a batch to the partial files, returns their sizes afterwards
+    text_path = os.path.join(cache_path, PARTIAL_TEXT)
+    offset = os.path.getsize(text_path) if os.path.exists(text_path) else 0
+    blob, rows = encode(nodes, files, offset)
+    text_bytes = append_data(cache_path, PARTIAL_TEXT, np.frombuffer(blob, dtype=np.uint8), serializer='raw')
+    rows_bytes = append_data(cache_path, PARTIAL_ROWS, rows, serializer='raw')
+    return text_bytes, rows_bytes
+
+def commit(cache_path: str, files: List[str]) -> int:
+    # turns the partial files into the store, returns the chunk count
+    rows = np.fromfile(os.path.join(cache_path, PARTIAL_ROWS), dtype=np.int64).reshape(-1, 5)
+    columns_tmp = os.path.join(cache_path, f"{CHUNKS_FILE}.tmp")
+    with open(columns_tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(rows.T))
+    save_data(cache_path, CHUNK_META_FILE, {"format": FORMAT_VERSION, "count": len(rows), "files": files},
+              serializer='json', verbose=False)
+    os.replace(os.path.join(cache_path, PARTIAL_TEXT), os.path.join(cache_path, CHUNK_TEXT_FILE))
+    os.replace(columns_tmp, os.path.join(cache_path, CHUNKS_FILE))
+    for file_name in (PARTIAL_ROWS, LEGACY_CHUNKS_FILE):
+        full_path = os.path.join(cache_path, file_name)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+    return len(rows)
+
+def clear_partial(cache_path: str):
+    for file_name in (PARTIAL_TEXT, PARTIAL_ROWS):
+        full_path = os.path.join(cache_path, file_name)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+def write_store(cache_path: str, nodes: Sequence[Any]) -> int:
+    # writes a whole store at once
+    os.makedirs(cache_path, exist_ok=True)
+    clear_partial(cache_path)
+    files: List[str] = []
+    append_batch(cache_path, nodes, files)
+    return commit(cache_path, files)
+
+def migrate(cache_path: str) -> bool:
+    # converts a cache's chunks.pkl into a chunk store, True when it did
+    with _migrate_lock:
+        if os.path.exists(os.path.join(cache_path, CHUNKS_FILE)) or not os.path.exists(os.path.join(cache_path, LEGACY_CHUNKS_FILE)):
+            return False
+        nodes = load_data(cache_path, LEGACY_CHUNKS_FILE, serializer='pickle_frames')
+        if not nodes:
+            return False
+        count = write_store(cache_path, nodes)
+    say(f"🗜️ Converted {LEGACY_CHUNKS_FILE} in {cache_path} to the chunk store ({count} chunks).")
+    return True
+
+def open_store(cache_path: str) -> ChunkStore:
+    # the cache's chunk store, converting a chunks.pkl first if needed
+    migrate(cache_path)
+    if not os.path.exists(os.path.join(cache_path, CHUNKS_FILE)):
+        raise FileNotFoundError(f"Cache file not found: {os.path.join(cache_path, CHUNKS_FILE)}")
+    return ChunkStore(cache_path)
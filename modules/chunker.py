@@ -1,55 +1,205 @@
+"""
+Splits cleaned pages into chunks of at most CHUNK_SIZE tokens, counted with
+the embedding model's tokenizer.
+"""
+import multiprocessing
 import os
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.schema import TextNode
-from typing import List, Dict, Any
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import List, Dict, Any, Iterable, Iterator, NamedTuple, Optional, Tuple
 from . import config
+from .models import FakeTokenizer, get_tokenizer
+from .telemetry import traced
 
-def get_text_nodes(processed_data: Dict[str, Any], file_name: str) -> List[TextNode]:
+CHUNKERS = ("native", "llama_index")
 
-    doc_context = processed_data.get("doc_context", "")
-    pages = processed_data.get("pages", [])
+_BOUNDARY_RE = re.compile(r"(?<=[.!?;])\s+|\n\s*\n\s*")
+_WORD_RE = re.compile(r"\S+")
 
-    if not pages and not doc_context:
-        print("⚠️ Warning: No text to chunk. Returning empty list.")
+# (page_number, page text) of pages with text, chunked together
+PageGroup = List[Tuple[Any, str]]
+# (page_number, chunk_number, text), chunk numbers start at 1 on every page
+Chunk = Tuple[Any, int, str]
+
+class ChunkNode(NamedTuple):
+    # a chunk as the pipeline passes it around before it is stored; reads
+    # like a TextNode (get_content, metadata), which only the chunk store builds
+    text: str
+    metadata: Dict[str, Any]
+
+    def get_content(self) -> str:
+        return self.text
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    # (start, end) of every sentence, trailing whitespace excluded
+    spans = []
+    start = 0
+    for boundary in _BOUNDARY_RE.finditer(text):
+        if boundary.start() > start:
+            spans.append((start, boundary.start()))
+        start = boundary.end()
+    end = len(text.rstrip())
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+def _token_counts(tokenizer: Any, texts: List[str]) -> List[int]:
+    # tokens of every text without special tokens, in one batched call
+    if not texts:
         return []
-    
-    splitter = SentenceSplitter(
-        chunk_size=config.CHUNK_SIZE,
-        chunk_overlap=config.CHUNK_OVERLAP,
-    )
-
-    nodes = []
-    
-    if doc_context.strip():
-        context_chunks = splitter.split_text(doc_context)
-        for i, chunk_text in enumerate(context_chunks):
-            node = TextNode(
-                text=chunk_text,
-                metadata={
-                    "file_name": os.path.basename(file_name),
-                    "page_number": "Document Header", 
-                    "chunk_number": i + 1
-                }
-            )
-            nodes.append(node)
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
 
+def _pack(units: List[Tuple[int, int, int]], budget: int, overlap: int) -> List[Tuple[int, int]]:
+    # greedy (start, end) chunk spans over (start, end, tokens) units; each
+    # chunk after the first repeats the previous one's last units up to
+    # overlap tokens, as long as the chunk can still take a new unit
+    spans = []
+    first = 0
+    while first < len(units):
+        used = units[first][2]
+        last = first + 1
+        while last < len(units) and used + units[last][2] <= budget:
+            used += units[last][2]
+            last += 1
+        spans.append((units[first][0], units[last - 1][1]))
+        if last == len(units):
+            break
+        carried = 0
+        following = last
+        while following - 1 > first and carried + units[following - 1][2] <= overlap:
+            following -= 1
+            carried += units[following][2]
+        while following < last and carried + units[last][2] > budget:
+            carried -= units[following][2]
+            following += 1
+        first = following
+    return spans
+
+def _chunk_group(group: PageGroup) -> List[Chunk]:
+    # the chunks of a group of pages; module-level so the worker processes can run it
+    tokenizer = get_tokenizer()
+    budget = config.CHUNK_SIZE - tokenizer.num_special_tokens_to_add()
+
+    page_spans = [_sentence_spans(text) for _, text in group]
+    counts = iter(_token_counts(tokenizer, [text[start:end] for (_, text), spans in zip(group, page_spans) for start, end in spans]))
+    page_units = [[(start, end, next(counts)) for start, end in spans] for spans in page_spans]
+
+    # sentences over the budget are replaced by their words, counted in a
+    # second batched call
+    word_spans = {}
+    for page, units in enumerate(page_units):
+        for index, (start, end, tokens) in enumerate(units):
+            if tokens > budget:
+                text = group[page][1]
+                word_spans[(page, index)] = [(start + word.start(), start + word.end()) for word in _WORD_RE.finditer(text[start:end])]
+    if word_spans:
+        word_counts = iter(_token_counts(tokenizer, [group[page][1][start:end] for (page, _), spans in word_spans.items() for start, end in spans]))
+        words = {key: [(start, end, next(word_counts)) for start, end in spans] for key, spans in word_spans.items()}
+        page_units = [
+            [part for index, unit in enumerate(units) for part in words.get((page, index), [unit])]
+            for page, units in enumerate(page_units)
+        ]
+
+    chunks = []
+    for (page_number, text), units in zip(group, page_units):
+        for number, (start, end) in enumerate(_pack(units, budget, config.CHUNK_OVERLAP), start=1):
+            chunks.append((page_number, number, text[start:end]))
+    return chunks
+
+def _page_groups(pages: Iterable[Dict[str, Any]], size: int) -> Iterator[PageGroup]:
+    group: PageGroup = []
     for page in pages:
-        page_num = page.get("page_number")
         page_text = page.get("text", "")
-        
         if not page_text.strip():
             continue
-            
-        page_chunks = splitter.split_text(page_text)
-        for i, chunk_text in enumerate(page_chunks):
-            node = TextNode(
-                text=chunk_text,
-                metadata={
-                    "file_name": os.path.basename(file_name),
-                    "page_number": page_num,
-                    "chunk_number": i + 1
-                }
-            )
-            nodes.append(node)
-    
-    return nodes
+        group.append((page.get("page_number"), page_text))
+        if len(group) >= size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+def _init_worker(model_name: str, fake: bool, chunk_size: int, chunk_overlap: int):
+    # runs once in every spawned worker: the parent's tokenizer and chunk sizes
+    from . import models
+    if fake:
+        models.use_fake_models()
+    config.EMBED_MODEL = model_name
+    config.CHUNK_SIZE = chunk_size
+    config.CHUNK_OVERLAP = chunk_overlap
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = config.CHUNKER_WORKERS
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def _iter_chunks(pages: Iterable[Dict[str, Any]], workers: int) -> Iterator[Chunk]:
+    if config.CHUNKER not in CHUNKERS:
+        raise ValueError(f"Unknown chunker: {config.CHUNKER}. Choose from {CHUNKERS}.")
+    groups = _page_groups(pages, config.CHUNKER_GROUP_PAGES)
+
+    if config.CHUNKER == "llama_index":
+        from llama_index.core.node_parser import SentenceSplitter
+        splitter = SentenceSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP,
+        )
+        for group in groups:
+            for page_num, page_text in group:
+                for i, chunk_text in enumerate(splitter.split_text(page_text)):
+                    yield page_num, i + 1, chunk_text
+        return
+
+    head = list(islice(groups, 2)) if workers > 1 else []
+    if len(head) < 2:
+        # one worker, or a single group that isn't worth a pool
+        for group in chain(head, groups):
+            yield from _chunk_group(group)
+        return
+
+    # spawned workers load the same tokenizer themselves (forking could copy
+    # a lock held by another thread of this process), with its own thread
+    # pool off so it doesn't compete with them
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    fake = isinstance(get_tokenizer(), FakeTokenizer)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+                             initargs=(config.EMBED_MODEL, fake, config.CHUNK_SIZE, config.CHUNK_OVERLAP)) as pool:
+        # a bounded number of groups in flight keeps memory flat and the chunks in order
+        pending = deque()
+        for group in chain(head, groups):
+            pending.append(pool.submit(_chunk_group, group))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_text_nodes(pages: Iterable[Dict[str, Any]], file_name: str, workers: Optional[int] = None) -> Iterator[ChunkNode]:
+    # chunks pages as they arrive, CHUNKER_GROUP_PAGES at a time; the document
+    # context is passed as a page numbered "Document Header"
+    # workers defaults to CHUNKER_WORKERS (0 = one per CPU core)
+
+    base_name = os.path.basename(file_name)
+    for page_num, chunk_number, chunk_text in _iter_chunks(pages, _resolve_workers(workers)):
+        yield ChunkNode(
+            text=chunk_text,
+            metadata={
+                "file_name": base_name,
+                "page_number": page_num,
+                "chunk_number": chunk_number
+            }
+        )
+
+@traced("chunk")
+def get_text_nodes(processed_data: Dict[str, Any], file_name: str, workers: Optional[int] = None) -> List[ChunkNode]:
+
+    doc_context = processed_data.get("doc_context", "")
+    pages = processed_data.get("pages", [])
+
+    if not pages and not doc_context:
+        print("⚠️ Warning: No text to chunk. Returning empty list.")
+        return []
+
+    header_page = {"page_number": "Document Header", "text": doc_context}
+    return list(iter_text_nodes([header_page] + pages, file_name, workers))
@@ -1,6 +1,16 @@
+import os
+
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
+# chunker: "native" (sentences packed by the embedding tokenizer's counts) or
+# "llama_index" (SentenceSplitter); pages are chunked CHUNKER_GROUP_PAGES at a
+# time, spread over CHUNKER_WORKERS processes (0 = one per CPU core) when > 1
+# (native only)
+CHUNKER = "llama_index"
+CHUNKER_WORKERS = 1
+CHUNKER_GROUP_PAGES = 16
+
 EMBED_MODEL = "BAAI/bge-large-en-v1.5"
 
 RERANKER_MODEL = "BAAI/bge-reranker-large"
@@ -9,4 +19,150 @@ TOP_K_INITIAL = 15
 TOP_K_FINAL = 3
 
 # pdf path removed, provided dynamically by user
-CACHED_DIR = "cached_files"
\ No newline at end of file
+CACHED_DIR = "cached_files"
+
+# loaded indexes kept resident between queries, and chunk stores opened
+# without their index (for hits from the corpus index)
+INDEX_CACHE_SIZE = 4
+CHUNK_STORE_CACHE_SIZE = 64
+INDEX_MMAP = True
+
+# load the embedding and reranker models in the background at startup
+WARMUP_MODELS = True
+
+# LLM backend: "ollama" (REST API, pooled), "subprocess" (`ollama run`) or "fake" (offline)
+LLM_BACKEND = "ollama"
+LLM_MODEL = "llama3.1"
+OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_KEEP_ALIVE = "30m"
+LLM_TIMEOUT = 300
+LLM_RETRIES = 2
+LLM_POOL_SIZE = 4
+# retry through `ollama run` when the REST API cannot be reached
+LLM_SUBPROCESS_FALLBACK = True
+
+# prompt context: chunks of a page are merged into one cited passage and the
+# passages trimmed to CONTEXT_TOKEN_BUDGET (estimated tokens); a passage that
+# doesn't fit is cut at a sentence boundary if CONTEXT_MIN_PASSAGE_TOKENS fit
+CONTEXT_TOKEN_BUDGET = 2048
+CONTEXT_MIN_PASSAGE_TOKENS = 64
+
+# print the answer token by token, and stop generating once the decision
+# (and clarifying questions, if any) are complete
+STREAM_ANSWERS = True
+STREAM_STOP_EARLY = True
+
+# page extraction/cleaning process pool (0 = one per CPU core), used for
+# documents with at least PARALLEL_MIN_PAGES pages
+LOADER_WORKERS = 0
+PARALLEL_MIN_PAGES = 64
+
+# chunks embedded and appended to the index per batch while building
+EMBED_BATCH_SIZE = 256
+
+# background indexer (modules/indexer.py): PDFs dropped into INDEXER_WATCH_DIR
+# are indexed by INDEXER_WORKERS threads, polled every INDEXER_POLL_SECONDS;
+# a build in progress can be searched once INDEXER_SNAPSHOT_MIN_CHUNKS chunks
+# are in, its partial index refreshed each time the count doubles. The chat
+# starts the watcher itself when INDEXER_AUTOSTART is on (it is off, so
+# nothing is indexed unless asked with `watch` / `serve --watch`) and the
+# folder exists
+INDEXER_WATCH_DIR = "input"
+INDEXER_WORKERS = 1
+INDEXER_POLL_SECONDS = 2.0
+INDEXER_SNAPSHOT_MIN_CHUNKS = 256
+INDEXER_AUTOSTART = False
+
+# embedding engine (modules/embed_engine.py): texts are sorted by token count
+# and encoded in batches of at most EMBED_TOKEN_BUDGET padded tokens and
+# EMBED_MAX_BATCH texts; with EMBED_WORKERS > 1 (0 = one per CPU core), jobs of
+# at least EMBED_PARALLEL_MIN_TEXTS texts are spread over that many model
+# replicas (one model copy in memory each), running EMBED_THREADS_PER_WORKER
+# torch threads each (0 = cores / workers)
+# the real model's vectors depend in the last bits on which texts share a
+# batch, so they are not bit-for-bit those of a single model.encode call;
+# EMBED_BITWISE_PARITY encodes that way instead (in process, default batching)
+# when vectors must match caches built before the engine exactly
+EMBED_TOKEN_BUDGET = 16384
+EMBED_MAX_BATCH = 128
+EMBED_WORKERS = 1
+EMBED_THREADS_PER_WORKER = 0
+EMBED_PARALLEL_MIN_TEXTS = 64
+EMBED_BITWISE_PARITY = False
+
+# embeddings shared across documents, keyed by chunk text + model
+EMBEDDING_STORE_ENABLED = True
+EMBEDDING_STORE_PATH = os.path.join(CACHED_DIR, "embeddings.sqlite")
+
+# shared index over every indexed document; it turns approximate (IVF) above
+# CORPUS_FLAT_MAX_CHUNKS chunks. Added documents are appended to a delta that
+# is folded into the base index once it holds CORPUS_DELTA_RATIO of its chunks
+CORPUS_DIR = os.path.join(CACHED_DIR, "_corpus")
+CORPUS_FLAT_MAX_CHUNKS = 20_000
+CORPUS_DELTA_RATIO = 0.25
+
+# vector index: "flat" (exact), "hnsw", "ivf_sq", "ivf_pq" or "auto" (by chunk count)
+INDEX_TYPE = "auto"
+FLAT_MAX_CHUNKS = 50_000
+IVF_PQ_MIN_CHUNKS = 1_000_000
+ANN_TRAIN_SAMPLE = 100_000
+IVF_NPROBE = 16
+HNSW_M = 32
+HNSW_EF_SEARCH = 128
+PQ_M = 64
+# approximate indexes fetch TOP_K_INITIAL * RESCORE_FACTOR candidates and
+# re-score them exactly against the stored float32 vectors
+RESCORE_FACTOR = 4
+
+# retrieval: "dense" (vector search only) or "hybrid" (vector and BM25 hits
+# merged by reciprocal rank fusion with constant RRF_K); hybrid hands the best
+# HYBRID_CANDIDATES fused chunks to the reranker instead of TOP_K_INITIAL. With
+# LEXICAL_FAST_PATH, a query whose top TOP_K_FINAL BM25 hits each match at
+# least LEXICAL_DECISIVE_COVERAGE of its term weight skips the query encoding
+# and vector search. Hybrid applies to single documents and selections; the
+# whole corpus is searched dense
+RETRIEVAL_MODE = "dense"
+HYBRID_CANDIDATES = 10
+RRF_K = 60
+LEXICAL_FAST_PATH = False
+LEXICAL_DECISIVE_COVERAGE = 0.9
+
+# reranker: scores are cached per (normalized query, chunk, model), which
+# only helps when the same question is asked again; adaptive mode scores
+# candidates in small batches and stops once the rest trail the top
+# TOP_K_FINAL by RERANK_MARGIN in bi-encoder similarity. That cut-off is a
+# heuristic that can change the top TOP_K_FINAL, so it is off by default
+RERANK_CACHE_SIZE = 4096
+RERANK_ADAPTIVE = False
+RERANK_BATCH_SIZE = 4
+RERANK_MARGIN = 0.15
+
+# answers are reused for the same question, or a rephrasing at least this
+# similar that retrieves the same chunks; caches reset when an index is rebuilt
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+
+# batch mode: questions per embed/rerank chunk, pairs per cross-encoder call
+# and concurrent LLM generations
+BATCH_CHUNK_SIZE = 128
+RERANK_MAX_BATCH_SIZE = 128
+BATCH_LLM_CONCURRENCY = 4
+
+# HTTP service: requests within SERVICE_BATCH_WAIT_MS share one encode /
+# rerank call; beyond SERVICE_MAX_PENDING in-flight requests new ones get a 503
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_BATCH_WAIT_MS = 5
+SERVICE_MAX_BATCH = 64
+SERVICE_MAX_PENDING = 256
+SERVICE_REQUEST_TIMEOUT = 120
+SERVICE_LLM_CONCURRENCY = 4
+
+# telemetry (modules/telemetry.py): spans as JSON lines and Prometheus-style
+# metrics; off by default. VERBOSE controls the human-readable progress lines
+TELEMETRY_ENABLED = False
+TELEMETRY_LOG_PATH = os.path.join(CACHED_DIR, "telemetry.jsonl")
+METRICS_PATH = os.path.join(CACHED_DIR, "metrics.prom")
+VERBOSE = True
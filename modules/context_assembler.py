@@ -0,0 +1,111 @@
+"""
+Turns the selected chunks into the CONTEXT section of a prompt: one cited
+passage per page, trimmed to CONTEXT_TOKEN_BUDGET.
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from . import config
+from .chunk_store import HEADER_PAGE
+
+ELLIPSIS = " […] "
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+# leading text of a chunk looked up in its predecessor to find the overlap
+_PROBE_CHARS = 32
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+def citation(metadata: Dict[str, Any]) -> str:
+    page = metadata.get("page_number")
+    where = "document header" if page == HEADER_PAGE else f"page {page}"
+    return f"[{metadata.get('file_name', 'document')}, {where}]"
+
+def stitch(first: str, second: str) -> Optional[str]:
+    # first + second without the text second repeats from the end of first,
+    # None when second doesn't start with a tail of first
+    probe = second[:_PROBE_CHARS]
+    start = first.find(probe)
+    while start != -1:
+        tail = first[start:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        start = first.find(probe, start + 1)
+    return None
+
+def _merge_page(chunks: List[Tuple[int, str]]) -> str:
+    # one page's (chunk_number, text) pairs, in chunk order, as one passage
+    parts: List[str] = []
+    previous = None
+    for number, text in sorted(chunks):
+        text = text.strip()
+        if any(text in part for part in parts):
+            continue
+        if parts and previous == number - 1:
+            stitched = stitch(parts[-1], text)
+            parts[-1] = stitched if stitched is not None else f"{parts[-1]} {text}"
+        else:
+            parts.append(text)
+        previous = number
+    return ELLIPSIS.join(parts)
+
+def _trim(text: str, budget: int) -> str:
+    # the longest run of whole sentences within budget
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(text):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    if not kept:
+        # not even one sentence fits, cut mid-sentence
+        return " ".join(text.split()[:max(budget, 0)])
+    return " ".join(kept)
+
+def assemble_passages(nodes: Sequence[Any], token_budget: Optional[int] = None) -> List[Tuple[str, str]]:
+    # (citation, text) passages for the nodes, best first, within the budget
+    token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+
+    pages: Dict[Tuple[str, Any], List[Tuple[int, str]]] = {}
+    headers: Dict[Tuple[str, Any], str] = {}
+    for node in nodes:
+        key = (node.metadata.get("file_name"), node.metadata.get("page_number"))
+        if key not in pages:
+            pages[key] = []
+            headers[key] = citation(node.metadata)
+        pages[key].append((node.metadata.get("chunk_number", 0), node.get_content()))
+
+    passages = []
+    seen = set()
+    used = 0
+    # (rank, citation, text) of the best passage that didn't fit whole
+    overflow = None
+    for key, chunks in pages.items():
+        text = _merge_page(chunks)
+        # the same clause printed on two pages (or in two documents) once
+        if text in seen:
+            continue
+        seen.add(text)
+        tokens = estimate_tokens(headers[key]) + estimate_tokens(text)
+        if used + tokens > token_budget:
+            # shorter passages further down may still fit
+            if overflow is None:
+                overflow = (len(passages), headers[key], text)
+            continue
+        passages.append((headers[key], text))
+        used += tokens
+
+    # what budget is left goes to the trimmed overflow, at its rank
+    if overflow is not None:
+        rank, header, text = overflow
+        remaining = token_budget - used - estimate_tokens(header)
+        if remaining >= config.CONTEXT_MIN_PASSAGE_TOKENS or not passages:
+            text = _trim(text, remaining)
+            if text:
+                passages.insert(rank, (header, text))
+    return passages
+
+def assemble_context(nodes: Sequence[Any], token_budget: Optional[int] = None) -> str:
+    return "\n\n---\n\n".join(f"{header}\n{text}" for header, text in assemble_passages(nodes, token_budget))
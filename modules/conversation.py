@@ -0,0 +1,106 @@
+"""
+State of one clarification loop, so answering the LLM's clarifying
+questions doesn't re-run the whole pipeline.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+from . import config
+from .reranker import chunk_id, score_candidates
+from .retriever import embed_query, hit_nodes, lexical_fast_path, search_candidates
+from .telemetry import say, traced
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import TextNode
+
+class ConversationState:
+    def __init__(self, target: Union[str, Sequence[str], None], query: str):
+        self.target = target
+        self.query = query
+        self.details: List[str] = []
+        # (cache_path, position) -> {"node", "score", "query" it was scored for}
+        self.pool: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.llm_context: Optional[List[int]] = None
+        # chunks the LLM has already seen in this exchange
+        self.sent_chunks: Set[str] = set()
+
+    def add_details(self, details: str):
+        self.details.append(details)
+        self.query = f"{self.query} [User has provided new information: {details}]"
+
+    def _merge(self, query: str, hits: List[Tuple[float, str, int]], stats: Optional[Dict[str, Any]]) -> int:
+        # reranks against query the hits that have no score for it yet, and
+        # the chunks that were the best for the previous wording; returns how
+        # many hits were new to the pool
+        new_hits = [hit for hit in hits if (hit[1], hit[2]) not in self.pool]
+        kept = [key for key, _ in sorted(((key, entry) for key, entry in self.pool.items() if entry["query"] != query),
+                                          key=lambda item: item[1]["score"], reverse=True)[:config.TOP_K_FINAL]]
+        totals = {"rerank_time": 0.0, "pairs_scored": 0, "pairs_cached": 0, "pairs_skipped": 0}
+
+        # the kept chunks are all re-scored; the new ones can be pruned by
+        # their bi-encoder scores
+        kept_nodes = [self.pool[key]["node"] for key in kept]
+        new_keys = [(path, position) for _, path, position in new_hits]
+        for keys, nodes, bi_scores in ((kept, kept_nodes, None),
+                                       (new_keys, hit_nodes(new_hits), [score for score, _, _ in new_hits])):
+            if not keys:
+                continue
+            part: Dict[str, Any] = {}
+            scores = score_candidates(query, nodes, config.TOP_K_FINAL, bi_scores=bi_scores, stats=part)
+            for name in totals:
+                totals[name] += part[name]
+            for i, score in scores.items():
+                self.pool[keys[i]] = {"node": nodes[i], "score": score, "query": query}
+        if stats is not None:
+            stats.update(totals)
+        return sum(key in self.pool for key in new_keys)
+
+    def top_nodes(self) -> List["TextNode"]:
+        current = [entry for entry in self.pool.values() if entry["query"] == self.query]
+        ranked = sorted(current, key=lambda entry: entry["score"], reverse=True)
+        return [entry["node"] for entry in ranked[:config.TOP_K_FINAL]]
+
+    @traced("retrieve")
+    def retrieve(self, query_embedding: Optional[Any] = None, stats: Optional[Dict[str, Any]] = None) -> Optional[List["TextNode"]]:
+        # final chunks for the current turn: a full retrieval on the first
+        # turn, only the delta surfaced by the latest details afterwards
+        # stats receives the reranker timings plus the new and pooled counts
+
+        stats = {} if stats is None else stats
+        first_turn = not self.pool
+        if first_turn:
+            say("\n🔍 Retrieving context for query...\n")
+            search_text = self.query
+        else:
+            say("\n🔍 Retrieving context for the new details...\n")
+            search_text = self.details[-1]
+            query_embedding = None
+
+        try:
+            hits = lexical_fast_path(search_text, self.target) if query_embedding is None else None
+            if hits is None:
+                if query_embedding is None:
+                    query_embedding = embed_query(search_text)
+                hits = search_candidates(query_embedding, self.target, query=search_text)
+            added = self._merge(self.query, hits, stats)
+        except FileNotFoundError:
+            print("❌ Error: Index or chunks file not found. Please build the index first.")
+            return None
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            return None
+        if not self.pool:
+            return None
+
+        stats["new_candidates"] = added
+        stats["pool_size"] = len(self.pool)
+        say(f"✅ Re-ranked {stats['pairs_scored']} candidates ({stats['rerank_time']:.2f}s, "
+            f"{stats['pairs_cached']} cached, {stats['pairs_skipped']} skipped), "
+            f"{len(self.pool)} in the pool.\n")
+        return self.top_nodes()
+
+    def remember(self, nodes: Sequence["TextNode"], llm_context: Optional[List[int]], continued: bool):
+        # records what the LLM saw this turn; without a handle the next turn
+        # falls back to the full prompt
+        if not continued:
+            self.sent_chunks = set()
+        self.sent_chunks.update(chunk_id(node) for node in nodes)
+        self.llm_context = llm_context or None
@@ -0,0 +1,339 @@
+"""
+Corpus index: every indexed document in one FAISS index, under ids
+(doc_id << 32) | position of the chunk in the document.
+"""
+import os
+import threading
+import faiss
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from . import config
+from .embedder import configure_search, create_faiss_index, is_exact, resolve_index_type
+from .index_registry import get_index, get_vectors
+from .persistence import append_data, save_data, load_data
+from .telemetry import say
+
+# on disk: a base index, rewritten only now and then, plus append-only delta
+# files with the chunks added since; the manifest names the generation of
+# both and is written last, so it always points at complete files
+CORPUS_INDEX = "corpus.index"
+MANIFEST = "manifest.json"
+DOC_SHIFT = 32
+
+class _SharedLock:
+    # any number of searches at once, or one change to the loaded indexes
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._changed:
+            while self._writing:
+                self._changed.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._readers -= 1
+                if not self._readers:
+                    self._changed.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._changed:
+            while self._writing or self._readers:
+                self._changed.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._writing = False
+                self._changed.notify_all()
+
+# _lock serializes loads and changes; _searches keeps a search from seeing an
+# index while a change is made to it in place
+_lock = threading.RLock()
+_searches = _SharedLock()
+# (signature of the manifest on disk, base index, delta index, manifest)
+_loaded: Optional[Tuple[tuple, Any, Any, Dict[str, Any]]] = None
+
+def make_id(doc_id: int, position: int) -> int:
+    return (doc_id << DOC_SHIFT) | position
+
+def split_id(vector_id: int) -> Tuple[int, int]:
+    return vector_id >> DOC_SHIFT, vector_id & ((1 << DOC_SHIFT) - 1)
+
+def _base_file(generation: int) -> str:
+    # generation 0 is the single index file of corpora written before deltas
+    return f"corpus.{generation}.index" if generation else CORPUS_INDEX
+
+def _delta_files(generation: int) -> Tuple[str, str]:
+    return f"corpus.{generation}.delta.vectors", f"corpus.{generation}.delta.ids"
+
+def _signature() -> tuple:
+    full_path = os.path.join(config.CORPUS_DIR, MANIFEST)
+    if not os.path.exists(full_path):
+        return ()
+    stat = os.stat(full_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _new_flat(dimension: int) -> Any:
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+def _load_delta(manifest: Dict[str, Any]) -> Optional[Any]:
+    # the chunks added since the base index was written; only the first
+    # delta_chunks rows were committed by a manifest, and the chunks of
+    # documents removed since are dropped
+    count = manifest.get("delta_chunks", 0)
+    if not count:
+        return None
+    dimension = manifest["dimension"]
+    vectors_file, ids_file = _delta_files(manifest.get("generation", 0))
+    vectors = np.fromfile(os.path.join(config.CORPUS_DIR, vectors_file), dtype='float32', count=count * dimension)
+    ids = np.fromfile(os.path.join(config.CORPUS_DIR, ids_file), dtype='int64', count=count)
+    keep = np.isin(ids >> DOC_SHIFT, [int(doc_id) for doc_id in manifest["documents"]])
+    delta = _new_flat(dimension)
+    delta.add_with_ids(np.ascontiguousarray(vectors.reshape(count, dimension)[keep]), ids[keep])
+    return delta
+
+def _load() -> Tuple[Optional[Any], Optional[Any], Dict[str, Any]]:
+    # current corpus (base index, delta index, manifest), reloaded when the
+    # manifest changed on disk
+    global _loaded
+    with _lock:
+        signature = _signature()
+        if _loaded is not None and _loaded[0] == signature:
+            return _loaded[1], _loaded[2], _loaded[3]
+
+        base, delta, manifest = None, None, {"next_doc_id": 1, "documents": {}}
+        if signature:
+            manifest = load_data(config.CORPUS_DIR, MANIFEST, serializer='json') or manifest
+            base_file = _base_file(manifest.get("generation", 0))
+            if os.path.exists(os.path.join(config.CORPUS_DIR, base_file)):
+                base = load_data(config.CORPUS_DIR, base_file, serializer='faiss')
+            if base is not None:
+                for doc_id in manifest.get("removed", []):
+                    _remove_ids(base, doc_id)
+                configure_search(base)
+            delta = _load_delta(manifest)
+        _loaded = (signature, base, delta, manifest)
+        return base, delta, manifest
+
+def _commit(manifest: Dict[str, Any]):
+    # writes the manifest once the files it points at are complete
+    global _loaded
+    save_data(config.CORPUS_DIR, MANIFEST, manifest, serializer='json', verbose=False)
+    _loaded = (_signature(), _loaded[1], _loaded[2], manifest)
+
+def _index_version(cache_path: str) -> List[int]:
+    # changes whenever the document's index is rebuilt in place
+    stat = os.stat(os.path.join(cache_path, "faiss.index"))
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _remove_ids(index: Any, doc_id: int) -> int:
+    if index is None:
+        return 0
+    return index.remove_ids(faiss.IDSelectorRange(make_id(doc_id, 0), make_id(doc_id + 1, 0)))
+
+def _remove(base: Any, delta: Any, manifest: Dict[str, Any], doc_id: int):
+    # the base on disk keeps the document's chunks until it is rewritten, so
+    # they are removed again whenever it is loaded
+    _remove_ids(base, doc_id)
+    _remove_ids(delta, doc_id)
+    manifest["documents"].pop(str(doc_id), None)
+    if base is not None:
+        manifest["removed"].append(doc_id)
+
+def _editable(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    # a copy of the loaded manifest to change; searches keep reading the old one
+    return {**manifest, "documents": dict(manifest["documents"]), "removed": list(manifest.get("removed", []))}
+
+def _append_delta(manifest: Dict[str, Any], vectors: np.ndarray, ids: np.ndarray):
+    # appends a document's chunks to the delta files; rows past delta_chunks
+    # were left by an add that never committed and are cut off first
+    count = manifest.get("delta_chunks", 0)
+    for file_name, rows, row_bytes in zip(_delta_files(manifest.get("generation", 0)), (vectors, ids),
+                                          (manifest["dimension"] * 4, 8)):
+        full_path = os.path.join(config.CORPUS_DIR, file_name)
+        if os.path.exists(full_path) and os.path.getsize(full_path) > count * row_bytes:
+            os.truncate(full_path, count * row_bytes)
+        append_data(config.CORPUS_DIR, file_name, rows, serializer='raw')
+    manifest["delta_chunks"] = count + len(ids)
+
+def _compact(index: Any) -> Any:
+    # rebuilds an exact corpus that outgrew CORPUS_FLAT_MAX_CHUNKS as an IVF
+    # index; every query over all documents scans it, so this comes earlier
+    # than for a single document's index
+    if not is_exact(index) or index.ntotal < config.CORPUS_FLAT_MAX_CHUNKS:
+        return index
+    index_type = resolve_index_type(index.ntotal)
+    if index_type == "flat":
+        if config.INDEX_TYPE != "auto":
+            return index
+        index_type = "ivf_sq"
+    if index_type == "hnsw":
+        index_type = "ivf_sq"
+    vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+    ids = faiss.vector_to_array(index.id_map)
+    compacted = create_faiss_index(vectors, index_type=index_type, ids=ids)
+    configure_search(compacted)
+    say(f"🧭 Rebuilt the corpus as a {type(compacted).__name__} index ({compacted.ntotal} vectors).")
+    return compacted
+
+def _fold(base: Any, delta: Any, manifest: Dict[str, Any]):
+    # writes base + delta out as the next generation's base index; done only
+    # once the delta outgrew CORPUS_DELTA_RATIO of the base, so on average an
+    # add costs in proportion to its own chunks
+    global _loaded
+    vectors = faiss.downcast_index(delta.index).reconstruct_n(0, delta.ntotal)
+    ids = faiss.vector_to_array(delta.id_map)
+    with _searches.exclusive():
+        if base is None:
+            base = _new_flat(delta.d)
+        base.add_with_ids(vectors, ids)
+        _loaded = (_loaded[0], base, None, manifest)
+    compacted = _compact(base)
+    if compacted is not base:
+        with _searches.exclusive():
+            _loaded = (_loaded[0], compacted, None, manifest)
+
+    generation = manifest.get("generation", 0)
+    save_data(config.CORPUS_DIR, _base_file(generation + 1), compacted, serializer='faiss', verbose=False)
+    manifest = _editable(manifest)
+    manifest.update(generation=generation + 1, removed=[], delta_chunks=0)
+    _commit(manifest)
+    for file_name in (_base_file(generation),) + _delta_files(generation):
+        full_path = os.path.join(config.CORPUS_DIR, file_name)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+def add_document(cache_path: str, name: str, source_path: Optional[str] = None) -> int:
+    # registers a built document and returns its doc id, replacing a stale
+    # registration of the same cache or of the same source file; documents
+    # that only share its name are left alone
+    global _loaded
+    with _lock:
+        base, delta, manifest = _load()
+        version = _index_version(cache_path)
+        for doc_id, entry in list(manifest["documents"].items()):
+            if entry["cache_path"] == cache_path and entry.get("version") == version:
+                return int(doc_id)
+
+        doc_index, _ = get_index(cache_path)
+        if doc_index is None:
+            raise ValueError(f"No index found in {cache_path}")
+        stale = [int(doc_id) for doc_id, entry in manifest["documents"].items()
+                 if entry["cache_path"] == cache_path
+                 or (source_path is not None and entry.get("source_path") == source_path)]
+        manifest = _editable(manifest)
+        manifest.setdefault("dimension", doc_index.d)
+        doc_id = manifest["next_doc_id"]
+        manifest["next_doc_id"] = doc_id + 1
+
+        vectors = get_vectors(cache_path, doc_index.d)
+        if vectors is None:
+            vectors = doc_index.reconstruct_n(0, doc_index.ntotal)
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        ids = make_id(doc_id, 0) + np.arange(doc_index.ntotal, dtype='int64')
+        _append_delta(manifest, vectors, ids)
+        manifest["documents"][str(doc_id)] = {
+            "name": name,
+            "cache_path": cache_path,
+            "source_path": source_path,
+            "chunks": int(doc_index.ntotal),
+            "version": version,
+        }
+
+        if delta is None:
+            delta = _new_flat(doc_index.d)
+        with _searches.exclusive():
+            delta.add_with_ids(vectors, ids)
+            for stale_id in stale:
+                _remove(base, delta, manifest, stale_id)
+            _loaded = (_loaded[0], base, delta, manifest)
+        if delta.ntotal > config.CORPUS_DELTA_RATIO * (base.ntotal if base is not None else 0):
+            _fold(base, delta, manifest)
+        else:
+            _commit(manifest)
+    say(f"📚 Added '{name}' to the corpus ({doc_index.ntotal} chunks, {len(manifest['documents'])} documents).")
+    return doc_id
+
+def remove_document(doc_id: int) -> bool:
+    global _loaded
+    with _lock:
+        base, delta, manifest = _load()
+        if str(doc_id) not in manifest["documents"]:
+            return False
+        manifest = _editable(manifest)
+        with _searches.exclusive():
+            _remove(base, delta, manifest, doc_id)
+            _loaded = (_loaded[0], base, delta, manifest)
+        _commit(manifest)
+    return True
+
+def list_documents() -> Dict[int, Dict[str, Any]]:
+    _, _, manifest = _load()
+    return {int(doc_id): entry for doc_id, entry in manifest["documents"].items()}
+
+def _selector(doc_ids: Sequence[int], manifest: Dict[str, Any]) -> Any:
+    # only lets the given documents' ids through
+    if len(doc_ids) == 1:
+        return faiss.IDSelectorRange(make_id(doc_ids[0], 0), make_id(doc_ids[0] + 1, 0))
+    ids = np.concatenate([make_id(doc_id, 0) + np.arange(manifest["documents"][str(doc_id)]["chunks"], dtype='int64')
+                          for doc_id in doc_ids])
+    return faiss.IDSelectorBatch(ids)
+
+def _search_params(index: Any, selector: Any) -> Any:
+    # the selector has to outlive the search
+    if selector is None:
+        return None
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=config.IVF_NPROBE)
+    return faiss.SearchParameters(sel=selector)
+
+def search(query_embedding: np.ndarray, k: int, cache_paths: Optional[Sequence[str]] = None) -> Optional[List[Tuple[float, str, int]]]:
+    # top-k over the whole corpus, or over the documents of cache_paths, as
+    # (score, cache_path, position) hits; an approximate corpus returns
+    # k * RESCORE_FACTOR hits for re-scoring
+    # None when a selected document isn't in the corpus at its current version
+    _load()
+    with _searches.shared():
+        _, base, delta, manifest = _loaded
+        indexes = [index for index in (base, delta) if index is not None and index.ntotal]
+        selector = None
+        if cache_paths is not None:
+            by_path = {entry["cache_path"]: (int(doc_id), entry.get("version")) for doc_id, entry in manifest["documents"].items()}
+            doc_ids = []
+            for cache_path in cache_paths:
+                doc_id, version = by_path.get(cache_path, (None, None))
+                if doc_id is None or version != _index_version(cache_path):
+                    return None
+                doc_ids.append(doc_id)
+            if not indexes:
+                return None
+            selector = _selector(doc_ids, manifest)
+        if not indexes:
+            return []
+
+        if base is not None and not is_exact(base):
+            k *= config.RESCORE_FACTOR
+        found = []
+        for index in indexes:
+            scores, ids = index.search(query_embedding, k, params=_search_params(index, selector))
+            found.extend(zip(scores[0], ids[0]))
+    found.sort(key=lambda hit: -hit[0])
+    hits = []
+    for score, vector_id in found:
+        if vector_id < 0:
+            continue
+        doc_id, position = split_id(int(vector_id))
+        entry = manifest["documents"].get(str(doc_id))
+        if entry is not None:
+            hits.append((float(score), entry["cache_path"], position))
+    return hits[:k]
@@ -0,0 +1,133 @@
+"""
+Embedding for index builds: length-sorted batches under a padded-token
+budget, spread over spawned worker processes for large jobs.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from . import config
+from .models import FakeEmbedder, get_embedder
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key: Optional[Tuple[Any, ...]] = None
+_pool_lock = threading.Lock()
+
+def token_lengths(model: Any, texts: Sequence[str]) -> np.ndarray:
+    # token count of every text as the model will see it (truncated to its
+    # max_seq_length), in one batched tokenizer call
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return np.array([len(text.split()) + 2 for text in texts], dtype=np.int64)
+    max_length = getattr(model, "max_seq_length", None) or 512
+    encoded = tokenizer(list(texts), truncation=True, max_length=max_length,
+                        return_attention_mask=False, return_token_type_ids=False)
+    return np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+
+def plan_batches(lengths: np.ndarray, token_budget: Optional[int] = None, max_batch: Optional[int] = None) -> List[np.ndarray]:
+    # input positions per batch, longest texts first; each batch holds as
+    # many texts as fit the padded-token budget at its longest text's length
+    token_budget = token_budget or config.EMBED_TOKEN_BUDGET
+    max_batch = max_batch or config.EMBED_MAX_BATCH
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        size = min(max_batch, max(1, token_budget // max(int(lengths[order[start]]), 1)))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(get_embedder().encode(texts, batch_size=len(texts), show_progress_bar=False), dtype='float32')
+
+def _init_worker(model_name: str, fake_dimension: Optional[int], threads: int):
+    # runs once in every worker: same model as the parent, bounded threads
+    from . import models
+    if fake_dimension:
+        models.use_fake_models(fake_dimension)
+    else:
+        config.EMBED_MODEL = model_name
+        import torch
+        torch.set_num_threads(threads)
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = config.EMBED_WORKERS
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def _threads_per_worker(workers: int) -> int:
+    return config.EMBED_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+
+def _get_pool(workers: int, model: Any) -> ProcessPoolExecutor:
+    # one pool per (model, workers, threads); a change of any of them
+    # replaces it
+    global _pool, _pool_key
+    fake_dimension = model.dimension if isinstance(model, FakeEmbedder) else None
+    threads = _threads_per_worker(workers)
+    key = (config.EMBED_MODEL, fake_dimension, workers, threads)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config.EMBED_MODEL, fake_dimension, threads),
+            )
+            _pool_key = key
+        return _pool
+
+def shutdown():
+    # stops the worker processes, if any were started
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+            _pool_key = None
+
+atexit.register(shutdown)
+
+def encode(texts: Sequence[str], workers: Optional[int] = None, stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    # raw (not yet normalized) float32 embeddings of texts, in input order
+    # workers overrides EMBED_WORKERS; stats receives batches, workers and time
+    model = get_embedder()
+    if not texts:
+        return np.asarray(model.encode([]), dtype='float32')
+    start = time.perf_counter()
+    if config.EMBED_BITWISE_PARITY:
+        embeddings = np.asarray(model.encode(list(texts), show_progress_bar=False), dtype='float32')
+        if stats is not None:
+            stats.update(batches=1, workers=1, seconds=time.perf_counter() - start)
+        return embeddings
+    lengths = token_lengths(model, texts)
+    batches = plan_batches(lengths)
+    workers = _resolve_workers(workers)
+    if len(texts) < config.EMBED_PARALLEL_MIN_TEXTS:
+        workers = 1
+
+    text_batches = [[texts[i] for i in batch] for batch in batches]
+    if workers > 1 and len(batches) > 1:
+        results = _get_pool(workers, model).map(_encode_batch, text_batches)
+    else:
+        results = map(_encode_batch, text_batches)
+
+    embeddings = None
+    for batch, vectors in zip(batches, results):
+        if embeddings is None:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype='float32')
+        embeddings[batch] = vectors
+
+    if stats is not None:
+        stats["batches"] = len(batches)
+        stats["workers"] = min(workers, len(batches))
+        stats["padded_tokens"] = int(sum(len(batch) * lengths[batch[0]] for batch in batches))
+        stats["tokens"] = int(lengths.sum())
+        stats["seconds"] = time.perf_counter() - start
+    return embeddings
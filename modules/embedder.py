@@ -1,30 +1,169 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
-from typing import List
-from llama_index.core.schema import TextNode
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from modules import config
+from modules import embed_engine
+from modules.embedding_store import get_store
+from modules.telemetry import count, say, span
 
-model = SentenceTransformer(config.EMBED_MODEL)
+if TYPE_CHECKING:
+    from modules.chunker import ChunkNode
 
-def embed_chunks(nodes: List[TextNode]) -> np.ndarray:
+def encode_texts(texts: List[str], stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    # L2-normalized float32 embeddings, ready for the inner-product index;
+    # stats accumulates the encoded count and time (see format_throughput)
+    with span("encode", texts=len(texts)) as current:
+        run: Dict[str, Any] = {}
+        embeddings = embed_engine.encode(texts, stats=run)
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        faiss.normalize_L2(embeddings)
+        current.set(batches=run.get("batches"), workers=run.get("workers"))
+    count("rag_chunks_embedded_total", len(texts))
+    if stats is not None and run:
+        stats["encoded"] = stats.get("encoded", 0) + len(texts)
+        stats["encode_seconds"] = stats.get("encode_seconds", 0.0) + run["seconds"]
+    return embeddings
+
+def embed_texts(texts: List[str], stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    # chunk embeddings through the shared embedding store: only texts that
+    # were never embedded with this model are encoded; stats collects hits/misses
+    if not config.EMBEDDING_STORE_ENABLED:
+        return encode_texts(texts, stats=stats)
+
+    store = get_store()
+    keys = [store.key(text, config.EMBED_MODEL) for text in texts]
+    with span("embedding_store_lookup", keys=len(keys)):
+        vectors = store.get_many(set(keys))
+
+    missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+    count("rag_cache_hits_total", len(keys) - len(missing), cache="embedding_store")
+    count("rag_cache_misses_total", len(missing), cache="embedding_store")
+    if missing:
+        encoded = encode_texts(list(missing.values()), stats=stats)
+        new_vectors = dict(zip(missing.keys(), encoded))
+        store.put_many(new_vectors)
+        vectors.update(new_vectors)
+
+    if stats is not None:
+        hits = sum(1 for key in keys if key not in missing)
+        stats["hits"] = stats.get("hits", 0) + hits
+        stats["misses"] = stats.get("misses", 0) + len(keys) - hits
+    return np.ascontiguousarray(np.stack([vectors[key] for key in keys]), dtype='float32')
+
+def format_store_stats(stats: Dict[str, Any]) -> str:
+    total = stats.get("hits", 0) + stats.get("misses", 0)
+    rate = stats.get("hits", 0) / total if total else 0.0
+    return f"{stats.get('hits', 0)}/{total} chunks served from the embedding store ({rate:.0%} hit rate)"
+
+def format_throughput(stats: Dict[str, Any]) -> str:
+    seconds = stats.get("encode_seconds", 0.0)
+    rate = stats.get("encoded", 0) / seconds if seconds else 0.0
+    return f"{stats.get('encoded', 0)} chunks encoded in {seconds:.1f}s ({rate:.0f} chunks/s)"
+
+def report_embedding_stats(stats: Dict[str, Any]):
+    # progress lines after a build: embedding store hit rate and throughput
+    if "hits" in stats:
+        say(f"♻️ {format_store_stats(stats)}.")
+    if stats.get("encoded"):
+        say(f"⚡ {format_throughput(stats)}.")
+
+def embed_chunks(nodes: List["ChunkNode"]) -> np.ndarray:
     if not nodes:
         print("⚠️ Warning: No nodes to embed. Returning empty array.")
         return np.array([])
     
     texts_to_embed = [node.get_content() for node in nodes]
-    print("\nGenerating embeddings...")
-    embeddings = model.encode(texts_to_embed, show_progress_bar=True)
-    faiss.normalize_L2(embeddings)
-    print("✅ Embeddings generated successfully.\n")
-    return embeddings.astype('float32')
+    say("\nGenerating embeddings...")
+    stats: Dict[str, Any] = {}
+    embeddings = embed_texts(texts_to_embed, stats=stats)
+    report_embedding_stats(stats)
+    say("✅ Embeddings generated successfully.\n")
+    return embeddings
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_sq", "ivf_pq")
 
-def create_faiss_index(embeddings: np.ndarray) -> faiss.Index:
+def resolve_index_type(num_vectors: int, index_type: Optional[str] = None) -> str:
+    # explicit type, or picked by chunk count when set to "auto"
+    index_type = index_type or config.INDEX_TYPE
+    if index_type == "auto":
+        if num_vectors < config.FLAT_MAX_CHUNKS:
+            return "flat"
+        if num_vectors < config.IVF_PQ_MIN_CHUNKS:
+            return "ivf_sq"
+        return "ivf_pq"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}. Choose from {INDEX_TYPES} or 'auto'.")
+    return index_type
+
+def _pq_subquantizers(dimension: int) -> int:
+    # largest divisor of the dimension not above PQ_M
+    return max(m for m in range(1, min(config.PQ_M, dimension) + 1) if dimension % m == 0)
+
+def _new_index(index_type: str, dimension: int, num_vectors: int) -> faiss.Index:
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dimension)
+    if index_type == "hnsw":
+        # graph over 8-bit scalar-quantized vectors, 4x smaller than float32
+        return faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, config.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+
+    # IVF: ~4*sqrt(n) lists, with enough training points per list
+    nlist = int(min(max(4 * np.sqrt(num_vectors), 1), max(num_vectors // 39, 1)))
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == "ivf_sq":
+        return faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), 8, faiss.METRIC_INNER_PRODUCT)
+
+def configure_search(index: faiss.Index):
+    # search-time knobs for approximate indexes; exact ones have none
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = config.IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.HNSW_EF_SEARCH
+
+def is_exact(index: faiss.Index) -> bool:
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return isinstance(index, faiss.IndexFlat)
+
+def create_faiss_index(embeddings: np.ndarray, index_type: Optional[str] = None, ids: Optional[np.ndarray] = None) -> faiss.Index:
+    # embeddings may be a memory-mapped array, it is read in batches
+    # with ids, vectors are added under those ids (IVF stores them natively,
+    # other types are wrapped in an IndexIDMap2)
 
     if embeddings.size == 0:
         raise ValueError("Cannot create FAISS index from empty embeddings array.")
     
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
-    return index
\ No newline at end of file
+    num_vectors, dimension = embeddings.shape
+    index_type = resolve_index_type(num_vectors, index_type)
+    # product quantization needs 256 centroids per sub-quantizer to train
+    if index_type == "ivf_pq" and num_vectors < 256 * 39:
+        index_type = "ivf_sq"
+    with span("index_build", index_type=index_type, vectors=num_vectors):
+        index = _new_index(index_type, dimension, num_vectors)
+        if ids is not None and not isinstance(index, faiss.IndexIVF):
+            index = faiss.IndexIDMap2(index)
+
+        if not index.is_trained:
+            sample_size = min(num_vectors, config.ANN_TRAIN_SAMPLE)
+            sample = np.sort(np.random.default_rng(0).choice(num_vectors, sample_size, replace=False))
+            index.train(np.ascontiguousarray(embeddings[sample], dtype='float32'))
+
+        batch_size = 65536
+        for start in range(0, num_vectors, batch_size):
+            batch = np.ascontiguousarray(embeddings[start:start + batch_size], dtype='float32')
+            if ids is None:
+                index.add(batch)
+            else:
+                index.add_with_ids(batch, np.ascontiguousarray(ids[start:start + batch_size], dtype='int64'))
+        configure_search(index)
+    return index
+
+def rescore(query_embedding: np.ndarray, vectors: np.ndarray, positions: List[int]) -> np.ndarray:
+    # exact inner products for a shortlist, only the shortlisted rows are read
+    order = np.argsort(positions)
+    sorted_positions = np.asarray(positions)[order]
+    scores = np.empty(len(positions), dtype='float32')
+    scores[order] = np.asarray(vectors[sorted_positions], dtype='float32') @ query_embedding[0]
+    return scores
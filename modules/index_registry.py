@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+from . import config
+from .persistence import load_data
+from .telemetry import count, span
+
+INDEX_FILE = "faiss.index"
+CHUNKS_FILE = "chunks.npy"
+CHUNK_TEXT_FILE = "chunks.txt"
+CHUNK_META_FILE = "chunks.json"
+VECTORS_FILE = "embeddings.f32"
+# pickled TextNode lists of caches built before the chunk store
+LEGACY_CHUNKS_FILE = "chunks.pkl"
+
+# cache_path -> (file signature, index, nodes), least recently used first
+_registry: "OrderedDict[str, Tuple[tuple, Any, Sequence[Any]]]" = OrderedDict()
+# cache_path -> (file signature, chunk store) of documents whose chunks were
+# needed without their index, e.g. for corpus hits
+_stores: "OrderedDict[str, Tuple[tuple, Sequence[Any]]]" = OrderedDict()
+_lock = threading.Lock()
+
+def is_indexed(cache_path: str) -> bool:
+    # a finished build, or one from before the chunk store that is converted
+    # when it is first loaded
+    if not os.path.exists(os.path.join(cache_path, INDEX_FILE)):
+        return False
+    return any(os.path.exists(os.path.join(cache_path, name)) for name in (CHUNKS_FILE, LEGACY_CHUNKS_FILE))
+
+def _file_signature(cache_path: str) -> tuple:
+    # (mtime, size) of every cache file; a rebuild changes at least one of them
+
+    if not os.path.exists(os.path.join(cache_path, CHUNKS_FILE)) and os.path.exists(os.path.join(cache_path, LEGACY_CHUNKS_FILE)):
+        from .chunk_store import migrate
+        migrate(cache_path)
+
+    signature = []
+    for file_name in (INDEX_FILE, CHUNKS_FILE):
+        full_path = os.path.join(cache_path, file_name)
+        if not os.path.exists(full_path):
+            raise FileNotFoundError(f"Cache file not found: {full_path}")
+        stat = os.stat(full_path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def index_version(cache_path: str) -> List[List[int]]:
+    # identifies one build of a document; changes whenever it is rebuilt
+    return [list(part) for part in _file_signature(cache_path)]
+
+def get_index(cache_path: str) -> Tuple[Optional[Any], Optional[Sequence[Any]]]:
+    # returns the (faiss index, nodes) pair for a cache dir, loading it only when
+    # it is not resident yet or the files on disk changed since it was loaded
+
+    key = os.path.abspath(cache_path)
+    signature = _file_signature(cache_path)
+
+    with _lock:
+        entry = _registry.get(key)
+        if entry is not None and entry[0] == signature:
+            _registry.move_to_end(key)
+            count("rag_cache_hits_total", cache="index_registry")
+            return entry[1], entry[2]
+
+    count("rag_cache_misses_total", cache="index_registry")
+    # chunks come from the memory-mapped chunk store, a TextNode is only
+    # built for a position that is looked up
+    from .chunk_store import ChunkStore
+    with span("index_load", cache_path=cache_path):
+        index = load_data(cache_path, INDEX_FILE, serializer='faiss', mmap=config.INDEX_MMAP)
+        try:
+            nodes = ChunkStore(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Warning: Could not load the chunk store in {cache_path}. Reason: {e}")
+            nodes = None
+    if index is None or nodes is None:
+        return None, None
+    # search settings follow the current config, not the one at build time
+    from .embedder import configure_search
+    configure_search(index)
+
+    with _lock:
+        _registry[key] = (signature, index, nodes)
+        _registry.move_to_end(key)
+        while len(_registry) > max(config.INDEX_CACHE_SIZE, 1):
+            _registry.popitem(last=False)
+    return index, nodes
+
+def get_chunks(cache_path: str) -> Sequence[Any]:
+    # the chunk store of a cache dir without loading its index; opening one
+    # only maps its files, so many more are kept than indexes
+    key = os.path.abspath(cache_path)
+    signature = _file_signature(cache_path)
+
+    with _lock:
+        entry = _registry.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[2]
+        entry = _stores.get(key)
+        if entry is not None and entry[0] == signature:
+            _stores.move_to_end(key)
+            return entry[1]
+
+    from .chunk_store import ChunkStore
+    nodes = ChunkStore(cache_path)
+    with _lock:
+        _stores[key] = (signature, nodes)
+        _stores.move_to_end(key)
+        while len(_stores) > max(config.CHUNK_STORE_CACHE_SIZE, 1):
+            _stores.popitem(last=False)
+    return nodes
+
+def get_vectors(cache_path: str, dimension: int) -> Optional[Any]:
+    # the document's float32 vectors, memory-mapped so exact re-scoring only
+    # reads the rows it needs; None for caches built before they were kept
+    import numpy as np
+
+    full_path = os.path.join(cache_path, VECTORS_FILE)
+    if not os.path.exists(full_path) or os.path.getsize(full_path) == 0:
+        return None
+    return np.memmap(full_path, dtype='float32', mode='r').reshape(-1, dimension)
+
+def invalidate(cache_path: Optional[str] = None):
+    # drops one cached entry, or all of them when no path is given
+
+    with _lock:
+        if cache_path is None:
+            _registry.clear()
+            _stores.clear()
+        else:
+            _registry.pop(os.path.abspath(cache_path), None)
+            _stores.pop(os.path.abspath(cache_path), None)
@@ -0,0 +1,371 @@
+"""
+Background indexing: builds that run under the document's lock and are moved
+into place once complete, and a watcher that queues a folder's PDFs.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import config
+from .index_registry import invalidate, is_indexed
+from .persistence import document_lock, find_previous_cache, get_cache_path
+from .telemetry import count, gauge, muted, observe, say, span
+
+BUILDING_SUFFIX = ".building"
+PARTIAL_SUFFIX = ".partial"
+
+# states of a watched document
+QUEUED, BUILDING, READY, FAILED = "queued", "building", "ready", "failed"
+
+def building_path(cache_path: str) -> str:
+    return cache_path + BUILDING_SUFFIX
+
+def partial_path(cache_path: str) -> str:
+    return cache_path + PARTIAL_SUFFIX
+
+def resolve(cache_path: str) -> str:
+    # the finished cache in place of its partial one, once it is ready
+    if cache_path.endswith(PARTIAL_SUFFIX):
+        final_path = cache_path[:-len(PARTIAL_SUFFIX)]
+        if is_indexed(final_path):
+            return final_path
+    return cache_path
+
+def _replace_dir(source: str, target: str):
+    # moves directory source to target, replacing what is there; readers that
+    # memory-mapped the old files keep them until they reload
+    # not atomic: a directory can't be renamed over a non-empty one, so
+    # target is missing between the two renames
+    old_path = None
+    if os.path.exists(target):
+        old_path = f"{target}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(target, old_path)
+    os.replace(source, target)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+def _remove_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+    invalidate(path)
+
+def _remove_superseded(cache_path: str, file_path: str):
+    # drops the cache of a previous version of a document once a newer one
+    # has been built from it, along with its corpus entry; a cache built from
+    # any other source path is left alone
+    from . import answer_cache
+    from .corpus import list_documents, remove_document
+    from .ingest import built_from
+    if built_from(cache_path) != os.path.abspath(file_path):
+        return
+    with document_lock(cache_path):
+        for doc_id, entry in list_documents().items():
+            if entry["cache_path"] == cache_path:
+                remove_document(doc_id)
+        answer_cache.invalidate(cache_path)
+        _remove_dir(cache_path)
+        _remove_dir(partial_path(cache_path))
+    say(f"🧹 Removed the superseded cache {os.path.basename(cache_path)}.")
+
+def _snapshotter(cache_path: str, on_snapshot: Callable[[str, int], None]) -> Callable[[str, Dict[str, Any]], None]:
+    # ingest_pdf's on_commit: publishes the partial cache at doubling chunk counts
+    from .ingest import write_snapshot
+    target = partial_path(cache_path)
+    threshold = max(config.INDEXER_SNAPSHOT_MIN_CHUNKS, 1)
+
+    def on_commit(work_path: str, progress: Dict[str, Any]):
+        nonlocal threshold
+        if progress["chunks"] < threshold:
+            return
+        while threshold <= progress["chunks"]:
+            threshold *= 2
+        staging = f"{target}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            with span("index_snapshot", chunks=progress["chunks"]):
+                write_snapshot(work_path, progress, staging)
+            _replace_dir(staging, target)
+        except Exception as e:
+            # the build itself goes on, only the early preview is lost
+            print(f"⚠️ Warning: Could not publish the partial index of {os.path.basename(cache_path)}. Reason: {e}")
+            return
+        invalidate(target)
+        on_snapshot(target, progress["chunks"])
+    return on_commit
+
+def build_document(file_path: str, cache_path: Optional[str] = None, resume: bool = True, incremental: bool = False,
+                   force: bool = False, on_snapshot: Optional[Callable[[str, int], None]] = None) -> Optional[Dict[str, Any]]:
+    # builds the index of a PDF under its document lock and moves it into place
+    # once complete; returns {"cache_path", "built", "seconds"} plus the chunk
+    # count or the incremental update's counts, None when no text was found
+    # on_snapshot(partial_cache_path, chunks) turns on partial snapshots
+    from .ingest import built_from, ingest_pdf, update_index
+    from . import answer_cache
+
+    cache_path = cache_path or get_cache_path(file_path)
+    with document_lock(cache_path):
+        if is_indexed(cache_path) and not force:
+            return {"cache_path": cache_path, "built": False, "seconds": 0.0}
+
+        start = time.perf_counter()
+        work_path = building_path(cache_path)
+        # an interrupted build from before builds went through work_path
+        if os.path.isdir(cache_path) and not is_indexed(cache_path) and not os.path.exists(work_path):
+            os.replace(cache_path, work_path)
+
+        result: Dict[str, Any] = {"cache_path": cache_path, "built": True}
+        stats, base_cache_path = None, None
+        if incremental:
+            # only a cache built from this very path counts as its previous
+            # version; a same-named PDF from another folder is another document
+            source = os.path.abspath(file_path)
+            base_cache_path = cache_path if is_indexed(cache_path) else find_previous_cache(
+                file_path, lambda path: is_indexed(path) and built_from(path) == source, exclude=cache_path)
+            if base_cache_path:
+                shutil.rmtree(work_path, ignore_errors=True)
+                stats = update_index(file_path, work_path, base_cache_path=base_cache_path)
+                if stats is None:
+                    print("⚠️ Cached index can't be updated in place, rebuilding from scratch.")
+                    resume = False
+        if stats is not None:
+            result.update(stats)
+        else:
+            if not resume:
+                shutil.rmtree(work_path, ignore_errors=True)
+            on_commit = _snapshotter(cache_path, on_snapshot) if on_snapshot else None
+            chunks = ingest_pdf(file_path, work_path, resume=resume, on_commit=on_commit)
+            if not chunks:
+                shutil.rmtree(work_path, ignore_errors=True)
+                _remove_dir(partial_path(cache_path))
+                return None
+            result["chunks"] = chunks
+
+        invalidate(cache_path)
+        answer_cache.invalidate(cache_path)
+        _replace_dir(work_path, cache_path)
+        _remove_dir(partial_path(cache_path))
+        result["seconds"] = time.perf_counter() - start
+    if stats is not None and base_cache_path != cache_path:
+        _remove_superseded(base_cache_path, file_path)
+    return result
+
+class Indexer:
+    """
+    Watches a folder and builds the PDFs that appear or change in it on a pool
+    of daemon worker threads.
+    """
+
+    def __init__(self, folder: Optional[str] = None, workers: Optional[int] = None,
+                 poll_seconds: Optional[float] = None, quiet: bool = False):
+        self.folder = folder or config.INDEXER_WATCH_DIR
+        self.workers = max(workers or config.INDEXER_WORKERS, 1)
+        self.poll_seconds = poll_seconds if poll_seconds is not None else config.INDEXER_POLL_SECONDS
+        # quiet keeps the build progress lines out of an interactive session
+        self.quiet = quiet
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._changed = threading.Condition()
+        # absolute file path -> job record
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # absolute file path -> (size, mtime_ns) at the last poll
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "Indexer":
+        os.makedirs(self.folder, exist_ok=True)
+        self._threads = [threading.Thread(target=self._watch, name="indexer-watch", daemon=True)]
+        self._threads += [threading.Thread(target=self._work, name=f"indexer-{i}", daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, wait: bool = True):
+        # stops watching and drops the queued builds; with wait, running
+        # builds are finished first
+        self._stop.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except OSError as e:
+                print(f"⚠️ Warning: Could not scan {self.folder}. Reason: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not self._stop.is_set():
+                self._build(job)
+
+    def poll(self) -> int:
+        # queues the PDFs that are new or changed and have stopped changing,
+        # returns how many were queued
+        queued = 0
+        now = time.time()
+        present = set()
+        for entry in sorted(os.listdir(self.folder)):
+            if not entry.lower().endswith(".pdf"):
+                continue
+            file_path = os.path.abspath(os.path.join(self.folder, entry))
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            present.add(file_path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self._seen.get(file_path)
+            self._seen[file_path] = signature
+            if signature != previous and now - stat.st_mtime < self.poll_seconds:
+                continue
+            with self._changed:
+                job = self._jobs.get(file_path)
+                if job is not None and job["signature"] == signature:
+                    continue
+                self._jobs[file_path] = job = {
+                    "file_path": file_path,
+                    "name": entry,
+                    "signature": signature,
+                    "state": QUEUED,
+                    "queued_at": now,
+                    "cache_path": None,
+                    "partial_path": None,
+                    "partial_chunks": 0,
+                    "seconds": None,
+                    "error": None,
+                }
+                self._report()
+            self._queue.put(job)
+            queued += 1
+
+        # forget the PDFs deleted from the folder; a queued build of one is
+        # skipped, since its job is no longer the current one
+        for file_path in [path for path in self._seen if path not in present]:
+            del self._seen[file_path]
+        with self._changed:
+            gone = [path for path in self._jobs if path not in present]
+            for file_path in gone:
+                del self._jobs[file_path]
+            if gone:
+                self._report()
+        return queued
+
+    def _build(self, job: Dict[str, Any]):
+        with self._changed:
+            # a newer version of the file was queued in the meantime
+            if self._jobs.get(job["file_path"]) is not job:
+                return
+            job["state"] = BUILDING
+            self._report()
+
+        def on_snapshot(path: str, chunks: int):
+            with self._changed:
+                job["partial_path"], job["partial_chunks"] = path, chunks
+                self._changed.notify_all()
+            say(f"🔎 {job['name']}: the first {chunks} chunks can be searched while the build continues.")
+
+        result, error = None, None
+        try:
+            with span("document_build", file=job["name"]), (muted() if self.quiet else nullcontext()):
+                job["cache_path"] = get_cache_path(job["file_path"])
+                # incremental only starts from a cache built from this same
+                # path, never from a same-named document indexed elsewhere
+                result = build_document(job["file_path"], job["cache_path"], incremental=True, on_snapshot=on_snapshot)
+                if result is not None:
+                    from .corpus import add_document
+                    add_document(result["cache_path"], job["name"], os.path.abspath(job["file_path"]))
+        except Exception as e:
+            result, error = None, str(e)
+
+        if result is None:
+            count("rag_index_builds_total", outcome="error" if error else "empty")
+            error = error or "No text could be extracted from this document."
+            print(f"❌ Error: Could not index '{job['name']}'. Reason: {error}")
+            with self._changed:
+                job["state"], job["error"] = FAILED, error
+                self._report()
+            return
+
+        count("rag_index_builds_total", outcome="built" if result["built"] else "unchanged")
+        if result["built"]:
+            observe("rag_index_build_seconds", result["seconds"])
+            say(f"✅ Indexed {job['name']} in {result['seconds']:.1f}s.")
+        with self._changed:
+            job["state"], job["partial_path"] = READY, None
+            job["seconds"] = result["seconds"] if result["built"] else None
+            self._report()
+
+    def _report(self):
+        # queue depth gauges; called with self._changed held
+        states = [job["state"] for job in self._jobs.values()]
+        gauge("rag_index_queue_depth", states.count(QUEUED), state=QUEUED)
+        gauge("rag_index_queue_depth", states.count(BUILDING), state=BUILDING)
+        self._changed.notify_all()
+
+    def lookup(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            job = self._jobs.get(os.path.abspath(file_path))
+            return dict(job) if job is not None else None
+
+    def wait(self, file_path: str, timeout: Optional[float] = None, partial: bool = True) -> Optional[str]:
+        # the cache path to search once the document's index is ready (or,
+        # with partial, its first snapshot); None if the build failed, the
+        # file isn't watched, or timeout seconds passed
+        key = os.path.abspath(file_path)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(key)
+                if job is None or job["state"] == FAILED:
+                    return None
+                if job["state"] == READY:
+                    return job["cache_path"]
+                if partial and job["partial_path"]:
+                    return job["partial_path"]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def queue_depth(self) -> int:
+        with self._changed:
+            return sum(job["state"] in (QUEUED, BUILDING) for job in self._jobs.values())
+
+    def status(self) -> List[Dict[str, Any]]:
+        # one record per watched document, by name
+        with self._changed:
+            jobs = [dict(job) for job in self._jobs.values()]
+        now = time.time()
+        return [{
+            "name": job["name"],
+            "state": job["state"],
+            "waiting": round(now - job["queued_at"], 1) if job["state"] == QUEUED else None,
+            "partial_chunks": job["partial_chunks"] if job["state"] == BUILDING else None,
+            "seconds": round(job["seconds"], 2) if job["seconds"] is not None else None,
+            "error": job["error"],
+        } for job in sorted(jobs, key=lambda job: job["name"])]
+
+def format_status(records: List[Dict[str, Any]]) -> str:
+    # the status() records as lines for the console
+    lines = []
+    for record in records:
+        if record["state"] == QUEUED:
+            detail = f"queued for {record['waiting']:.0f}s"
+        elif record["state"] == BUILDING:
+            detail = f"building, {record['partial_chunks']} chunks searchable" if record["partial_chunks"] else "building"
+        elif record["state"] == READY:
+            detail = f"ready, built in {record['seconds']:.1f}s" if record["seconds"] is not None else "ready, already indexed"
+        else:
+            detail = f"failed: {record['error']}"
+        lines.append(f"- {record['name']}: {detail}")
+    return "\n".join(lines)
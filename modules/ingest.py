@@ -0,0 +1,269 @@
+"""
+Streaming index build: pages are chunked, embedded and appended to the cache
+a batch at a time, so memory stays flat and an interrupted build resumes.
+"""
+import hashlib
+import os
+import shutil
+import faiss
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional
+from . import config
+from .loader import iter_clean_pages
+from .chunker import ChunkNode, iter_text_nodes
+from . import chunk_store, lexical
+from .embedder import embed_texts, report_embedding_stats, create_faiss_index
+from .index_registry import INDEX_FILE, VECTORS_FILE
+from .persistence import save_data, load_data, append_data
+from .telemetry import say, traced
+
+PARTIAL_VECTORS = "embeddings.partial.f32"
+PROGRESS_FILE = "progress.json"
+PAGE_HASHES_FILE = "page_hashes.json"
+
+def _page_key(page_number: Any) -> int:
+    # the document context is committed as page 0
+    return chunk_store.page_value(page_number)
+
+def _page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _build_settings() -> Dict[str, Any]:
+    # page hashes are only comparable between builds with the same settings
+    return {
+        "embed_model": config.EMBED_MODEL,
+        "chunker": config.CHUNKER,
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+    }
+
+def built_from(cache_path: str) -> Optional[str]:
+    # absolute path of the PDF a cache was built from; None for caches built
+    # before it was recorded
+    try:
+        page_hashes = load_data(cache_path, PAGE_HASHES_FILE, serializer='json', verbose=False)
+    except FileNotFoundError:
+        return None
+    return page_hashes.get("source_path") if page_hashes else None
+
+def _source_signature(file_path: str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _clear_partial(cache_path: str):
+    chunk_store.clear_partial(cache_path)
+    for file_name in (PARTIAL_VECTORS, PROGRESS_FILE):
+        full_path = os.path.join(cache_path, file_name)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+def _load_progress(cache_path: str, file_path: str) -> Optional[Dict[str, Any]]:
+    # progress of an interrupted build of this exact file, if there is one
+    try:
+        progress = load_data(cache_path, PROGRESS_FILE, serializer='json')
+    except FileNotFoundError:
+        return None
+    if not progress or progress.get("source") != _source_signature(file_path):
+        return None
+
+    for file_name, size_key in ((chunk_store.PARTIAL_TEXT, "text_bytes"), (chunk_store.PARTIAL_ROWS, "rows_bytes"), (PARTIAL_VECTORS, "vectors_bytes")):
+        full_path = os.path.join(cache_path, file_name)
+        # progress records of builds from before the chunk store lack the keys
+        if size_key not in progress or not os.path.exists(full_path) or os.path.getsize(full_path) < progress[size_key]:
+            return None
+        # drop anything written after the last committed batch
+        with open(full_path, 'r+b') as f:
+            f.truncate(progress[size_key])
+    return progress
+
+def _build_index(cache_path: str, vectors_file: str, dimension: int) -> faiss.Index:
+    # builds the final index from vectors on disk without loading them all
+    vectors = np.memmap(os.path.join(cache_path, vectors_file), dtype='float32', mode='r').reshape(-1, dimension)
+    index = create_faiss_index(vectors)
+    say(f"🧭 Built a {type(index).__name__} index over {index.ntotal} vectors.")
+    return index
+
+def _load_vectors(cache_path: str) -> Optional[np.ndarray]:
+    # the stored vectors of a built cache; older caches only have a flat
+    # index, whose vectors can be read back exactly
+    index = load_data(cache_path, INDEX_FILE, serializer='faiss', mmap=True)
+    if index is None:
+        return None
+    full_path = os.path.join(cache_path, VECTORS_FILE)
+    if os.path.exists(full_path):
+        return np.memmap(full_path, dtype='float32', mode='r').reshape(-1, index.d)
+    if isinstance(index, faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+    return None
+
+def write_snapshot(cache_path: str, progress: Dict[str, Any], snapshot_path: str):
+    # copies the batches committed to cache_path so far into snapshot_path as
+    # a complete cache with an exact index; only call it between commits
+    # (e.g. from ingest_pdf's on_commit), when the partial files match progress
+    os.makedirs(snapshot_path, exist_ok=True)
+    for file_name, size_key in ((chunk_store.PARTIAL_TEXT, "text_bytes"), (chunk_store.PARTIAL_ROWS, "rows_bytes"), (PARTIAL_VECTORS, "vectors_bytes")):
+        with open(os.path.join(cache_path, file_name), 'rb') as source, open(os.path.join(snapshot_path, file_name), 'wb') as target:
+            shutil.copyfileobj(source, target)
+            target.truncate(progress[size_key])
+    vectors = np.memmap(os.path.join(snapshot_path, PARTIAL_VECTORS), dtype='float32', mode='r').reshape(-1, progress["dimension"])
+    save_data(snapshot_path, INDEX_FILE, create_faiss_index(vectors, index_type="flat"), serializer='faiss', verbose=False)
+    del vectors
+    os.replace(os.path.join(snapshot_path, PARTIAL_VECTORS), os.path.join(snapshot_path, VECTORS_FILE))
+    chunk_store.commit(snapshot_path, list(progress["files"]))
+    lexical.build_for_cache(snapshot_path)
+
+@traced("ingest")
+def ingest_pdf(file_path: str, cache_path: str, batch_size: Optional[int] = None, resume: bool = True,
+               on_commit: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> int:
+    # builds faiss.index and the chunk store for a PDF, returns the number of chunks
+    # on_commit(cache_path, progress) runs after every committed batch
+
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    os.makedirs(cache_path, exist_ok=True)
+
+    progress = _load_progress(cache_path, file_path) if resume else None
+    if progress is None:
+        _clear_partial(cache_path)
+        progress = {
+            "source": _source_signature(file_path),
+            "last_page": -1,
+            "chunks": 0,
+            "text_bytes": 0,
+            "rows_bytes": 0,
+            "vectors_bytes": 0,
+            "files": [],
+            "dimension": None,
+            "page_hashes": {},
+        }
+    else:
+        say(f"⏩ Resuming interrupted build after page {progress['last_page']} ({progress['chunks']} chunks already indexed).")
+
+    store_stats: Dict[str, Any] = {}
+
+    def commit(batch: List[ChunkNode]):
+        embeddings = embed_texts([node.get_content() for node in batch], stats=store_stats)
+        progress["dimension"] = int(embeddings.shape[1])
+
+        # vectors first: a crash before the progress write is rolled back on resume
+        progress["vectors_bytes"] = append_data(cache_path, PARTIAL_VECTORS, embeddings, serializer='raw')
+        progress["text_bytes"], progress["rows_bytes"] = chunk_store.append_batch(cache_path, batch, progress["files"])
+        progress["chunks"] += len(batch)
+        progress["last_page"] = _page_key(batch[-1].metadata["page_number"])
+        save_data(cache_path, PROGRESS_FILE, progress, serializer='json', verbose=False)
+        say(f"📦 Indexed {progress['chunks']} chunks (through page {progress['last_page']}).")
+        if on_commit is not None:
+            on_commit(cache_path, progress)
+
+    def hashed(pages):
+        for page in pages:
+            progress["page_hashes"][str(_page_key(page["page_number"]))] = _page_hash(page["text"])
+            yield page
+
+    pages = hashed(iter_clean_pages(file_path, after_page=progress["last_page"]))
+    batch: List[ChunkNode] = []
+    for node in iter_text_nodes(pages, file_path):
+        # batches end on page boundaries so a resume never splits a page
+        if len(batch) >= batch_size and node.metadata["page_number"] != batch[-1].metadata["page_number"]:
+            commit(batch)
+            batch = []
+        batch.append(node)
+    if batch:
+        commit(batch)
+
+    if progress["chunks"] == 0:
+        print("⚠️ Warning: No text could be extracted from this document.")
+        _clear_partial(cache_path)
+        return 0
+
+    index = _build_index(cache_path, PARTIAL_VECTORS, progress["dimension"])
+    save_data(cache_path, INDEX_FILE, index, serializer='faiss')
+    os.replace(os.path.join(cache_path, PARTIAL_VECTORS), os.path.join(cache_path, VECTORS_FILE))
+    chunk_store.commit(cache_path, progress["files"])
+    lexical.build_for_cache(cache_path)
+    page_hashes = {"settings": _build_settings(), "source_path": os.path.abspath(file_path), "pages": progress["page_hashes"]}
+    save_data(cache_path, PAGE_HASHES_FILE, page_hashes, serializer='json')
+    _clear_partial(cache_path)
+    report_embedding_stats(store_stats)
+    return progress["chunks"]
+
+@traced("index_update")
+def update_index(file_path: str, cache_path: str, batch_size: Optional[int] = None, base_cache_path: Optional[str] = None) -> Optional[Dict[str, int]]:
+    # incremental rebuild: re-embeds only the pages whose hash changed, starting
+    # from base_cache_path when it isn't cache_path (e.g. a previous version)
+    # returns the reused / recomputed / removed chunk counts, or None when the
+    # cache can't be updated and needs a full build
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    base_cache_path = base_cache_path or cache_path
+    try:
+        old_hashes = load_data(base_cache_path, PAGE_HASHES_FILE, serializer='json')
+        store = chunk_store.open_store(base_cache_path)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not old_hashes or old_hashes.get("settings") != _build_settings():
+        return None
+    vectors = _load_vectors(base_cache_path)
+    if vectors is None or len(vectors) != len(store):
+        return None
+    old_pages = old_hashes["pages"]
+
+    # rows of the old store by page, without assuming they are in page order
+    order = np.argsort(store.pages, kind='stable')
+    sorted_pages = store.pages[order]
+
+    def old_rows(key: int) -> np.ndarray:
+        start, end = np.searchsorted(sorted_pages, [key, key + 1])
+        return order[start:end]
+
+    # pages are written in the new PDF's order, a batch at a time, to the
+    # same partial files a full build uses
+    _clear_partial(cache_path)
+    files: List[str] = []
+    store_stats: Dict[str, Any] = {}
+    new_pages: Dict[str, str] = {}
+    counts = {"reused": 0, "recomputed": 0}
+    batch: List[ChunkNode] = []
+    batch_vectors: List[Optional[np.ndarray]] = []  # None for chunks still to embed
+
+    def flush():
+        fresh = [node for node, vector in zip(batch, batch_vectors) if vector is None]
+        embedded = iter(embed_texts([node.get_content() for node in fresh], stats=store_stats) if fresh else ())
+        rows = np.stack([next(embedded) if vector is None else vector for vector in batch_vectors])
+        append_data(cache_path, PARTIAL_VECTORS, np.ascontiguousarray(rows, dtype='float32'), serializer='raw')
+        chunk_store.append_batch(cache_path, batch, files)
+        batch.clear()
+        batch_vectors.clear()
+
+    for page in iter_clean_pages(file_path):
+        page_key = _page_key(page["page_number"])
+        key = str(page_key)
+        new_pages[key] = _page_hash(page["text"])
+        if old_pages.get(key) == new_pages[key]:
+            rows = old_rows(page_key)
+            batch.extend(ChunkNode(store.text(int(i)), store.metadata(int(i))) for i in rows)
+            batch_vectors.extend(vectors[rows])
+            counts["reused"] += len(rows)
+        else:
+            nodes = list(iter_text_nodes([page], file_path))
+            batch.extend(nodes)
+            batch_vectors.extend([None] * len(nodes))
+            counts["recomputed"] += len(nodes)
+        # batches end on page boundaries, like a full build's
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    report_embedding_stats(store_stats)
+
+    total = counts["reused"] + counts["recomputed"]
+    if total == 0:
+        _clear_partial(cache_path)
+        return None
+
+    index = _build_index(cache_path, PARTIAL_VECTORS, vectors.shape[1])
+    save_data(cache_path, INDEX_FILE, index, serializer='faiss')
+    os.replace(os.path.join(cache_path, PARTIAL_VECTORS), os.path.join(cache_path, VECTORS_FILE))
+    chunk_store.commit(cache_path, files)
+    lexical.build_for_cache(cache_path)
+    save_data(cache_path, PAGE_HASHES_FILE, {"settings": _build_settings(), "source_path": os.path.abspath(file_path), "pages": new_pages},
+              serializer='json')
+    return {"reused": counts["reused"], "recomputed": counts["recomputed"], "removed": len(store) - counts["reused"]}
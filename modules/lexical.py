@@ -0,0 +1,203 @@
+"""
+BM25 index over a cache's chunks (postings in bm25.npz, terms in
+bm25.json), built next to the FAISS index.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from . import chunk_store, config
+from .index_registry import CHUNKS_FILE
+from .persistence import load_data, save_data
+from .telemetry import say, span
+
+FORMAT_VERSION = 1
+POSTINGS_FILE = "bm25.npz"
+TERMS_FILE = "bm25.json"
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my no not of on or our shall so than that the their then there these this those to "
+    "under was we what when where which who will with would you your".split()
+)
+
+# cache_path -> (file signature, index), least recently used first
+_loaded: "OrderedDict[str, Tuple[tuple, LexicalIndex]]" = OrderedDict()
+_lock = threading.Lock()
+# cache_path -> lock held while that cache's index is loaded or built, so
+# other caches aren't blocked behind a build
+_build_locks: Dict[str, threading.Lock] = {}
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        parts = re.split(r"[.\-/]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+class LexicalIndex:
+    def __init__(self, terms: List[str], offsets: np.ndarray, positions: np.ndarray, weights: np.ndarray, count: int):
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+        self.count = count
+
+    def _idf(self, df: int) -> float:
+        return math.log(1.0 + (self.count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int) -> List[Tuple[float, float, int]]:
+        # the k best chunks as (bm25 score, coverage, position), best first;
+        # chunks that match no query term are never returned
+        query_terms = set(tokenize(query))
+        if not query_terms or self.count == 0:
+            return []
+        scores = np.zeros(self.count, dtype='float32')
+        matched = np.zeros(self.count, dtype='float32')
+        total_idf = 0.0
+        for term in query_terms:
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                # a term no chunk contains still counts against coverage
+                total_idf += self._idf(0)
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            idf = self._idf(int(end - start))
+            total_idf += idf
+            positions = self.positions[start:end]
+            scores[positions] += idf * self.weights[start:end]
+            matched[positions] += idf
+
+        hit_positions = np.flatnonzero(scores)
+        if len(hit_positions) > k:
+            hit_positions = hit_positions[np.argpartition(-scores[hit_positions], k - 1)[:k]]
+        hit_positions = hit_positions[np.argsort(-scores[hit_positions], kind='stable')]
+        return [(float(scores[i]), float(matched[i]) / total_idf, int(i)) for i in hit_positions]
+
+def build(texts: Iterable[str]) -> LexicalIndex:
+    term_ids: List[int] = []
+    doc_ids: List[int] = []
+    tfs: List[int] = []
+    lengths: List[int] = []
+    vocabulary: Dict[str, int] = {}
+    for position, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_ids.append(position)
+            tfs.append(tf)
+
+    term_array = np.array(term_ids, dtype=np.int64)
+    # stable sort keeps the positions of every term ascending
+    order = np.argsort(term_array, kind='stable')
+    lengths_array = np.array(lengths, dtype='float32')
+    positions = np.array(doc_ids, dtype=np.int32)[order]
+    tf = np.array(tfs, dtype='float32')[order]
+    avgdl = float(lengths_array.mean()) if len(lengths) else 0.0
+    norm = 1.0 - B + B * lengths_array[positions] / max(avgdl, 1e-9)
+    weights = (tf * (K1 + 1.0) / (tf + K1 * norm)).astype('float32')
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_array, minlength=len(vocabulary)), out=offsets[1:])
+    terms = sorted(vocabulary, key=vocabulary.get)
+    return LexicalIndex(terms, offsets, positions, weights, len(lengths))
+
+def save(cache_path: str, index: LexicalIndex):
+    # terms first, postings last: the postings file marks a finished index
+    save_data(cache_path, TERMS_FILE, {"format": FORMAT_VERSION, "count": index.count, "k1": K1, "b": B, "terms": index.terms},
+              serializer='json', verbose=False)
+    full_path = os.path.join(cache_path, POSTINGS_FILE)
+    tmp_path = f"{full_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, offsets=index.offsets, positions=index.positions, weights=index.weights)
+    os.replace(tmp_path, full_path)
+
+def build_for_cache(cache_path: str) -> LexicalIndex:
+    # indexes the chunk store of a cache and saves the result next to it
+    store = chunk_store.open_store(cache_path)
+    with span("lexical_build", chunks=len(store)):
+        index = build(store.text(i) for i in range(len(store)))
+        save(cache_path, index)
+    return index
+
+def _load(cache_path: str) -> Optional[LexicalIndex]:
+    try:
+        meta = load_data(cache_path, TERMS_FILE, serializer='json', verbose=False)
+        with np.load(os.path.join(cache_path, POSTINGS_FILE)) as postings:
+            arrays = {name: postings[name] for name in ("offsets", "positions", "weights")}
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        return None
+    if not meta or meta.get("format") != FORMAT_VERSION or meta.get("k1") != K1 or meta.get("b") != B:
+        return None
+    return LexicalIndex(meta["terms"], arrays["offsets"], arrays["positions"], arrays["weights"], meta["count"])
+
+def _signature(cache_path: str) -> tuple:
+    signature = []
+    for file_name in (CHUNKS_FILE, POSTINGS_FILE):
+        full_path = os.path.join(cache_path, file_name)
+        stat = os.stat(full_path) if os.path.exists(full_path) else None
+        signature.append((stat.st_mtime_ns, stat.st_size) if stat else None)
+    return tuple(signature)
+
+def _is_stale(cache_path: str) -> bool:
+    # postings older than the chunk store belong to an earlier build
+    chunks, postings = (os.path.join(cache_path, name) for name in (CHUNKS_FILE, POSTINGS_FILE))
+    return os.path.getmtime(postings) < os.path.getmtime(chunks)
+
+def _cached(key: str, cache_path: str) -> Optional[LexicalIndex]:
+    with _lock:
+        entry = _loaded.get(key)
+        if entry is None or entry[0] != _signature(cache_path):
+            return None
+        _loaded.move_to_end(key)
+        return entry[1]
+
+def get_lexical(cache_path: str) -> LexicalIndex:
+    # the cache's BM25 index, loaded once per build; caches from before the
+    # BM25 index (or with a stale one) get it built here
+    key = os.path.abspath(cache_path)
+    chunk_store.migrate(cache_path)
+    index = _cached(key, cache_path)
+    if index is not None:
+        return index
+
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        # another thread may have loaded it while this one waited
+        index = _cached(key, cache_path)
+        if index is not None:
+            return index
+        index = _load(cache_path)
+        if index is None or _is_stale(cache_path):
+            index = build_for_cache(cache_path)
+            say(f"🔤 Built the BM25 index for {cache_path} ({index.count} chunks, {len(index.terms)} terms).")
+        signature = _signature(cache_path)
+    with _lock:
+        _loaded[key] = (signature, index)
+        _loaded.move_to_end(key)
+        while len(_loaded) > max(config.INDEX_CACHE_SIZE, 1):
+            _loaded.popitem(last=False)
+    return index
+
+def search(query: str, cache_paths: Sequence[str], k: int) -> List[Tuple[float, float, str, int]]:
+    # the k best chunks over several documents as (bm25 score, coverage,
+    # cache_path, position), best first
+    # bm25 scores of different documents come from different idf statistics
+    # and aren't comparable, so the documents' rankings are interleaved by
+    # rank, ties going to the better coverage
+    ranked = []
+    for cache_path in cache_paths:
+        for rank, (score, coverage, position) in enumerate(get_lexical(cache_path).search(query, k)):
+            ranked.append((rank, -coverage, (score, coverage, cache_path, position)))
+    ranked.sort(key=lambda item: item[:2])
+    return [hit for _, _, hit in ranked[:k]]
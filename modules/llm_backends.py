@@ -0,0 +1,351 @@
+import codecs
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+from . import config
+
+class LLMError(Exception):
+    """Raised when a backend cannot produce a reply."""
+
+class LLMUnavailableError(LLMError):
+    """Raised when the backend cannot be reached at all."""
+
+class LLMBackend:
+    # common interface: one prompt in, the full reply text out
+    # backends with supports_context continue a previous exchange: the
+    # `context` handle they put in stats is passed back with the next prompt,
+    # which then only has to carry what is new. Others ignore `context`.
+
+    name = "base"
+    supports_context = False
+
+    def generate(self, prompt: str, model: Optional[str] = None, context: Optional[List[int]] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, model: Optional[str] = None, stats: Optional[Dict[str, Any]] = None,
+               context: Optional[List[int]] = None) -> Iterator[str]:
+        # yields the reply piece by piece; closing the generator stops generation.
+        # backends without native streaming yield the whole reply at once
+        yield self.generate(prompt, model=model, context=context, stats=stats)
+
+    def close(self):
+        pass
+
+class OllamaHTTPBackend(LLMBackend):
+    """
+    Talks to the Ollama REST API over a small pool of persistent HTTP
+    connections. `keep_alive` asks the server to keep the model loaded
+    between requests so follow-up questions don't pay a model reload.
+    """
+
+    name = "ollama"
+    supports_context = True
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        pool_size: Optional[int] = None,
+    ):
+        host = host or config.OLLAMA_HOST
+        parsed = urlparse(host if "://" in host else f"http://{host}")
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or (443 if self.scheme == "https" else 11434)
+        self.model = model or config.LLM_MODEL
+        self.timeout = timeout if timeout is not None else config.LLM_TIMEOUT
+        self.retries = retries if retries is not None else config.LLM_RETRIES
+        self.keep_alive = keep_alive or config.OLLAMA_KEEP_ALIVE
+        self.pool_size = max(pool_size or config.LLM_POOL_SIZE, 1)
+
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+
+    # --- connection pool ---
+    def _new_connection(self) -> http.client.HTTPConnection:
+        conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return conn_cls(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                return self._new_connection()
+        # every connection is busy, wait for one to come back
+        try:
+            return self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise LLMError(f"No Ollama connection came free within {self.timeout}s")
+
+    def _release(self, conn: http.client.HTTPConnection, broken: bool = False):
+        if broken:
+            conn.close()
+            conn = self._new_connection()
+        self._pool.put(conn)
+
+    def _open(self, path: str, payload: Dict[str, Any]) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        # sends the request, retrying until the response headers arrive
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.retries + 1):
+            conn = self._acquire()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                response = conn.getresponse()
+            except socket.timeout as e:
+                # the full timeout has already been waited once, don't multiply it
+                self._release(conn, broken=True)
+                raise LLMError(f"Ollama did not answer within {self.timeout}s: {e}")
+            except (ConnectionError, http.client.HTTPException, OSError) as e:
+                self._release(conn, broken=True)
+                last_error = e
+                if attempt < self.retries:
+                    time.sleep(min(0.5 * (2 ** attempt), 4.0))
+                continue
+
+            if response.status != 200:
+                data = response.read()
+                self._release(conn)
+                raise LLMError(f"Ollama returned HTTP {response.status}: {data.decode('utf-8', 'replace')}")
+            return conn, response
+
+        if isinstance(last_error, ConnectionRefusedError):
+            raise LLMUnavailableError(f"Could not reach Ollama at {self.host}:{self.port}: {last_error}")
+        raise LLMError(f"Ollama request failed after {self.retries + 1} attempts: {last_error}")
+
+    def _payload(self, prompt: str, model: Optional[str], stream: bool, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if context:
+            # the previous exchange, already evaluated by the server
+            payload["context"] = context
+        return payload
+
+    def generate(self, prompt: str, model: Optional[str] = None, context: Optional[List[int]] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        conn, response = self._open("/api/generate", self._payload(prompt, model, stream=False, context=context))
+        try:
+            data = json.loads(response.read())
+        except (socket.timeout, http.client.HTTPException, OSError) as e:
+            self._release(conn, broken=True)
+            raise LLMError(f"Ollama response interrupted: {e}")
+        except ValueError as e:
+            self._release(conn)
+            raise LLMError(f"Ollama sent a malformed response: {e}")
+        self._release(conn)
+        if stats is not None:
+            stats.update({k: v for k, v in data.items() if k != "response"})
+        return data.get("response", "")
+
+    def stream(self, prompt: str, model: Optional[str] = None, stats: Optional[Dict[str, Any]] = None,
+               context: Optional[List[int]] = None) -> Iterator[str]:
+        conn, response = self._open("/api/generate", self._payload(prompt, model, stream=True, context=context))
+        finished = False
+        try:
+            # one JSON object per line, the last one has done=true plus timings
+            for line in response:
+                if not line.strip():
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except ValueError as e:
+                    raise LLMError(f"Ollama sent a malformed stream line: {e}")
+                if chunk.get("error"):
+                    raise LLMError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    if stats is not None:
+                        stats.update({k: v for k, v in chunk.items() if k != "response"})
+                    # consume the end of the chunked body so the connection can be reused
+                    response.read()
+                    finished = True
+                    break
+        except (socket.timeout, http.client.HTTPException, OSError) as e:
+            raise LLMError(f"Ollama stream interrupted: {e}")
+        finally:
+            # a stream abandoned half-way leaves unread data on the socket,
+            # so that connection can't go back into the pool as-is
+            self._release(conn, broken=not finished)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            self._created = 0
+
+class SubprocessBackend(LLMBackend):
+    # the original `ollama run` path, one process per prompt
+
+    name = "subprocess"
+
+    def __init__(self, model: Optional[str] = None, timeout: Optional[float] = None):
+        self.model = model or config.LLM_MODEL
+        self.timeout = timeout if timeout is not None else config.LLM_TIMEOUT
+
+    def generate(self, prompt: str, model: Optional[str] = None, context: Optional[List[int]] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        try:
+            result = subprocess.run(
+                ["ollama", "run", model or self.model],
+                input=prompt,
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=self.timeout,
+            )
+        except FileNotFoundError as e:
+            raise LLMUnavailableError(f"'ollama' executable not found: {e}")
+        except subprocess.CalledProcessError as e:
+            raise LLMError(e.stderr or e.stdout)
+        except subprocess.TimeoutExpired:
+            raise LLMError(f"'ollama run' timed out after {self.timeout}s")
+        return result.stdout
+
+    def stream(self, prompt: str, model: Optional[str] = None, stats: Optional[Dict[str, Any]] = None,
+               context: Optional[List[int]] = None) -> Iterator[str]:
+        try:
+            proc = subprocess.Popen(
+                ["ollama", "run", model or self.model],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            raise LLMUnavailableError(f"'ollama' executable not found: {e}")
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            proc.stdin.write(prompt.encode("utf-8"))
+            proc.stdin.close()
+            while True:
+                # read whatever is available instead of waiting for full lines
+                data = os.read(proc.stdout.fileno(), 256)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            if proc.wait(timeout=self.timeout) != 0:
+                raise LLMError(proc.stderr.read().decode("utf-8", "replace"))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+FAKE_REPLY = """Justification:
+The provided context explicitly covers the requested item.
+
+Decision: Approved — The policy text confirms coverage.
+
+Clarifying Questions:
+
+---
+Disclaimer: This decision is based solely on the policy clauses provided and is for informational purposes only."""
+
+# words and punctuation marks, a stand-in for the tokenizer of the fake model
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+class FakeBackend(LLMBackend):
+    """
+    In-process stand-in for offline runs and tests. Replies with a fixed
+    string, or with whatever `reply` returns when given a callable. Hands out
+    a context handle like Ollama does, and records it with each prompt.
+    """
+
+    name = "fake"
+    supports_context = True
+
+    def __init__(self, reply: Union[str, Callable[[str], str]] = FAKE_REPLY, latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.prompts = []
+        self.contexts = []
+
+    def generate(self, prompt: str, model: Optional[str] = None, context: Optional[List[int]] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        self.prompts.append(prompt)
+        self.contexts.append(context)
+        if self.latency:
+            time.sleep(self.latency)
+        reply = self.reply(prompt) if callable(self.reply) else self.reply
+        if stats is not None:
+            stats["context"] = list(context or []) + [len(self.prompts)]
+            # token counts like Ollama reports them, prefix cache included:
+            # only the prompt after the prefix it shares with the previous
+            # one is evaluated
+            previous = self.prompts[-2] if len(self.prompts) > 1 else ""
+            shared = len(os.path.commonprefix([previous, prompt]))
+            stats["prompt_eval_count"] = len(_TOKEN_RE.findall(prompt[shared:]))
+            stats["eval_count"] = len(_TOKEN_RE.findall(reply))
+        return reply
+
+    def stream(self, prompt: str, model: Optional[str] = None, stats: Optional[Dict[str, Any]] = None,
+               context: Optional[List[int]] = None) -> Iterator[str]:
+        # replays the reply word by word, like a real token stream
+        reply = self.generate(prompt, model=model, context=context, stats=stats)
+        for token in re.findall(r"\S+\s*|\s+", reply):
+            yield token
+
+_BACKENDS = {
+    OllamaHTTPBackend.name: OllamaHTTPBackend,
+    SubprocessBackend.name: SubprocessBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+def create_backend(name: str) -> LLMBackend:
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}. Choose from {sorted(_BACKENDS)}")
+    return _BACKENDS[name]()
+
+def get_backend() -> LLMBackend:
+    # process-wide backend, created from config.LLM_BACKEND on first use
+
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(config.LLM_BACKEND)
+    return _backend
+
+def set_backend(backend: Union[str, LLMBackend]) -> LLMBackend:
+    # swaps the process-wide backend, e.g. set_backend("fake") for offline runs
+
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = create_backend(backend) if isinstance(backend, str) else backend
+    return _backend
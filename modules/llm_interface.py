@@ -1,12 +1,19 @@
 import re
-from typing import List, Dict, Any
-from llama_index.core.schema import TextNode
-import subprocess
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from . import config
+from .context_assembler import assemble_context
+from .llm_backends import get_backend, LLMError, LLMUnavailableError, SubprocessBackend
+from .reranker import chunk_id
+from .telemetry import count, observe, span
 
-def build_prompt(user_query: str, context_nodes: List[TextNode]) -> str:
-    context_text = "\n\n---\n\n".join([node.get_content() for node in context_nodes])
+if TYPE_CHECKING:
+    from llama_index.core.schema import TextNode
 
-    prompt = f"""
+# the instructions come first and never change, so the backend can reuse
+# their evaluation from the previous request (Ollama keeps the longest common
+# prompt prefix evaluated); only the context and the query after them vary
+PROMPT_PREFIX = """
 You are a strict, rule-based insurance analyst. You NEVER infer or make assumptions. Your decisions are based ONLY on explicit text found in the provided CONTEXT.
 
 Your task is to follow these steps precisely:
@@ -14,12 +21,6 @@ Your task is to follow these steps precisely:
 2.  Scrutinize the CONTEXT for clauses that EXPLICITLY approve or deny the user's request.
 3.  Based on your analysis, make a final decision by following the rules below.
 
---- START OF CONTEXT ---
-{context_text}
---- END OF CONTEXT ---
-
-User Query: "{user_query}"
-
 --- DECISION RULES ---
 - **RULE A (Approval/Denial):** If the CONTEXT contains explicit text that confirms coverage or denial, your 'Decision' MUST be "Approved" or "Not Approved". In this case, the 'Clarifying Questions' section MUST be left completely blank.
 - **RULE B (Insufficient Information):** If the CONTEXT is vague, does not mention the specific procedure, or requires ANY assumption on your part, your 'Decision' MUST be "Insufficient Information".
@@ -28,7 +29,7 @@ User Query: "{user_query}"
 Respond using the following format EXACTLY:
 
 Justification:
-<Your detailed explanation here, citing ONLY explicit text from the context.>
+<Your detailed explanation here, citing ONLY explicit text from the context, with the [document, page] it comes from.>
 
 Decision: <Approved / Not Approved / Insufficient Information> — <A brief, factual reason for your decision.>
 
@@ -37,40 +38,303 @@ Clarifying Questions:
 
 ---
 Disclaimer: This decision is based solely on the policy clauses provided and is for informational purposes only.
+
+The CONTEXT follows, one passage per page, each headed by the [document, page] it comes from, and then the User Query.
+""".strip()
+
+def build_prompt(user_query: str, context_nodes: List["TextNode"]) -> str:
+    # chunks of a page are merged into one cited passage and the context is
+    # trimmed to CONTEXT_TOKEN_BUDGET (see context_assembler)
+    context_text = assemble_context(context_nodes)
+
+    prompt = f"""
+{PROMPT_PREFIX}
+
+--- START OF CONTEXT ---
+{context_text}
+--- END OF CONTEXT ---
+
+User Query: "{user_query}"
+
+Apply the DECISION RULES to this query and respond using the format above EXACTLY.
 """
     return prompt.strip()
 
-def query_llm_with_context(user_query: str, context_nodes: List[TextNode], model_name="llama3.1") -> Dict[str, Any]:
-    prompt = build_prompt(user_query, context_nodes)
+def build_followup_prompt(new_information: str, new_nodes: List["TextNode"]) -> str:
+    # next turn of an exchange the model still holds: only the user's answer
+    # and the clauses it hasn't seen yet
+    prompt = f'The user has provided new information: "{new_information}"\n'
+    if new_nodes:
+        context_text = assemble_context(new_nodes)
+        prompt += f"""
+--- START OF ADDITIONAL CONTEXT ---
+{context_text}
+--- END OF ADDITIONAL CONTEXT ---
+"""
+    prompt += """
+Re-evaluate the user's query with this information and all the CONTEXT so far. Follow the same DECISION RULES and respond using the same format EXACTLY.
+"""
+    return prompt.strip()
 
-    try:
-        result = subprocess.run(
-            ["ollama", "run", model_name],
-            input=prompt,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        raw_output = result.stdout.strip()
+def _turn_prompt(user_query: str, context_nodes: List["TextNode"], conversation: Optional[Any]):
+    # (prompt, context handle) for this turn: a follow-up only sends what is
+    # new when the backend can continue the previous exchange
+    if (conversation is not None and conversation.llm_context and conversation.details
+            and get_backend().supports_context):
+        new_nodes = [node for node in context_nodes if chunk_id(node) not in conversation.sent_chunks]
+        return build_followup_prompt(conversation.details[-1], new_nodes), conversation.llm_context
+    return build_prompt(user_query, context_nodes), None
+
+def parse_llm_output(raw_output: str) -> Dict[str, Any]:
+    # splits a raw reply into status, answer and clarifying questions
+
+    raw_output = raw_output.strip()
+    response = {
+        "status": "sufficient",
+        "answer": raw_output,
+        "questions": []
+    }
+
+    if "Decision: Insufficient Information" in raw_output:
+        response["status"] = "insufficient"
         
-        response = {
-            "status": "sufficient",
-            "answer": raw_output,
-            "questions": []
-        }
-
-        if "Decision: Insufficient Information" in raw_output:
-            response["status"] = "insufficient"
-            
-            match = re.search(r"Clarifying Questions:\s*\n(.*?)(?=\n---|\Z)", raw_output, re.DOTALL)
-            if match:
-                questions_text = match.group(1).strip()
-                questions = [q.strip() for q in questions_text.split('\n') if q.strip()]
-                response["questions"] = questions
-                response["answer"] = raw_output.split("Clarifying Questions:")[0].strip()
-
-        return response
-
-    except subprocess.CalledProcessError as e:
-        error_message = f"❌ LLM Error: {e.stderr or e.stdout}"
-        return {"status": "error", "answer": error_message, "questions": []}
+        match = re.search(r"Clarifying Questions:\s*\n(.*?)(?=\n---|\Z)", raw_output, re.DOTALL)
+        if match:
+            questions_text = match.group(1).strip()
+            questions = [q.strip() for q in questions_text.split('\n') if q.strip()]
+            response["questions"] = questions
+            response["answer"] = raw_output.split("Clarifying Questions:")[0].strip()
+
+    return response
+
+def answer_sections(answer: str) -> Dict[str, str]:
+    # the justification and decision lines of an answer in the prompt's format
+    justification = re.search(r"Justification:\s*(.*?)(?=\n\s*Decision:|\Z)", answer, re.DOTALL)
+    decision = re.search(r"Decision:\s*(.*)", answer)
+    return {
+        "decision": decision.group(1).strip() if decision else "",
+        "justification": justification.group(1).strip() if justification else answer.strip(),
+    }
+
+class StreamingVerdictParser:
+    """
+    Incremental parse_llm_output, fed one token at a time; with stop_early it
+    reports `complete` once the verdict is in and hides the trailing boilerplate.
+    """
+
+    _STOP_MARKERS = ("---", "Disclaimer:")
+    _DECISION = re.compile(r"^\W*Decision\W*:\W*(.+)$")
+
+    def __init__(self, stop_early: bool = True):
+        self.stop_early = stop_early
+        self.text = ""
+        self.decision: Optional[str] = None
+        self.status: Optional[str] = None
+        self.questions: List[str] = []
+        self.complete = False
+        self._line = ""
+        self._shown = 0
+        self._in_questions = False
+
+    def _is_stop_line(self, line: str) -> bool:
+        return self.stop_early and self.decision is not None and line.strip().startswith(self._STOP_MARKERS)
+
+    def _may_become_stop_line(self, partial: str) -> bool:
+        if not self.stop_early or self.decision is None:
+            return False
+        stripped = partial.lstrip()
+        return any(marker.startswith(stripped) or stripped.startswith(marker) for marker in self._STOP_MARKERS)
+
+    def _handle_line(self, line: str):
+        match = self._DECISION.match(line.strip())
+        if match and self.decision is None:
+            self.decision = match.group(1).strip()
+            self.status = "insufficient" if "Insufficient Information" in self.decision else "sufficient"
+            # an approval or denial never carries questions, nothing left to wait for
+            if self.stop_early and self.status == "sufficient":
+                self.complete = True
+            return
+
+        if line.strip().startswith("Clarifying Questions:"):
+            self._in_questions = True
+        elif self._in_questions and line.strip():
+            self.questions.append(line.strip())
+
+    def feed(self, token: str) -> str:
+        # consumes a token, returns the part of it that is safe to display
+        if self.complete:
+            return ""
+
+        shown = []
+        self._line += token
+        while "\n" in self._line and not self.complete:
+            line, self._line = self._line.split("\n", 1)
+            if self._is_stop_line(line):
+                self.complete = True
+                self._line = ""
+                break
+            shown.append(line[self._shown:] + "\n")
+            self._shown = 0
+            self.text += line + "\n"
+            self._handle_line(line)
+
+        if not self.complete and not self._may_become_stop_line(self._line):
+            shown.append(self._line[self._shown:])
+            self._shown = len(self._line)
+        return "".join(shown)
+
+    def finish(self) -> str:
+        # flushes the last partial line once the stream has ended
+        if self.complete or not self._line:
+            return ""
+        line, self._line = self._line, ""
+        if self._is_stop_line(line):
+            return ""
+        shown = line[self._shown:]
+        self.text += line
+        self._handle_line(line)
+        return shown
+
+def _generate(prompt: str, model_name: Optional[str], context: Optional[List[int]] = None,
+              stats: Optional[Dict[str, Any]] = None) -> str:
+    backend = get_backend()
+    try:
+        return backend.generate(prompt, model=model_name, context=context, stats=stats)
+    except LLMUnavailableError:
+        # 'ollama run' can't continue an exchange, callers resend the full prompt
+        if context is not None or not config.LLM_SUBPROCESS_FALLBACK or isinstance(backend, SubprocessBackend):
+            raise
+        print("⚠️ Warning: Ollama API unreachable, falling back to 'ollama run'.")
+        return SubprocessBackend().generate(prompt, model=model_name)
+
+def _record_llm(current: Any, stats: Dict[str, Any], elapsed: float, status: Optional[str], ttft: Optional[float] = None) -> Dict[str, Any]:
+    # call metrics, plus the token counts and prompt evaluation time when the
+    # backend reports them (Ollama does in its final message); returns the
+    # prompt tokens and evaluation time for the response
+    prompt_tokens = stats.get("prompt_eval_count")
+    completion_tokens = stats.get("eval_count")
+    prompt_eval = stats["prompt_eval_duration"] / 1e9 if stats.get("prompt_eval_duration") is not None else None
+    count("rag_llm_requests_total", status=status)
+    observe("rag_llm_seconds", elapsed)
+    observe("rag_llm_ttft_seconds", ttft)
+    observe("rag_prompt_tokens", prompt_tokens)
+    observe("rag_completion_tokens", completion_tokens)
+    observe("rag_prompt_eval_seconds", prompt_eval)
+    current.set(status=status, ttft_s=ttft, prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens, prompt_eval_s=prompt_eval)
+    return {"prompt_tokens": prompt_tokens, "prompt_eval_time": prompt_eval}
+
+def query_llm_with_context(user_query: str, context_nodes: List["TextNode"], model_name: Optional[str] = None,
+                           conversation: Optional[Any] = None) -> Dict[str, Any]:
+    # with a conversation (see conversation.ConversationState), a follow-up
+    # turn continues the previous exchange instead of resending everything
+    prompt, context = _turn_prompt(user_query, context_nodes, conversation)
+    stats: Dict[str, Any] = {}
+
+    start = time.perf_counter()
+    with span("llm", streaming=False, continued=context is not None) as current:
+        try:
+            try:
+                raw_output = _generate(prompt, model_name, context, stats)
+            except LLMError:
+                if context is None:
+                    raise
+                # the backend lost the exchange (restart, fallback), start over
+                context = None
+                raw_output = _generate(build_prompt(user_query, context_nodes), model_name, None, stats)
+            if conversation is not None:
+                conversation.remember(context_nodes, stats.get("context"), continued=context is not None)
+            response = parse_llm_output(raw_output)
+
+        except LLMError as e:
+            error_message = f"❌ LLM Error: {e}"
+            response = {"status": "error", "answer": error_message, "questions": []}
+        response.update(_record_llm(current, stats, time.perf_counter() - start, response["status"]))
+    return response
+
+def _stream(prompt: str, model_name: Optional[str], stats: Dict[str, Any], context: Optional[List[int]] = None):
+    backend = get_backend()
+    stream = backend.stream(prompt, model=model_name, stats=stats, context=context)
+    try:
+        first = next(stream, None)
+    except LLMUnavailableError:
+        if context is not None or not config.LLM_SUBPROCESS_FALLBACK or isinstance(backend, SubprocessBackend):
+            raise
+        print("⚠️ Warning: Ollama API unreachable, falling back to 'ollama run'.")
+        stream = SubprocessBackend().stream(prompt, model=model_name, stats=stats)
+        first = next(stream, None)
+    return first, stream
+
+def stream_llm_with_context(
+    user_query: str,
+    context_nodes: List["TextNode"],
+    on_token: Optional[Callable[[str], None]] = None,
+    model_name: Optional[str] = None,
+    stop_early: Optional[bool] = None,
+    conversation: Optional[Any] = None,
+) -> Dict[str, Any]:
+    # same result as query_llm_with_context, but hands displayable text to
+    # on_token while the reply is generated and reports time-to-first-token
+
+    prompt, context = _turn_prompt(user_query, context_nodes, conversation)
+    if stop_early is None:
+        stop_early = config.STREAM_STOP_EARLY
+    # the context handle only comes with the end of the reply; a conversation
+    # that can be continued needs it after "Insufficient Information", the one
+    # verdict that leads to another turn
+    read_to_end = conversation is not None and get_backend().supports_context
+    parser = StreamingVerdictParser(stop_early)
+    stats: Dict[str, Any] = {}
+    emit = on_token or (lambda text: None)
+
+    start = time.perf_counter()
+    ttft = None
+    stopped = False
+    with span("llm", streaming=True, continued=context is not None) as current:
+        try:
+            try:
+                first, stream = _stream(prompt, model_name, stats, context)
+            except LLMError:
+                if context is None:
+                    raise
+                # the backend lost the exchange (restart, fallback), start over
+                context = None
+                first, stream = _stream(build_prompt(user_query, context_nodes), model_name, stats)
+            try:
+                token = first
+                while token is not None:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    shown = parser.feed(token)
+                    if shown:
+                        emit(shown)
+                    if parser.complete:
+                        if read_to_end and parser.status == "insufficient":
+                            # the rest is boilerplate that isn't shown
+                            for _ in stream:
+                                pass
+                        else:
+                            stopped = True
+                        break
+                    token = next(stream, None)
+            finally:
+                # stops generation on the backend when we bail out early
+                stream.close()
+            tail = parser.finish()
+            if tail:
+                emit(tail)
+
+        except LLMError as e:
+            error_message = f"❌ LLM Error: {e}"
+            _record_llm(current, stats, time.perf_counter() - start, "error", ttft)
+            return {"status": "error", "answer": error_message, "questions": [], "ttft": ttft}
+
+        if conversation is not None:
+            conversation.remember(context_nodes, stats.get("context"), continued=context is not None)
+        response = parse_llm_output(parser.text)
+        response["ttft"] = ttft
+        response["total_time"] = time.perf_counter() - start
+        response["stopped_early"] = stopped
+        current.set(stopped_early=stopped)
+        response.update(_record_llm(current, stats, response["total_time"], response["status"], ttft))
+    return response
@@ -1,9 +1,18 @@
 import fitz
+import multiprocessing
+import os
 import re
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import unicodedata
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 from . import config
+from .telemetry import say, traced
+
+# workers are spawned, not forked: extraction can start while another thread
+# is loading torch, and a fork at that moment can copy a held lock
+_POOL_CONTEXT = multiprocessing.get_context("spawn")
 
 # NORMALIZATION
 def normalize_ligatures(text: str) -> str:
@@ -24,100 +33,115 @@ def remove_redundant_newlines(text: str) -> str:
 def normalize_unicode(text: str) -> str:
     return unicodedata.normalize('NFKC', text)
 
-# DOCUMENT STRUCTURE    
-def remove_headers_footers(pages_text: List[str]) -> Tuple[List[str], str]:
+# DOCUMENT STRUCTURE
+# --- NEW: Define weights based on line position ---
+# The first line is most likely a header, the 5th line is less likely.
+HEADER_WEIGHTS = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5]
+FOOTER_WEIGHTS = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0] # Reversed for footers
+
+def normalize_line_for_comparison(line: str) -> str:
+    line_no_digits = re.sub(r'\d+', '', line)
+    return line_no_digits.lower().strip()
+
+def count_header_footer_candidates(text: str, header_counts: Counter, footer_counts: Counter):
     """
-    Identifies common headers/footers using a weighted scoring model,
-    removes them, and returns the cleaned pages and document context.
+    Step 1 for a single page: counts the top and bottom lines as potential
+    headers/footers, keyed by (line, position_index).
     """
-    def normalize_line_for_comparison(line: str) -> str:
-        line_no_digits = re.sub(r'\d+', '', line)
-        return line_no_digits.lower().strip()
-
-    # --- NEW: Define weights based on line position ---
-    # The first line is most likely a header, the 5th line is less likely.
-    header_weights = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5]
-    footer_weights = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0] # Reversed for footers
-    
-    # --- Step 1: Identify potential common lines ---
-    # We store the line and its position (weight index)
-    potential_headers = []
-    potential_footers = []
-    for text in pages_text:
-        lines = [line for line in text.split('\n') if line.strip()]
-        if not lines:
-            continue
-            
-        # Check top lines for headers
-        for i in range(min(len(lines), len(header_weights))):
-            normalized_line = normalize_line_for_comparison(lines[i])
-            potential_headers.append((normalized_line, i)) # Store (line, position_index)
-            
-        # Check bottom lines for footers
-        for i in range(min(len(lines), len(footer_weights))):
-            line_index_from_bottom = len(lines) - 1 - i
-            normalized_line = normalize_line_for_comparison(lines[line_index_from_bottom])
-            potential_footers.append((normalized_line, i)) # Store (line, position_index)
-
-    header_counts = Counter(potential_headers)
-    footer_counts = Counter(potential_footers)
+    lines = [line for line in text.split('\n') if line.strip()]
+    if not lines:
+        return
+        
+    # Check top lines for headers
+    for i in range(min(len(lines), len(HEADER_WEIGHTS))):
+        normalized_line = normalize_line_for_comparison(lines[i])
+        header_counts[(normalized_line, i)] += 1
+        
+    # Check bottom lines for footers
+    for i in range(min(len(lines), len(FOOTER_WEIGHTS))):
+        line_index_from_bottom = len(lines) - 1 - i
+        normalized_line = normalize_line_for_comparison(lines[line_index_from_bottom])
+        footer_counts[(normalized_line, i)] += 1
 
-    # --- Step 2: Determine common lines using weighted threshold ---
-    base_min_occurrence = int(len(pages_text) * 0.40) # Base threshold: 40%
-    if base_min_occurrence < 2 and len(pages_text) > 1:
+def find_common_lines(header_counts: Counter, footer_counts: Counter, page_count: int) -> Tuple[Set[str], Set[str]]:
+    """
+    Step 2: determines common header/footer lines using a weighted threshold.
+    """
+    base_min_occurrence = int(page_count * 0.40) # Base threshold: 40%
+    if base_min_occurrence < 2 and page_count > 1:
         base_min_occurrence = 2
 
     common_headers = set()
     for (line, pos_index), count in header_counts.items():
-        weight = header_weights[pos_index]
+        weight = HEADER_WEIGHTS[pos_index]
         # A line further down the page (lower weight) needs to appear more often
         if count >= (base_min_occurrence / weight):
             common_headers.add(line)
 
     common_footers = set()
     for (line, pos_index), count in footer_counts.items():
-        weight = footer_weights[pos_index]
+        weight = FOOTER_WEIGHTS[pos_index]
         if count >= (base_min_occurrence / weight):
             common_footers.add(line)
 
+    return common_headers, common_footers
+
+def strip_headers_footers(text: str, common_headers: Set[str], common_footers: Set[str]) -> Tuple[str, List[str]]:
+    """
+    Step 3 for a single page: returns the page without its header/footer
+    section, and the header lines that were found on it.
+    """
+    lines = text.split('\n')
+    
+    # Find end of header section
+    header_end_index = 0
+    current_header_lines = []
+    for i, line in enumerate(lines):
+        normalized_line = normalize_line_for_comparison(line)
+        if line.strip() and normalized_line in common_headers:
+            current_header_lines.append(line)
+        # Stop if we hit a line that is not a common header
+        elif line.strip() and normalized_line not in common_headers:
+            header_end_index = i
+            break
+
+    # Find start of footer section (from the bottom up)
+    footer_start_index = len(lines)
+    for i in range(len(lines) - 1, -1, -1):
+        normalized_line = normalize_line_for_comparison(lines[i])
+        if line.strip() and normalized_line not in common_footers:
+            footer_start_index = i + 1
+            break
+    
+    # Combine the lines that are between the header and footer
+    if header_end_index < footer_start_index:
+        cleaned_page_lines = lines[header_end_index:footer_start_index]
+        return '\n'.join(cleaned_page_lines), current_header_lines
+    return text, current_header_lines # Failsafe
+
+def remove_headers_footers(pages_text: List[str]) -> Tuple[List[str], str]:
+    """
+    Identifies common headers/footers using a weighted scoring model,
+    removes them, and returns the cleaned pages and document context.
+    """
+    # --- Step 1: Identify potential common lines ---
+    header_counts = Counter()
+    footer_counts = Counter()
+    for text in pages_text:
+        count_header_footer_candidates(text, header_counts, footer_counts)
+
+    # --- Step 2: Determine common lines using weighted threshold ---
+    common_headers, common_footers = find_common_lines(header_counts, footer_counts, len(pages_text))
+
     # --- Step 3: Extract first header and clean all pages ---
     first_header_instance = []
     cleaned_pages = []
-    is_first_header_captured = False
 
     for text in pages_text:
-        lines = text.split('\n')
-        
-        # Find end of header section
-        header_end_index = 0
-        current_header_lines = []
-        for i, line in enumerate(lines):
-            normalized_line = normalize_line_for_comparison(line)
-            if line.strip() and normalized_line in common_headers:
-                current_header_lines.append(line)
-            # Stop if we hit a line that is not a common header
-            elif line.strip() and normalized_line not in common_headers:
-                header_end_index = i
-                break
-        
-        if not is_first_header_captured and current_header_lines:
+        cleaned_text, current_header_lines = strip_headers_footers(text, common_headers, common_footers)
+        if not first_header_instance and current_header_lines:
             first_header_instance = current_header_lines
-            is_first_header_captured = True
-
-        # Find start of footer section (from the bottom up)
-        footer_start_index = len(lines)
-        for i in range(len(lines) - 1, -1, -1):
-            normalized_line = normalize_line_for_comparison(lines[i])
-            if line.strip() and normalized_line not in common_footers:
-                footer_start_index = i + 1
-                break
-        
-        # Combine the lines that are between the header and footer
-        if header_end_index < footer_start_index:
-            cleaned_page_lines = lines[header_end_index:footer_start_index]
-            cleaned_pages.append('\n'.join(cleaned_page_lines))
-        else:
-            cleaned_pages.append(text) # Failsafe
+        cleaned_pages.append(cleaned_text)
         
     doc_context = '\n'.join(first_header_instance)
     return cleaned_pages, doc_context
@@ -130,39 +154,178 @@ def clean_text_pipeline(text: str) -> str:
     text = remove_redundant_newlines(text)
     return text
 
-def extract_and_clean_pdf(pdf_path) -> Dict[str, Any]:
-    print(f"\nStarting processing for: {pdf_path}")
-    
-    try:
-        doc = fitz.open(pdf_path)
-    except Exception as e:
-        print(f"Error opening PDF file: {e}")
-        return {}
-    
-    raw_pages_text = [page.get_text("text") for page in doc]
-    print(f"✅ Extracted {len(raw_pages_text)} pages.")
-
-    structurally_cleaned_pages, doc_context = remove_headers_footers(raw_pages_text)
-    print("✅ Identified document context and removed headers/footers using weighted scoring.")
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    # worker: every process opens its own fitz handle, documents can't be shared
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text("text") for i in range(start, end)]
 
-    final_pages_data = []
-    for i, page_text in enumerate(structurally_cleaned_pages):
-        page_num = i + 1
+def _clean_pages(pages: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    # worker: text normalization for a batch of (page_number, text) pairs
+    cleaned = []
+    for page_num, page_text in pages:
         processed_text = clean_text_pipeline(page_text)
         normalized_page_text = normalize_whitespace(processed_text)
         
         if normalized_page_text:
-            final_pages_data.append({
+            cleaned.append({
                 "page_number": page_num,
                 "text": normalized_page_text
             })
+    return cleaned
+
+def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    # a few ranges per worker so one slow range doesn't leave the others idle
+    step = max(1, -(-page_count // (workers * 4)))
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = config.LOADER_WORKERS
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+@traced("extract")
+def extract_and_clean_pdf(pdf_path, workers: Optional[int] = None) -> Dict[str, Any]:
+    say(f"\nStarting processing for: {pdf_path}")
     
-    print("✅ Applied text normalization and cleaning pipeline to all pages.")
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"Error opening PDF file: {e}")
+        return {}
+
+    workers = min(_resolve_workers(workers), len(doc))
+    parallel = workers > 1 and len(doc) >= config.PARALLEL_MIN_PAGES
+
+    if not parallel:
+        raw_pages_text = [page.get_text("text") for page in doc]
+        doc.close()
+        say(f"✅ Extracted {len(raw_pages_text)} pages.")
+
+        structurally_cleaned_pages, doc_context = remove_headers_footers(raw_pages_text)
+        say("✅ Identified document context and removed headers/footers using weighted scoring.")
+
+        final_pages_data = _clean_pages(list(enumerate(structurally_cleaned_pages, start=1)))
+    else:
+        ranges = _page_ranges(len(doc), workers)
+        doc.close()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as pool:
+            # extraction runs per page range, merged back in page order
+            raw_pages_text = []
+            for range_text in pool.map(_extract_page_range, repeat(pdf_path), *zip(*ranges)):
+                raw_pages_text.extend(range_text)
+            say(f"✅ Extracted {len(raw_pages_text)} pages using {workers} processes.")
+
+            # header/footer detection needs statistics from every page, so it runs once here
+            structurally_cleaned_pages, doc_context = remove_headers_footers(raw_pages_text)
+            say("✅ Identified document context and removed headers/footers using weighted scoring.")
+
+            numbered_pages = list(enumerate(structurally_cleaned_pages, start=1))
+            batches = [numbered_pages[start:end] for start, end in ranges]
+            final_pages_data = []
+            for cleaned in pool.map(_clean_pages, batches):
+                final_pages_data.extend(cleaned)
+    
+    say("✅ Applied text normalization and cleaning pipeline to all pages.")
     
     result = {
         "doc_context": clean_text_pipeline(doc_context),
         "pages": final_pages_data
     }
     
-    print("✅ Processing complete.\n")
+    say("✅ Processing complete.\n")
     return result
+
+def _page_head(text: str) -> Tuple[str, bool]:
+    # the top of a page, enough to find its header lines once the common
+    # headers are known, and whether the page goes on past it
+    lines = text.split('\n')
+    seen = 0
+    for i, line in enumerate(lines):
+        if line.strip():
+            seen += 1
+            if seen > len(HEADER_WEIGHTS):
+                return '\n'.join(lines[:i + 1]), True
+    return text, False
+
+def _count_candidates_range(pdf_path: str, start: int, end: int) -> Tuple[Counter, Counter, List[Tuple[str, bool]]]:
+    # worker: header/footer statistics for a page range, keeping only the
+    # top of each page for the document context
+    header_counts, footer_counts, heads = Counter(), Counter(), []
+    with fitz.open(pdf_path) as doc:
+        for i in range(start, end):
+            text = doc[i].get_text("text")
+            count_header_footer_candidates(text, header_counts, footer_counts)
+            heads.append(_page_head(text))
+    return header_counts, footer_counts, heads
+
+def _strip_and_clean_range(pdf_path: str, start: int, end: int, common_headers: Set[str], common_footers: Set[str]) -> List[Dict[str, Any]]:
+    # worker: re-extracts a page range and returns it fully cleaned
+    with fitz.open(pdf_path) as doc:
+        pages = [(i + 1, strip_headers_footers(doc[i].get_text("text"), common_headers, common_footers)[0]) for i in range(start, end)]
+    return _clean_pages(pages)
+
+def iter_clean_pages(pdf_path: str, workers: Optional[int] = None, after_page: int = -1) -> Iterator[Dict[str, Any]]:
+    # streaming extract_and_clean_pdf: yields the document context (as page
+    # "Document Header") and then one cleaned page at a time; pages up to
+    # after_page are skipped so an interrupted build can resume
+    say(f"\nStarting streaming processing for: {pdf_path}")
+
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"Error opening PDF file: {e}")
+        return
+
+    page_count = len(doc)
+    workers = min(_resolve_workers(workers), max(page_count, 1))
+    parallel = workers > 1 and page_count >= config.PARALLEL_MIN_PAGES
+
+    # --- pass 1: header/footer statistics over every page ---
+    if parallel:
+        ranges = _page_ranges(page_count, workers)
+        header_counts, footer_counts, heads = Counter(), Counter(), []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as pool:
+            for range_headers, range_footers, range_heads in pool.map(_count_candidates_range, repeat(pdf_path), *zip(*ranges)):
+                header_counts.update(range_headers)
+                footer_counts.update(range_footers)
+                heads.extend(range_heads)
+    else:
+        header_counts, footer_counts, heads = _count_candidates_range(pdf_path, 0, page_count)
+    common_headers, common_footers = find_common_lines(header_counts, footer_counts, page_count)
+    say(f"✅ Scanned {page_count} pages for headers/footers.")
+
+    # the document context is the first header instance, usually on page 1,
+    # found in the page tops kept by pass 1
+    if after_page < 0:
+        doc_context = ""
+        for i, (head, truncated) in enumerate(heads):
+            _, header_lines = strip_headers_footers(head, common_headers, common_footers)
+            if header_lines:
+                if truncated and len(header_lines) > len(HEADER_WEIGHTS):
+                    # the header runs on past the kept top of the page
+                    _, header_lines = strip_headers_footers(doc[i].get_text("text"), common_headers, common_footers)
+                doc_context = '\n'.join(header_lines)
+                break
+        yield {"page_number": "Document Header", "text": clean_text_pipeline(doc_context)}
+    doc.close()
+
+    # --- pass 2: clean and yield pages in order ---
+    first_index = max(after_page, 0)
+    if not parallel:
+        with fitz.open(pdf_path) as doc:
+            for i in range(first_index, page_count):
+                page_text = strip_headers_footers(doc[i].get_text("text"), common_headers, common_footers)[0]
+                yield from _clean_pages([(i + 1, page_text)])
+        return
+
+    ranges = _page_ranges(page_count - first_index, workers)
+    ranges = [(start + first_index, end + first_index) for start, end in ranges]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as pool:
+        # only a couple of ranges per worker in flight, so memory stays bounded
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_strip_and_clean_range, pdf_path, start, end, common_headers, common_footers))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,169 @@
+import gc
+import hashlib
+import re
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+from . import config
+
+# models are built on first use instead of at import time, so that starting
+# the CLI (or only reusing a cached index) doesn't pay for loading them
+
+EMBEDDER = "embedder"
+RERANKER = "reranker"
+TOKENIZER = "tokenizer"
+
+class FakeEmbedder:
+    """
+    Deterministic stand-in for the SentenceTransformer, for offline runs,
+    benchmarks and load tests: a hashed bag of words, so texts sharing words
+    get similar vectors.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self._buckets: Dict[str, Any] = {}
+
+    def _bucket(self, word: str):
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            bucket = (int.from_bytes(digest[:4], "little") % self.dimension, 1.0 if digest[4] & 1 else -1.0)
+            self._buckets[word] = bucket
+        return bucket
+
+    def encode(self, sentences: Any, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> Any:
+        import numpy as np
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                column, sign = self._bucket(word)
+                vectors[row, column] += sign
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+class FakeReranker:
+    # stand-in for the CrossEncoder: sigmoid-scaled share of query words in the text
+
+    def predict(self, sentences: Any, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> Any:
+        import numpy as np
+        scores = []
+        for query, text in sentences:
+            query_words = set(re.findall(r"\w+", query.lower()))
+            text_words = set(re.findall(r"\w+", text.lower()))
+            overlap = len(query_words & text_words) / max(len(query_words), 1)
+            scores.append(1.0 / (1.0 + np.exp(-8.0 * (overlap - 0.5))))
+        return np.array(scores, dtype='float32')
+
+class FakeTokenizer:
+    # stand-in for the embedding model's tokenizer: one token per word or
+    # punctuation mark, called like a Hugging Face tokenizer
+
+    def __call__(self, texts: Any, add_special_tokens: bool = True, **kwargs) -> Dict[str, Any]:
+        single = isinstance(texts, str)
+        ids = [list(range(len(re.findall(r"\w+|[^\w\s]", text)))) for text in ([texts] if single else texts)]
+        return {"input_ids": ids[0] if single else ids}
+
+    def num_special_tokens_to_add(self, pair: bool = False) -> int:
+        return 0
+
+def _load_embedder() -> Any:
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(config.EMBED_MODEL)
+
+def _load_tokenizer() -> Any:
+    # the loaded embedder's own tokenizer, or just the tokenizer files, so
+    # chunking doesn't load the model weights
+    if EMBEDDER in _models:
+        return _models[EMBEDDER].tokenizer
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(config.EMBED_MODEL)
+
+def _load_reranker() -> Any:
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(config.RERANKER_MODEL)
+
+_LOADERS: Dict[str, Callable[[], Any]] = {
+    EMBEDDER: _load_embedder,
+    RERANKER: _load_reranker,
+    TOKENIZER: _load_tokenizer,
+}
+
+_models: Dict[str, Any] = {}
+# one lock per model so a warm-up of the reranker doesn't block the embedder
+_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in _LOADERS}
+
+def get_model(name: str) -> Any:
+    # returns a loaded model, building it on first use
+
+    if name not in _LOADERS:
+        raise ValueError(f"Unknown model: {name}")
+
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _locks[name]:
+        model = _models.get(name)
+        if model is None:
+            model = _LOADERS[name]()
+            _models[name] = model
+    return model
+
+def get_embedder() -> Any:
+    return get_model(EMBEDDER)
+
+def get_reranker() -> Any:
+    return get_model(RERANKER)
+
+def get_tokenizer() -> Any:
+    return get_model(TOKENIZER)
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+def warm_up(names: Iterable[str] = (EMBEDDER, RERANKER), background: bool = True) -> Optional[threading.Thread]:
+    # loads models ahead of time, by default in a daemon thread so the
+    # user can keep typing while they load
+
+    def _load_all():
+        for name in names:
+            try:
+                get_model(name)
+            except Exception as e:
+                print(f"⚠️ Warning: Could not warm up {name} model. Reason: {e}")
+
+    if not background:
+        _load_all()
+        return None
+
+    thread = threading.Thread(target=_load_all, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def unload(name: Optional[str] = None):
+    # releases one model (or all of them) so they stop holding memory
+
+    names = list(_LOADERS) if name is None else [name]
+    for model_name in names:
+        with _locks[model_name]:
+            _models.pop(model_name, None)
+    gc.collect()
+
+    # only touch torch if something already imported it
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def use_fake_models(dimension: int = 384):
+    # swaps the models and the tokenizer for the deterministic fakes above;
+    # the model names change too, so their vectors and scores never mix with
+    # real ones in the embedding store, the score caches or a built index
+    unload()
+    config.EMBED_MODEL = f"fake-embedder-{dimension}"
+    config.RERANKER_MODEL = "fake-reranker"
+    _LOADERS[EMBEDDER] = lambda: FakeEmbedder(dimension)
+    _LOADERS[RERANKER] = FakeReranker
+    _LOADERS[TOKENIZER] = FakeTokenizer
@@ -1,61 +1,223 @@
+import hashlib
+import json
 import os
 import pickle
-import faiss
-from typing import List, Any
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional
 from . import config
+from .telemetry import say, span
+
+# faiss is imported inside the functions that need it so the CLI can
+# resolve cache paths without paying for the import at startup
+
+try:
+    import fcntl
+except ImportError:
+    # no fcntl on Windows: document locks only hold within one process
+    fcntl = None
+
+def _safe_file_name(file_path: str) -> str:
+    base_name = os.path.basename(file_path)
+    return "".join(c for c in base_name if c.isalnum() or c in (' ', '.', '_')).rstrip()
+
+def file_digest(file_path: str) -> str:
+    # sha256 of the file contents, hashed again only when the file's size or
+    # mtime changed
+    stat = os.stat(file_path)
+    return _file_digest(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+@lru_cache(maxsize=256)
+def _file_digest(file_path: str, size: int, mtime_ns: int) -> str:
+    # read in blocks; size and mtime_ns are only part of the cache key
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
 def get_cache_path(file_path: str) -> str:
     # create safe directory path based on input file
+    # keyed by content hash, so same-named files never collide and a new
+    # version of a document gets its own cache
 
-    base_name = os.path.basename(file_path)
-    file_name_safe = "".join(c for c in base_name if c.isalnum() or c in (' ', '.', '_')).rstrip()
-    cache_dir_name = f"{file_name_safe}_cache"
+    cache_dir_name = f"{_safe_file_name(file_path)}_{file_digest(file_path)[:16]}_cache"
     return os.path.join(config.CACHED_DIR, cache_dir_name)
 
-def save_data(cache_path: str, file_name: str, data: Any, serializer: str = 'pickle'):
+# cache path -> lock between the threads of this process; flock covers other processes
+_document_locks: Dict[str, threading.Lock] = {}
+_document_locks_guard = threading.Lock()
+
+@contextmanager
+def document_lock(cache_path: str) -> Iterator[None]:
+    # exclusive lock on one document's cache for the length of a build, so two
+    # sessions (or two indexer workers) never build into the same directory
+    key = os.path.abspath(cache_path)
+    with _document_locks_guard:
+        lock = _document_locks.setdefault(key, threading.Lock())
+    name = os.path.basename(cache_path)
+    if not lock.acquire(blocking=False):
+        say(f"⏳ {name} is being built by another worker, waiting for it...")
+        lock.acquire()
+    try:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        lock_path = f"{key}.lock"
+        while True:
+            f = open(lock_path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                say(f"⏳ {name} is being built by another session, waiting for it...")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            # the holder removes the file on release, so a lock taken on a
+            # file that is no longer the one at lock_path doesn't count
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(lock_path)):
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            yield
+        finally:
+            # removed while still held, so no one can lock it in between
+            os.remove(lock_path)
+            f.close()
+    finally:
+        lock.release()
+
+def find_previous_cache(file_path: str, is_complete: Callable[[str], bool], exclude: Optional[str] = None) -> Optional[str]:
+    # most recent cache of another version of a same-named file; is_complete
+    # decides which of the same-named caches qualify
+
+    current = exclude or get_cache_path(file_path)
+    pattern = re.compile(re.escape(_safe_file_name(file_path)) + r"_[0-9a-f]{16}_cache")
+    if not os.path.isdir(config.CACHED_DIR):
+        return None
+
+    candidates = []
+    for entry in os.listdir(config.CACHED_DIR):
+        path = os.path.join(config.CACHED_DIR, entry)
+        if pattern.fullmatch(entry) and path != current and is_complete(path):
+            candidates.append((os.path.getmtime(path), path))
+    return max(candidates)[1] if candidates else None
+
+def save_data(cache_path: str, file_name: str, data: Any, serializer: str = 'pickle', verbose: bool = True):
     # saves data using specified serializer in a specified dir
-    
+    import faiss
+
     os.makedirs(cache_path, exist_ok=True)
     full_path = os.path.join(cache_path, file_name)
 
-    print(f"💾 Saving {file_name} to {full_path}...")
-    try:
-        if serializer == 'pickle':
-            with open(full_path, 'wb') as f:
-                pickle.dump(data, f)
-        elif serializer == 'faiss':
-            faiss.write_index(data, full_path)
-        else:
-            raise ValueError(f"Unknown serializer: {serializer}")
-    except (IOError, PermissionError) as e:
-        print(f"❌ Error: Could not write to {full_path}. Reason: {e}")
-    except Exception as e:
-        print(f"❌ An unexpected error occurred while saving {file_name}: {e}")
-    print("✅ Save complete.\n")
+    # write to a temp file and swap it in, so readers that memory-mapped
+    # the previous version never see a half-written file
+    tmp_path = f"{full_path}.tmp"
 
-def load_data(cache_path: str, file_name: str, serializer: str = 'pickle') -> Any:
+    if verbose:
+        say(f"💾 Saving {file_name} to {full_path}...")
+    with span("save", file=file_name, serializer=serializer):
+        try:
+            if serializer == 'pickle':
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(data, f)
+            elif serializer == 'faiss':
+                faiss.write_index(data, tmp_path)
+            elif serializer == 'json':
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+            elif serializer == 'raw':
+                with open(tmp_path, 'wb') as f:
+                    f.write(data.tobytes())
+            else:
+                raise ValueError(f"Unknown serializer: {serializer}")
+            os.replace(tmp_path, full_path)
+        except (IOError, PermissionError) as e:
+            print(f"❌ Error: Could not write to {full_path}. Reason: {e}")
+        except Exception as e:
+            print(f"❌ An unexpected error occurred while saving {file_name}: {e}")
+    if verbose:
+        say("✅ Save complete.\n")
+
+def _faiss_mmap_flags(full_path: str) -> int:
+    import faiss
+    # IO_FLAG_MMAP maps IVF inverted lists, IO_FLAG_MMAP_IFC maps flat codes
+    # (newer faiss only); IVF indexes fail to load with both set, so pick one
+    # from the index fourcc, IVF ones start with "Iw"
+    with open(full_path, 'rb') as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b"Iw") or not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+def load_data(cache_path: str, file_name: str, serializer: str = 'pickle', mmap: bool = False, verbose: bool = True) -> Any:
     # loads data from specified serializer within a given dir
-    
+    # mmap=True maps faiss indexes read-only instead of copying them into RAM
+    import faiss
+
     full_path = os.path.join(cache_path, file_name)
 
     if not os.path.exists(full_path):
         raise FileNotFoundError(f"Cache file not found: {full_path}")
 
-    print(f"\n📂 Loading {file_name} from {full_path}...")
-    try:
+    if verbose:
+        say(f"\n📂 Loading {file_name} from {full_path}...")
+    with span("load", file=file_name, serializer=serializer):
+        try:
+            if serializer == 'pickle':
+                with open(full_path, 'rb') as f:
+                    return pickle.load(f)
+            elif serializer == 'pickle_frames':
+                return _load_pickle_frames(full_path)
+            elif serializer == 'json':
+                with open(full_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            elif serializer == 'faiss':
+                if mmap:
+                    return faiss.read_index(full_path, _faiss_mmap_flags(full_path))
+                return faiss.read_index(full_path)
+            else:
+                raise ValueError(f"Unknown serializer: {serializer}")
+        except (pickle.UnpicklingError, json.JSONDecodeError, faiss.FaissException) as e:
+            print(f"⚠️ Warning: Could not load corrupted cache file '{file_name}'. Reason: {e}")
+            return None
+        except Exception as e:
+            print(f"❌ An unexpected error occurred while loading {file_name}: {e}")
+            return None
+
+def _load_pickle_frames(full_path: str) -> List[Any]:
+    # a file of appended pickled lists, read back as one list; a plain
+    # single-list pickle is just the one-frame case
+    items = []
+    with open(full_path, 'rb') as f:
+        while True:
+            try:
+                items.extend(pickle.load(f))
+            except EOFError:
+                return items
+
+def append_data(cache_path: str, file_name: str, data: Any, serializer: str = 'pickle') -> int:
+    # appends one batch to a growing cache file and flushes it to disk,
+    # returns the file size after the write
+    # 'pickle' appends a pickle frame (read back with 'pickle_frames'),
+    # 'raw' appends the bytes of a numpy array
+
+    os.makedirs(cache_path, exist_ok=True)
+    full_path = os.path.join(cache_path, file_name)
+    with open(full_path, 'ab') as f:
         if serializer == 'pickle':
-            with open(full_path, 'rb') as f:
-                return pickle.load(f)
-        elif serializer == 'faiss':
-            return faiss.read_index(full_path)
+            pickle.dump(data, f)
+        elif serializer == 'raw':
+            f.write(data.tobytes())
         else:
             raise ValueError(f"Unknown serializer: {serializer}")
-    except (pickle.UnpicklingError, faiss.FaissException) as e:
-        print(f"⚠️ Warning: Could not load corrupted cache file '{file_name}'. Reason: {e}")
-        return None
-    except Exception as e:
-        print(f"❌ An unexpected error occurred while loading {file_name}: {e}")
-        return None
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
 
 def cache_exists(cache_path: str, files: List[str]) -> bool:
     # check if cached files exist
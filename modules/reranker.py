@@ -0,0 +1,143 @@
+"""
+Cross-encoder reranking with a score cache and adaptive candidate pruning.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from . import config
+from .models import get_reranker
+from .telemetry import count, span
+
+_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+_lock = threading.Lock()
+
+def normalize_query(query: str) -> str:
+    # case, spacing and trailing punctuation don't change what is asked
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+def chunk_id(node: Any) -> str:
+    return hashlib.sha1(node.get_content().encode("utf-8")).hexdigest()
+
+def _cache_get(key: Tuple[str, str, str]) -> Optional[float]:
+    with _lock:
+        score = _cache.get(key)
+        if score is not None:
+            _cache.move_to_end(key)
+        return score
+
+def _cache_put(key: Tuple[str, str, str], score: float):
+    with _lock:
+        _cache[key] = score
+        _cache.move_to_end(key)
+        while len(_cache) > max(config.RERANK_CACHE_SIZE, 0):
+            _cache.popitem(last=False)
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+def _settled(scores: Dict[int, float], bi_scores: Sequence[float], remaining: List[int], top_n: int) -> bool:
+    # True when no unscored candidate can still enter the top_n
+    if len(scores) < top_n:
+        return False
+    top = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    best_remaining = max(bi_scores[i] for i in remaining)
+    return best_remaining < min(bi_scores[i] for i in top) - config.RERANK_MARGIN
+
+def score_candidates(query: str, nodes: Sequence[Any], top_n: int, bi_scores: Optional[Sequence[float]] = None,
+                     stats: Optional[Dict[str, Any]] = None) -> Dict[int, float]:
+    # cross-encoder scores by node position, for every node that had to be
+    # scored to settle the top_n; pruned nodes are missing
+    # bi_scores are the retrieval similarities of the nodes; adaptive pruning
+    # is only possible with them. stats, when given, receives the rerank time
+    # and how many pairs were scored, served from the cache or skipped
+
+    start = time.perf_counter()
+    model_name = config.RERANKER_MODEL
+    normalized = normalize_query(query)
+    keys = [(normalized, chunk_id(node), model_name) for node in nodes]
+
+    scores: Dict[int, float] = {}
+    for i, key in enumerate(keys):
+        score = _cache_get(key)
+        if score is not None:
+            scores[i] = score
+    cached = len(scores)
+
+    pending = [i for i in range(len(nodes)) if i not in scores]
+    adaptive = config.RERANK_ADAPTIVE and bi_scores is not None
+    if adaptive:
+        pending.sort(key=lambda i: bi_scores[i], reverse=True)
+    batch_size = max(config.RERANK_BATCH_SIZE, 1) if adaptive else max(len(pending), 1)
+
+    scored = 0
+    with span("rerank", candidates=len(nodes), cached=cached, adaptive=adaptive) as current:
+        while pending:
+            if adaptive and _settled(scores, bi_scores, pending, top_n):
+                break
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            predictions = get_reranker().predict([[query, nodes[i].get_content()] for i in batch])
+            for i, score in zip(batch, predictions):
+                scores[i] = float(score)
+                _cache_put(keys[i], scores[i])
+            scored += len(batch)
+        current.set(scored=scored, skipped=len(pending))
+
+    count("rag_rerank_pairs_total", scored, outcome="scored")
+    count("rag_rerank_pairs_total", cached, outcome="cached")
+    count("rag_rerank_pairs_total", len(pending), outcome="skipped")
+    if stats is not None:
+        stats["rerank_time"] = time.perf_counter() - start
+        stats["pairs_scored"] = scored
+        stats["pairs_cached"] = cached
+        stats["pairs_skipped"] = len(pending)
+    return scores
+
+def rerank(query: str, nodes: Sequence[Any], top_n: int, bi_scores: Optional[Sequence[float]] = None,
+           stats: Optional[Dict[str, Any]] = None) -> List[Tuple[float, Any]]:
+    # returns the top_n (score, node) pairs, best first
+    scores = score_candidates(query, nodes, top_n, bi_scores=bi_scores, stats=stats)
+    ranked = sorted(((score, nodes[i]) for i, score in scores.items()), key=lambda pair: pair[0], reverse=True)
+    return ranked[:top_n]
+
+def score_many(requests: Sequence[Tuple[str, Sequence[Any]]], stats: Optional[Dict[str, Any]] = None) -> List[List[float]]:
+    # scores every (query, nodes) request in large cross-encoder batches
+    # shared by all of them, for batch runs where latency per query matters
+    # less than throughput; returns the scores of each request's nodes
+
+    start = time.perf_counter()
+    model_name = config.RERANKER_MODEL
+    results: List[List[Optional[float]]] = []
+    pending: List[Tuple[int, int, Tuple[str, str, str], str, str]] = []
+    for r, (query, nodes) in enumerate(requests):
+        normalized = normalize_query(query)
+        row: List[Optional[float]] = []
+        for n, node in enumerate(nodes):
+            key = (normalized, chunk_id(node), model_name)
+            score = _cache_get(key)
+            row.append(score)
+            if score is None:
+                pending.append((r, n, key, query, node.get_content()))
+        results.append(row)
+
+    total = sum(len(nodes) for _, nodes in requests)
+    batch_size = max(config.RERANK_MAX_BATCH_SIZE, 1)
+    with span("rerank_many", requests=len(requests), pairs=total, scored=len(pending)):
+        for begin in range(0, len(pending), batch_size):
+            batch = pending[begin:begin + batch_size]
+            predictions = get_reranker().predict([[query, text] for _, _, _, query, text in batch], batch_size=batch_size)
+            for (r, n, key, _, _), score in zip(batch, predictions):
+                results[r][n] = float(score)
+                _cache_put(key, float(score))
+
+    count("rag_rerank_pairs_total", len(pending), outcome="scored")
+    count("rag_rerank_pairs_total", total - len(pending), outcome="cached")
+    if stats is not None:
+        stats["rerank_time"] = time.perf_counter() - start
+        stats["pairs_scored"] = len(pending)
+        stats["pairs_cached"] = total - len(pending)
+        stats["pairs_skipped"] = 0
+    return results
@@ -1,49 +1,201 @@
 import faiss
 import numpy as np
-from typing import List
-from llama_index.core.schema import TextNode
-from sentence_transformers import CrossEncoder
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
 from . import config
-from .persistence import load_data
-from .embedder import model as embedding_model
+from . import corpus, lexical
+from .embedder import is_exact, rescore
+from .index_registry import get_chunks, get_index, get_vectors
+from .models import get_embedder
+from .reranker import rerank
+from .telemetry import count, say, span, traced
 
-reranker_model = CrossEncoder(config.RERANKER_MODEL)
+if TYPE_CHECKING:
+    from llama_index.core.schema import TextNode
 
-def retrieve_top_k_chunks(query: str, cache_path: str) -> List[TextNode]:
+RETRIEVAL_MODES = ("dense", "hybrid")
+
+def _search_documents(query_embedding: np.ndarray, cache_paths: Sequence[str], k: int) -> List[Tuple[float, str, int]]:
+    # a selection of several documents is searched in the corpus index,
+    # filtered to their ids; a single document, or a selection that isn't all
+    # in the corpus yet, through the documents' own indexes
+
+    # approximate indexes return a longer shortlist for exact re-scoring
+
+    if len(cache_paths) > 1:
+        hits = corpus.search(query_embedding, k, cache_paths=cache_paths)
+        if hits:
+            return hits
+    hits = []
+    for cache_path in cache_paths:
+        index, nodes = get_index(cache_path)
+        if index is None or nodes is None:
+            raise ValueError(f"Could not load the index in {cache_path}. Try 'rebuild'.")
+        fetch = k if is_exact(index) else k * config.RESCORE_FACTOR
+        scores, ids = index.search(query_embedding, min(fetch, index.ntotal))
+        hits.extend((float(score), cache_path, int(i)) for score, i in zip(scores[0], ids[0]) if i >= 0)
+    hits.sort(key=lambda hit: hit[0], reverse=True)
+    return hits
+
+def _exact_scores(query_embedding: np.ndarray, keys: Sequence[Tuple[str, int]]) -> Dict[Tuple[str, int], float]:
+    # exact inner products for (cache_path, position) keys against each
+    # document's stored float32 vectors; documents without them are left out
+
+    positions: Dict[str, List[int]] = {}
+    for cache_path, position in keys:
+        positions.setdefault(cache_path, []).append(position)
+
+    exact: Dict[Tuple[str, int], float] = {}
+    for cache_path, doc_positions in positions.items():
+        vectors = get_vectors(cache_path, query_embedding.shape[1])
+        if vectors is None:
+            continue
+        for position, score in zip(doc_positions, rescore(query_embedding, vectors, doc_positions)):
+            exact[(cache_path, position)] = float(score)
+    return exact
+
+def _rescore_hits(query_embedding: np.ndarray, hits: List[Tuple[float, str, int]], k: int) -> List[Tuple[float, str, int]]:
+    # replaces approximate scores with exact inner products against each
+    # document's stored float32 vectors and keeps the best k
+
+    exact = _exact_scores(query_embedding, [(path, position) for _, path, position in hits])
+    rescored = [(exact.get((path, position), score), path, position) for score, path, position in hits]
+    rescored.sort(key=lambda hit: hit[0], reverse=True)
+    return rescored[:k]
+
+def hit_nodes(hits: Sequence[Tuple[float, str, int]]) -> List["TextNode"]:
+    # the chunks of (score, cache_path, position) hits, opening each
+    # document's chunk store once
+    stores = {}
+    for _, path, _ in hits:
+        if path not in stores:
+            stores[path] = get_chunks(path)
+    return [stores[path][position] for _, path, position in hits]
+
+def _lexical_targets(cache_path: Union[str, Sequence[str]]) -> List[str]:
+    return [cache_path] if isinstance(cache_path, str) else list(cache_path)
+
+def _fuse(query_embedding: np.ndarray, dense_hits: List[Tuple[float, str, int]],
+          lexical_hits: List[Tuple[float, float, str, int]], k: int) -> List[Tuple[float, str, int]]:
+    # reciprocal rank fusion of the dense and BM25 rankings, best k first;
+    # chunks only BM25 found get their exact vector similarity, so every hit
+    # carries a bi-encoder score for the reranker
+
+    fused: Dict[Tuple[str, int], float] = {}
+    for ranked in ([(path, position) for _, path, position in dense_hits],
+                   [(path, position) for _, _, path, position in lexical_hits]):
+        for rank, key in enumerate(ranked):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (config.RRF_K + rank + 1)
+    keys = sorted(fused, key=fused.get, reverse=True)[:k]
+
+    similarity = {(path, position): score for score, path, position in dense_hits}
+    missing = [key for key in keys if key not in similarity]
+    if missing:
+        similarity.update(_exact_scores(query_embedding, missing))
+    floor = min(similarity.values(), default=0.0)
+    return [(similarity.get(key, floor), key[0], key[1]) for key in keys]
+
+def embed_query(query: str) -> np.ndarray:
+    # normalized (1, d) float32 query embedding
+    with span("embed_query"):
+        query_embedding = get_embedder().encode([query]).astype('float32')
+        faiss.normalize_L2(query_embedding)
+    return query_embedding
+
+def search_candidates(query_embedding: np.ndarray, cache_path: Union[str, Sequence[str], None],
+                      k: Optional[int] = None, query: Optional[str] = None) -> List[Tuple[float, str, int]]:
+    # the k nearest chunks as (score, cache_path, position) hits, re-scored
+    # exactly when they came from an approximate index
+    # with the query text and RETRIEVAL_MODE "hybrid", the vector hits are fused
+    # with the BM25 hits and k defaults to HYBRID_CANDIDATES instead of TOP_K_INITIAL;
+    # the whole corpus has no BM25 index and is always searched dense
+
+    if config.RETRIEVAL_MODE not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {config.RETRIEVAL_MODE}. Choose from {RETRIEVAL_MODES}.")
+    hybrid = query is not None and cache_path is not None and config.RETRIEVAL_MODE == "hybrid"
+    k = k or (config.HYBRID_CANDIDATES if hybrid else config.TOP_K_INITIAL)
+    fetch = max(k, config.TOP_K_INITIAL) if hybrid else k
+    with span("search", k=k) as current:
+        if cache_path is None:
+            hits = corpus.search(query_embedding, fetch)
+        else:
+            cache_paths = [cache_path] if isinstance(cache_path, str) else list(cache_path)
+            hits = _search_documents(query_embedding, cache_paths, fetch)
+        current.set(shortlist=len(hits))
+        if len(hits) > fetch:
+            with span("rescore", shortlist=len(hits)):
+                hits = _rescore_hits(query_embedding, hits, fetch)
+        if hybrid:
+            with span("lexical_search", k=fetch):
+                lexical_hits = lexical.search(query, _lexical_targets(cache_path), fetch)
+            hits = _fuse(query_embedding, hits, lexical_hits, k)
+    count("rag_retrieval_total", mode="hybrid" if hybrid else "dense")
+    return hits
+
+def lexical_fast_path(query: str, cache_path: Union[str, Sequence[str], None],
+                      k: Optional[int] = None) -> Optional[List[Tuple[float, str, int]]]:
+    # the BM25 hits alone when they are decisive: LEXICAL_FAST_PATH is on and
+    # the top TOP_K_FINAL hits each cover LEXICAL_DECISIVE_COVERAGE of the
+    # query terms; the coverage stands in for the vector score
+    # None means the query needs the vector search (always for the whole corpus)
+
+    if not config.LEXICAL_FAST_PATH or config.RETRIEVAL_MODE != "hybrid" or cache_path is None:
+        return None
+    k = k or config.HYBRID_CANDIDATES
+    with span("lexical_search", k=k) as current:
+        hits = lexical.search(query, _lexical_targets(cache_path), k)
+        head = hits[:config.TOP_K_FINAL]
+        decisive = len(head) == config.TOP_K_FINAL and all(coverage >= config.LEXICAL_DECISIVE_COVERAGE for _, coverage, _, _ in head)
+        current.set(decisive=decisive)
+    if not decisive:
+        return None
+    count("rag_retrieval_total", mode="lexical")
+    return [(coverage, path, position) for _, coverage, path, position in hits]
+
+@traced("retrieve")
+def retrieve_top_k_chunks(query: str, cache_path: Union[str, Sequence[str], None], stats: Optional[Dict[str, Any]] = None,
+                          query_embedding: Optional[np.ndarray] = None) -> List["TextNode"]:
     # retrives top K most relevant chunks from cache path
+    # cache_path is one document's cache, a list of them, or None for the whole corpus
+    # stats, when given, receives the reranker timings (see reranker.rerank)
+    # and whether the lexical fast path answered the search
+    # query_embedding skips embedding the query again when the caller has it
+
+    say("\n🔍 Retrieving context for query...\n")
 
-    print(f"\n🔍 Retrieving context for query...\n")
+    # retrieval of first set of chunks
+    say(f"🔄 Stage 1: Retrieving initial candidates ({config.RETRIEVAL_MODE} search)...")
     
     try:
-        index = load_data(cache_path, "faiss.index", serializer='faiss')
-        nodes = load_data(cache_path, "chunks.pkl", serializer='pickle')
+        hits = lexical_fast_path(query, cache_path) if query_embedding is None else None
+        if hits is not None:
+            say("⚡ Lexical match is decisive, skipping the vector search.")
+        else:
+            if query_embedding is None:
+                query_embedding = embed_query(query)
+            hits = search_candidates(query_embedding, cache_path, query=query)
+        initial_candidates = hit_nodes(hits)
     except FileNotFoundError:
         print("❌ Error: Index or chunks file not found. Please build the index first.")
         return None
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        return None
+    if not initial_candidates:
+        return None
 
-    # retrieval of first set of chunks
-    print(f"🔄 Stage 1: Retrieving top {config.TOP_K_INITIAL} initial candidates from vector store...")
-    
-    query_embedding = embedding_model.encode([query]).astype('float32')
-    faiss.normalize_L2(query_embedding)
-    
-    distances, indices = index.search(query_embedding, config.TOP_K_INITIAL)
-    initial_candidates = [nodes[i] for i in indices[0]]
-
-    # re rank initial chunks
-    print(f"🔄 Stage 2: Re-ranking the {len(initial_candidates)} candidates for higher precision...")
-
-    rerank_pairs = [[query, node.get_content()] for node in initial_candidates]
-    
-    # attaching relevance score to chunks
-    scores = reranker_model.predict(rerank_pairs)
-    scored_candidates = list(zip(scores, initial_candidates))
+    # re rank initial chunks; cached pairs are reused and, in adaptive mode,
+    # candidates that can't reach the top are never scored
+    say(f"🔄 Stage 2: Re-ranking the {len(initial_candidates)} candidates for higher precision...")
 
-    scored_candidates.sort(key=lambda x: x[0], reverse=True)
+    rerank_stats: Dict[str, Any] = {} if stats is None else stats
+    rerank_stats["lexical_fast_path"] = query_embedding is None
+    bi_scores = [score for score, _, _ in hits]
+    scored_candidates = rerank(query, initial_candidates, config.TOP_K_FINAL, bi_scores=bi_scores, stats=rerank_stats)
 
     # final chunks
-    final_top_k = config.TOP_K_FINAL
-    final_nodes = [candidate for score, candidate in scored_candidates[:final_top_k]]
+    final_nodes = [candidate for score, candidate in scored_candidates]
     
-    print(f"✅ Re-ranking complete. Selected top {len(final_nodes)} nodes.\n")
+    say(f"✅ Re-ranking complete. Selected top {len(final_nodes)} nodes "
+        f"({rerank_stats['rerank_time']:.2f}s, {rerank_stats['pairs_scored']} scored, "
+        f"{rerank_stats['pairs_cached']} cached, {rerank_stats['pairs_skipped']} skipped).\n")
     return final_nodes
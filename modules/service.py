@@ -0,0 +1,487 @@
+"""
+Multi-user HTTP service over the pipeline, built on asyncio and the standard
+library only.
+
+    POST /index          {"pdf": path, "rebuild": false}
+    POST /query          {"pdf": path | "pdfs": [paths] | "all": true, "query": text}
+    POST /query/stream   same body, answers as NDJSON: {"token"} lines, then {"done": true, ...}
+    GET  /stats
+    GET  /metrics        Prometheus text format (see telemetry)
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import faiss
+import numpy as np
+from . import config
+from . import answer_cache
+from .corpus import add_document
+from .index_registry import is_indexed
+from .indexer import Indexer, build_document, partial_path
+from .llm_interface import answer_sections, stream_llm_with_context
+from .models import get_embedder
+from .persistence import get_cache_path
+from .reranker import score_many
+from .retriever import hit_nodes, search_candidates
+from .telemetry import render_prometheus, span
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher:
+    """
+    Coalesces calls that arrive within `max_wait` seconds of each other into
+    one call of `fn` on the list of their items, run on a dedicated worker
+    thread. `fn` returns one result per item, in order.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_batch: int, max_wait: float, name: str):
+        self.fn = fn
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0 and self._queue.empty():
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), max(timeout, 0)))
+                except asyncio.TimeoutError:
+                    break
+
+            # callers that timed out meanwhile don't need their item computed
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self.fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+def _encode(texts: List[str]) -> List[np.ndarray]:
+    embeddings = get_embedder().encode(texts, batch_size=config.EMBED_BATCH_SIZE).astype('float32')
+    faiss.normalize_L2(embeddings)
+    return list(embeddings)
+
+def _candidates(query_embedding: np.ndarray, target: Union[str, Sequence[str], None], query: str) -> List[Any]:
+    hits = search_candidates(query_embedding.reshape(1, -1), target, query=query)
+    return hit_nodes(hits)
+
+class _Cancelled(Exception):
+    """Raised from the token callback to stop a generation nobody reads."""
+
+class QueryService:
+    def __init__(self, indexer: Optional[Indexer] = None):
+        self.indexer = indexer
+        self.encoder = MicroBatcher(_encode, config.SERVICE_MAX_BATCH, config.SERVICE_BATCH_WAIT_MS / 1000, "encode")
+        self.reranker = MicroBatcher(score_many, config.SERVICE_MAX_BATCH, config.SERVICE_BATCH_WAIT_MS / 1000, "rerank")
+        self._llm_executor = ThreadPoolExecutor(max_workers=max(config.SERVICE_LLM_CONCURRENCY, 1), thread_name_prefix="llm")
+        self._build_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="build")
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        self.counters = {"requests": 0, "rejected": 0, "timeouts": 0, "errors": 0, "inflight": 0, "llm_active": 0}
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self.encoder.start()
+        self.reranker.start()
+        self._llm_slots = asyncio.Semaphore(max(config.SERVICE_LLM_CONCURRENCY, 1))
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self):
+        await self.encoder.stop()
+        await self.reranker.stop()
+        self._llm_executor.shutdown(wait=False)
+        self._build_executor.shutdown(wait=False)
+
+    # --- HTTP plumbing ---
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self._dispatch(method, path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        routes = {
+            ("GET", "/stats"): self._stats,
+            ("GET", "/metrics"): self._metrics,
+            ("POST", "/index"): self._index,
+            ("POST", "/query"): self._query,
+            ("POST", "/query/stream"): self._query_stream,
+        }
+        handler = routes.get((method, path))
+        if handler is None:
+            await _send_json(writer, 404, {"error": f"No route for {method} {path}"})
+            return
+
+        self.counters["requests"] += 1
+        if self.counters["inflight"] >= config.SERVICE_MAX_PENDING:
+            # shed load early instead of queueing work that would time out anyway
+            self.counters["rejected"] += 1
+            await _send_json(writer, 503, {"error": "Server busy, retry later."}, {"Retry-After": "1"})
+            return
+
+        self.counters["inflight"] += 1
+        try:
+            with span("request", method=method, path=path) as current:
+                try:
+                    payload = json.loads(body) if body else {}
+                    await handler(payload, writer)
+                    current.set(status=200)
+                except HTTPError as e:
+                    current.set(status=e.status)
+                    await _send_json(writer, e.status, {"error": str(e)})
+                except asyncio.TimeoutError:
+                    self.counters["timeouts"] += 1
+                    current.set(status=504)
+                    await _send_json(writer, 504, {"error": f"Request took longer than {config.SERVICE_REQUEST_TIMEOUT}s."})
+                except json.JSONDecodeError as e:
+                    current.set(status=400)
+                    await _send_json(writer, 400, {"error": f"Invalid JSON body: {e}"})
+                except (ConnectionError, _Cancelled):
+                    raise
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    current.set(status=500)
+                    await _send_json(writer, 500, {"error": str(e)})
+        finally:
+            self.counters["inflight"] -= 1
+
+    # --- pipeline ---
+    async def _offload(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # runs blocking work (file hashing, cache files, corpus manifest) off
+        # the event loop, inside the request's trace
+        return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, fn, *args)
+
+    def _cache_path(self, pdf_path: str) -> str:
+        # blocking: hashes the PDF the first time it is seen at this size and mtime
+        if not os.path.exists(pdf_path):
+            raise HTTPError(404, f"File not found: {pdf_path}")
+        return get_cache_path(pdf_path)
+
+    def _target(self, payload: Dict[str, Any]) -> Union[str, List[str], None]:
+        # blocking, see _cache_path
+        if payload.get("all"):
+            return None
+        pdfs = payload.get("pdfs") or ([payload["pdf"]] if payload.get("pdf") else [])
+        if not pdfs:
+            raise HTTPError(400, "Give 'pdf', 'pdfs' or 'all': true.")
+        cache_paths = []
+        for pdf_path in pdfs:
+            cache_path = self._cache_path(pdf_path)
+            if not is_indexed(cache_path):
+                # a build in progress can already answer from the pages it has done
+                if not is_indexed(partial_path(cache_path)):
+                    raise HTTPError(404, f"'{pdf_path}' is not indexed yet, POST /index first.")
+                cache_path = partial_path(cache_path)
+            cache_paths.append(cache_path)
+        return cache_paths[0] if len(cache_paths) == 1 else cache_paths
+
+    async def _retrieve(self, query: str, target: Union[str, List[str], None]) -> Tuple[np.ndarray, List[Any]]:
+        query_embedding = await self.encoder.submit(query)
+        try:
+            nodes = await self._offload(_candidates, query_embedding, target, query)
+        except (FileNotFoundError, ValueError) as e:
+            raise HTTPError(404, str(e))
+        if not nodes:
+            raise HTTPError(404, "No relevant context found.")
+        scores = await self.reranker.submit((query, nodes))
+        order = np.argsort(scores)[::-1][:config.TOP_K_FINAL]
+        return query_embedding, [nodes[i] for i in order]
+
+    async def _prepare(self, payload: Dict[str, Any]):
+        query = (payload.get("query") or "").strip()
+        if not query:
+            raise HTTPError(400, "Missing 'query'.")
+        target = await self._offload(self._target, payload)
+        answers = await self._offload(answer_cache.get_cache, target)
+        cached = await self._offload(answers.lookup_exact, query) if answers else None
+        if cached is not None:
+            return query, None, None, answers, cached
+        query_embedding, nodes = await self._retrieve(query, target)
+        cached = await self._offload(answers.lookup_similar, query_embedding, nodes) if answers else None
+        return query, query_embedding, nodes, answers, cached
+
+    async def _generate(self, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        async with self._llm_slots:
+            self.counters["llm_active"] += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._llm_executor, contextvars.copy_context().run, fn)
+            finally:
+                self.counters["llm_active"] -= 1
+
+    # --- endpoints ---
+    async def _stats(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        stats = {**self.counters, "encode": self.encoder.stats(), "rerank": self.reranker.stats()}
+        if self.indexer is not None:
+            stats["indexer"] = {"queue_depth": self.indexer.queue_depth(), "documents": self.indexer.status()}
+        await _send_json(writer, 200, stats)
+
+    async def _metrics(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        extra = {f"rag_service_{name}": ("gauge", value) for name, value in self.counters.items() if name in ("inflight", "llm_active")}
+        extra.update({f"rag_service_{name}_total": ("counter", value) for name, value in self.counters.items() if name not in ("inflight", "llm_active")})
+        for batcher in (self.encoder, self.reranker):
+            extra[f"rag_service_{batcher.name}_batches_total"] = ("counter", batcher.batches)
+            extra[f"rag_service_{batcher.name}_items_total"] = ("counter", batcher.items)
+        if self.indexer is not None:
+            extra["rag_service_index_queue_depth"] = ("gauge", self.indexer.queue_depth())
+        body = render_prometheus(extra).encode("utf-8")
+        await _send_head(writer, 200, "text/plain; version=0.0.4", {"Content-Length": str(len(body))})
+        writer.write(body)
+        await writer.drain()
+
+    async def _index(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        pdf_path = payload.get("pdf")
+        if not pdf_path or not pdf_path.lower().endswith(".pdf"):
+            raise HTTPError(400, "Give the 'pdf' path to index.")
+        cache_path = await self._offload(self._cache_path, pdf_path)
+        rebuild = bool(payload.get("rebuild"))
+
+        def build() -> Dict[str, Any]:
+            result = build_document(pdf_path, cache_path, incremental=rebuild, force=rebuild)
+            if result is None:
+                raise HTTPError(422, "No text could be extracted from this document.")
+            return {key: value for key, value in result.items() if key not in ("cache_path", "seconds")}
+
+        # one build per document at a time; builds never time out
+        lock = self._build_locks.setdefault(cache_path, asyncio.Lock())
+        async with lock:
+            start = time.perf_counter()
+            result = await asyncio.get_running_loop().run_in_executor(self._build_executor, contextvars.copy_context().run, build)
+            await asyncio.get_running_loop().run_in_executor(self._build_executor, contextvars.copy_context().run, add_document, cache_path, os.path.basename(pdf_path), os.path.abspath(pdf_path))
+        await _send_json(writer, 200, {"cache_path": cache_path, "seconds": round(time.perf_counter() - start, 3), **result})
+
+    async def _query(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        cancelled = threading.Event()
+
+        def on_token(text: str):
+            if cancelled.is_set():
+                raise _Cancelled()
+
+        async def run() -> Dict[str, Any]:
+            start = time.perf_counter()
+            query, query_embedding, nodes, answers, cached = await self._prepare(payload)
+            if cached is not None:
+                response, sources = cached["response"], cached["sources"]
+            else:
+                def generate() -> Dict[str, Any]:
+                    # streamed without stopping early, which answers the same as
+                    # query_llm_with_context but can be stopped once the request timed out
+                    try:
+                        if cancelled.is_set():
+                            raise _Cancelled()
+                        return stream_llm_with_context(query, nodes, on_token=on_token, stop_early=False)
+                    except _Cancelled:
+                        return {"status": "error", "answer": "cancelled", "questions": []}
+
+                response = await self._generate(generate)
+                sources = [node.metadata for node in nodes]
+                if answers:
+                    await self._offload(answers.store, query, query_embedding, nodes, response)
+            return _record(query, response, sources, cached is not None, time.perf_counter() - start)
+
+        try:
+            record = await asyncio.wait_for(run(), config.SERVICE_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            # nobody will read the answer, stop generating it
+            cancelled.set()
+            raise
+        await _send_json(writer, 502 if record["status"] == "error" else 200, record)
+
+    async def _query_stream(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        start = time.perf_counter()
+        query, query_embedding, nodes, answers, cached = await asyncio.wait_for(self._prepare(payload), config.SERVICE_REQUEST_TIMEOUT)
+        await _send_head(writer, 200, "application/x-ndjson", {"Transfer-Encoding": "chunked"})
+        cancelled = threading.Event()
+        try:
+            await self._stream_answer(query, query_embedding, nodes, answers, cached, start, cancelled, writer)
+        except (asyncio.TimeoutError, ConnectionError):
+            # the client is gone or out of time, stop generating for it
+            cancelled.set()
+            self.counters["timeouts"] += 1
+            await _end_stream(writer, "timeout")
+        except Exception as e:
+            # the 200 head is already out, so the error has to end the stream
+            # rather than reach _dispatch
+            cancelled.set()
+            self.counters["errors"] += 1
+            await _end_stream(writer, str(e))
+
+    async def _stream_answer(self, query: str, query_embedding: Optional[np.ndarray], nodes: Optional[List[Any]],
+                             answers: Any, cached: Optional[Dict[str, Any]], start: float,
+                             cancelled: threading.Event, writer: asyncio.StreamWriter):
+        if cached is not None:
+            await _send_chunk(writer, {"token": cached["response"].get("answer", "")})
+            await _send_chunk(writer, {"done": True, **_record(query, cached["response"], cached["sources"], True, time.perf_counter() - start)})
+            await _end_chunks(writer)
+            return
+
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue = asyncio.Queue()
+
+        def on_token(text: str):
+            if cancelled.is_set():
+                raise _Cancelled()
+            loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+        def generate() -> Dict[str, Any]:
+            try:
+                return stream_llm_with_context(query, nodes, on_token=on_token)
+            except _Cancelled:
+                return {"status": "error", "answer": "cancelled", "questions": []}
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        generation = asyncio.ensure_future(self._generate(generate))
+        deadline = loop.time() + config.SERVICE_REQUEST_TIMEOUT
+        while True:
+            text = await asyncio.wait_for(tokens.get(), max(deadline - loop.time(), 0))
+            if text is None:
+                break
+            await _send_chunk(writer, {"token": text})
+        response = await generation
+
+        if answers:
+            await self._offload(answers.store, query, query_embedding, nodes, response)
+        await _send_chunk(writer, {"done": True, **_record(query, response, [node.metadata for node in nodes], False, time.perf_counter() - start)})
+        await _end_chunks(writer)
+
+def _record(query: str, response: Dict[str, Any], sources: List[Dict[str, Any]], cached: bool, seconds: float) -> Dict[str, Any]:
+    return {
+        "query": query,
+        "status": response.get("status"),
+        **answer_sections(response.get("answer", "")),
+        "questions": response.get("questions", []),
+        "sources": [{key: metadata.get(key) for key in ("file_name", "page_number", "chunk_number")} for metadata in sources],
+        "cached": cached,
+        "seconds": round(seconds, 3),
+    }
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 422: "Unprocessable Entity", 500: "Internal Server Error",
+            502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    # (method, path, headers, body) of the next request on the connection, None when it closed
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+async def _send_head(writer: asyncio.StreamWriter, status: int, content_type: str, extra: Optional[Dict[str, str]] = None):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}"]
+    lines += [f"{name}: {value}" for name, value in (extra or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], extra: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload).encode("utf-8")
+    await _send_head(writer, status, "application/json", {"Content-Length": str(len(body)), **(extra or {})})
+    writer.write(body)
+    await writer.drain()
+
+async def _send_chunk(writer: asyncio.StreamWriter, payload: Dict[str, Any]):
+    data = (json.dumps(payload) + "\n").encode("utf-8")
+    writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+async def _end_chunks(writer: asyncio.StreamWriter):
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+async def _end_stream(writer: asyncio.StreamWriter, error: str):
+    # last line of a stream that failed after its head was sent
+    try:
+        await _send_chunk(writer, {"done": True, "status": "error", "error": error})
+        await _end_chunks(writer)
+    except ConnectionError:
+        pass
+
+def serve(host: Optional[str] = None, port: Optional[int] = None, watch: Optional[str] = None):
+    # runs the service until interrupted; watch is a folder to index in the background
+    host = host or config.SERVICE_HOST
+    port = port if port is not None else config.SERVICE_PORT
+
+    async def run():
+        indexer = Indexer(watch, quiet=True).start() if watch else None
+        service = QueryService(indexer)
+        server = await service.start(host, port)
+        print(f"🌐 Serving on http://{host}:{port} (Ctrl+C to stop)")
+        if indexer is not None:
+            print(f"👀 Indexing the PDFs dropped into {indexer.folder} ({indexer.workers} workers).")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.stop()
+            if indexer is not None:
+                indexer.stop(wait=False)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Goodbye!")
@@ -0,0 +1,295 @@
+"""
+Spans, counters, gauges and histograms around the pipeline stages, rendered
+in the Prometheus text format; all no-ops unless TELEMETRY_ENABLED.
+"""
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+from . import config
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+BUILD_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+# histograms measured in something other than seconds, or over longer spans
+BUCKETS = {"rag_prompt_tokens": TOKEN_BUCKETS, "rag_completion_tokens": TOKEN_BUCKETS, "rag_index_build_seconds": BUILD_BUCKETS}
+
+HELP = {
+    "rag_stage_seconds": "Duration of each pipeline stage (one observation per span).",
+    "rag_chunks_embedded_total": "Chunk texts encoded by the embedding model.",
+    "rag_cache_hits_total": "Lookups served from a cache, by cache.",
+    "rag_cache_misses_total": "Lookups not found in a cache, by cache.",
+    "rag_rerank_pairs_total": "Query-chunk pairs seen by the reranker, by outcome.",
+    "rag_retrieval_total": "Candidate searches, by mode (dense, hybrid, or lexical fast path).",
+    "rag_llm_requests_total": "LLM calls, by outcome.",
+    "rag_llm_seconds": "Wall time of an LLM call.",
+    "rag_llm_ttft_seconds": "Time from sending the prompt to the first streamed token.",
+    "rag_prompt_tokens": "Prompt tokens evaluated per LLM call, as reported by the backend.",
+    "rag_completion_tokens": "Tokens generated per LLM call, as reported by the backend.",
+    "rag_prompt_eval_seconds": "Prompt evaluation time per LLM call, as reported by the backend.",
+    "rag_index_queue_depth": "Documents waiting for the background indexer, by state (queued or building).",
+    "rag_index_builds_total": "Background index builds, by outcome.",
+    "rag_index_build_seconds": "Wall time of a background index build, queue wait excluded.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_gauges: Dict[str, Dict[Labels, float]] = {}
+# name -> labels -> [bucket counts..., sum, count]
+_histograms: Dict[str, Dict[Labels, list]] = {}
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("span", default=None)
+_muted: "contextvars.ContextVar[bool]" = contextvars.ContextVar("muted", default=False)
+_log = None
+_exit_hook = False
+
+def enabled() -> bool:
+    return config.TELEMETRY_ENABLED
+
+def say(*args, **kwargs):
+    # human-readable progress output
+    if config.VERBOSE and not _muted.get():
+        print(*args, **kwargs)
+
+@contextlib.contextmanager
+def muted():
+    # silences say() in this thread (or task), e.g. for a background build
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _register_exit():
+    global _exit_hook
+    if not _exit_hook:
+        _exit_hook = True
+        atexit.register(shutdown)
+
+def count(name: str, value: float = 1, **labels):
+    if not config.TELEMETRY_ENABLED or not value:
+        return
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+        _register_exit()
+
+def gauge(name: str, value: float, **labels):
+    # sets a point-in-time value, e.g. a queue depth
+    if not config.TELEMETRY_ENABLED:
+        return
+    with _lock:
+        _gauges.setdefault(name, {})[_labels(labels)] = value
+        _register_exit()
+
+def observe(name: str, value: float, **labels):
+    if not config.TELEMETRY_ENABLED or value is None:
+        return
+    buckets = BUCKETS.get(name, SECONDS_BUCKETS)
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        state = series.get(key)
+        if state is None:
+            state = series[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+        _register_exit()
+
+def _write_log(record: Dict[str, Any]):
+    global _log
+    path = config.TELEMETRY_LOG_PATH
+    if not path:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        if _log is None or _log.name != path:
+            if _log is not None:
+                _log.close()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _log = open(path, "a", encoding="utf-8", buffering=1)
+        _log.write(line)
+
+def event(name: str, **attrs):
+    # a point-in-time log record inside the current span, e.g. a cache decision
+    if not config.TELEMETRY_ENABLED:
+        return
+    parent = _current.get()
+    _write_log({
+        "ts": round(time.time(), 6), "event": name,
+        "span_id": parent.span_id if parent else None,
+        "trace_id": parent.trace_id if parent else None,
+        "attrs": attrs,
+    })
+
+class Span:
+    # one timed stage; attributes can be added while it runs with set()
+
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "trace_id", "_start", "_ts", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self._token = _current.set(self)
+        self._ts = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        observe("rag_stage_seconds", duration, stage=self.name)
+        _write_log({
+            "ts": round(self._ts, 6), "span": self.name, "duration_s": round(duration, 6),
+            "span_id": self.span_id, "parent_id": self.parent_id, "trace_id": self.trace_id,
+            "attrs": self.attrs,
+        })
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name: str, **attrs):
+    # with span("embed", texts=n) as s: ... ; s.set(cached=k)
+    if not config.TELEMETRY_ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+def traced(name: str):
+    # span() around every call of the decorated function
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not config.TELEMETRY_ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_prometheus(extra: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    # every metric in the Prometheus text exposition format; extra adds
+    # point-in-time values kept elsewhere, as {name: (type, value)}
+    lines = []
+    for name, (metric_type, value) in sorted((extra or {}).items()):
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {_format_number(value)}")
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        gauges = {name: dict(series) for name, series in _gauges.items()}
+        histograms = {name: {key: list(state) for key, state in series.items()} for name, series in _histograms.items()}
+
+    for name in sorted(counters):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+    for name in sorted(gauges):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in sorted(gauges[name].items()):
+            lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+    for name in sorted(histograms):
+        buckets = BUCKETS.get(name, SECONDS_BUCKETS)
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, state in sorted(histograms[name].items()):
+            for bound, bucket_count in zip(buckets, state):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_number(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {state[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(state[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+def snapshot() -> Dict[str, Any]:
+    # counters and histogram sums / counts as plain data, for summaries
+    with _lock:
+        return {
+            "counters": {name: {",".join(f"{k}={v}" for k, v in labels): value for labels, value in series.items()}
+                         for name, series in _counters.items()},
+            "gauges": {name: {",".join(f"{k}={v}" for k, v in labels): value for labels, value in series.items()}
+                       for name, series in _gauges.items()},
+            "histograms": {name: {",".join(f"{k}={v}" for k, v in labels): {"sum": state[-2], "count": state[-1]}
+                                  for labels, state in series.items()}
+                           for name, series in _histograms.items()},
+        }
+
+def write_metrics(path: Optional[str] = None):
+    # writes the Prometheus text file atomically, for node_exporter's textfile collector
+    path = path or config.METRICS_PATH
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+def shutdown():
+    # flushes the metrics file and closes the span log
+    global _log
+    if config.TELEMETRY_ENABLED and (_counters or _gauges or _histograms):
+        try:
+            write_metrics()
+        except OSError as e:
+            print(f"⚠️ Warning: Could not write metrics. Reason: {e}")
+    with _lock:
+        if _log is not None:
+            _log.close()
+            _log = None
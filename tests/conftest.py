@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config
+from modules.index_registry import invalidate
+from modules.models import use_fake_models
+
+@pytest.fixture(autouse=True)
+def offline(tmp_path, monkeypatch):
+    # fake models, the native chunker and a private cache directory per test
+    use_fake_models()
+    cached_dir = str(tmp_path / "cached_files")
+    monkeypatch.setattr(config, "CACHED_DIR", cached_dir)
+    monkeypatch.setattr(config, "CORPUS_DIR", os.path.join(cached_dir, "_corpus"))
+    monkeypatch.setattr(config, "EMBEDDING_STORE_ENABLED", False)
+    monkeypatch.setattr(config, "CHUNKER", "native")
+    monkeypatch.setattr(config, "CHUNKER_WORKERS", 1)
+    monkeypatch.setattr(config, "LOADER_WORKERS", 1)
+    invalidate()
+    yield
+    invalidate()
+
+@pytest.fixture
+def policy_pdf(tmp_path):
+    return generate_policy_pdf(str(tmp_path / "policy.pdf"), 12)
@@ -0,0 +1,57 @@
+import numpy as np
+from modules import config
+from modules.answer_cache import AnswerCache
+
+class Node:
+    def __init__(self, text, page):
+        self.text = text
+        self.metadata = {"file_name": "policy.pdf", "page_number": page}
+
+    def get_content(self):
+        return self.text
+
+NODES = [Node("maternity expenses are covered", 1), Node("after a nine month waiting period", 2)]
+RESPONSE = {"status": "sufficient", "answer": "Decision: Approved", "questions": [], "ttft": 0.2, "total_time": 1.5}
+
+def _unit(*values):
+    vector = np.array(values, dtype='float32')
+    return vector / np.linalg.norm(vector)
+
+def test_exact_lookup_normalizes_the_question(tmp_path):
+    answers = AnswerCache(str(tmp_path), "answers.pkl", 1)
+    answers.store("Is maternity covered?", _unit(1, 0), NODES, RESPONSE)
+    entry = answers.lookup_exact("  is MATERNITY covered ")
+    assert entry["response"] == {"status": "sufficient", "answer": "Decision: Approved", "questions": []}
+    assert entry["sources"] == [node.metadata for node in NODES]
+    assert answers.lookup_exact("Is dental covered?") is None
+
+def test_similar_lookup_needs_the_same_chunks_and_a_close_question(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ANSWER_CACHE_SIMILARITY", 0.95)
+    answers = AnswerCache(str(tmp_path), "answers.pkl", 1)
+    answers.store("Is maternity covered?", _unit(1, 0), NODES, RESPONSE)
+    assert answers.lookup_similar(_unit(1, 0.1), list(reversed(NODES))) is not None
+    assert answers.lookup_similar(_unit(1, 0.1), NODES[:1]) is None
+    assert answers.lookup_similar(_unit(1, 1), NODES) is None
+
+def test_errors_are_not_stored(tmp_path):
+    answers = AnswerCache(str(tmp_path), "answers.pkl", 1)
+    answers.store("Is maternity covered?", _unit(1, 0), NODES, {"status": "error", "answer": "LLM Error"})
+    assert answers.lookup_exact("Is maternity covered?") is None
+
+def test_entries_survive_a_reopen_only_at_the_same_version(tmp_path):
+    AnswerCache(str(tmp_path), "answers.pkl", 1).store("Is maternity covered?", _unit(1, 0), NODES, RESPONSE)
+    assert AnswerCache(str(tmp_path), "answers.pkl", 1).lookup_exact("Is maternity covered?") is not None
+    assert AnswerCache(str(tmp_path), "answers.pkl", 2).lookup_exact("Is maternity covered?") is None
+
+def test_least_recently_used_and_expired_entries_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ANSWER_CACHE_SIZE", 2)
+    answers = AnswerCache(str(tmp_path), "answers.pkl", 1)
+    for question in ("first?", "second?"):
+        answers.store(question, _unit(1, 0), NODES, RESPONSE)
+    answers.lookup_exact("first?")
+    answers.store("third?", _unit(1, 0), NODES, RESPONSE)
+    assert answers.lookup_exact("second?") is None
+    assert answers.lookup_exact("first?") is not None
+
+    monkeypatch.setattr(config, "ANSWER_CACHE_TTL", -1)
+    assert answers.lookup_exact("first?") is None
@@ -0,0 +1,43 @@
+import json
+import pytest
+from modules import config, indexer, llm_backends
+from modules.batch import _completed_ids, read_queries, run_batch
+from modules.llm_backends import FakeBackend
+
+QUESTIONS = ["Is maternity covered?", "Is room rent capped for ICU admission?", "Are AYUSH treatments covered?"]
+
+@pytest.fixture
+def indexed(policy_pdf, monkeypatch):
+    pytest.importorskip("llama_index.core.schema")
+    monkeypatch.setattr(llm_backends, "_backend", FakeBackend())
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    return indexer.build_document(policy_pdf)["cache_path"]
+
+def _write_queries(path, questions):
+    with open(path, "w", encoding="utf-8") as f:
+        for number, question in enumerate(questions, start=1):
+            f.write(json.dumps({"id": f"q{number}", "query": question}) + "\n")
+    return str(path)
+
+def test_read_queries_from_csv_numbers_rows_without_an_id(tmp_path):
+    path = tmp_path / "queries.csv"
+    path.write_text("id,query\nfirst,Is maternity covered?\n,Is dental covered?\nskipped,\n", encoding="utf-8")
+    assert read_queries(str(path)) == [{"id": "first", "query": "Is maternity covered?"},
+                                       {"id": "2", "query": "Is dental covered?"}]
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = tmp_path / "answers.jsonl"
+    path.write_text('{"id": "q1"}\n{"id": "q2"}\n{"id": "q', encoding="utf-8")
+    assert _completed_ids(str(path)) == {"q1", "q2"}
+    assert path.read_text(encoding="utf-8") == '{"id": "q1"}\n{"id": "q2"}\n'
+
+def test_batch_answers_every_question_once_across_a_resume(indexed, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "BATCH_CHUNK_SIZE", 2)
+    output = str(tmp_path / "answers.jsonl")
+    first = run_batch(_write_queries(tmp_path / "first.jsonl", QUESTIONS[:2]), output, indexed, concurrency=2)
+    second = run_batch(_write_queries(tmp_path / "all.jsonl", QUESTIONS), output, indexed, concurrency=2)
+    assert (first["answered"], second["answered"], second["skipped_done"]) == (2, 1, 2)
+    with open(output, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record["id"] for record in records) == ["q1", "q2", "q3"]
+    assert all(record["status"] == "sufficient" and record["sources"] for record in records)
@@ -0,0 +1,73 @@
+import os
+import pickle
+import pytest
+from modules import chunk_store
+from modules.chunker import ChunkNode
+from modules.index_registry import CHUNK_META_FILE, CHUNK_TEXT_FILE, CHUNKS_FILE, LEGACY_CHUNKS_FILE
+
+def make_nodes():
+    return [
+        ChunkNode("Health Guard Policy wording.", {"file_name": "a.pdf", "page_number": "Document Header", "chunk_number": 1}),
+        ChunkNode("Cataract surgery is covered after 24 months.", {"file_name": "a.pdf", "page_number": 1, "chunk_number": 1}),
+        ChunkNode("Room rent is capped at 1% — per day.", {"file_name": "a.pdf", "page_number": 1, "chunk_number": 2}),
+        ChunkNode("Maternity expenses are excluded.", {"file_name": "b.pdf", "page_number": 3, "chunk_number": 1}),
+    ]
+
+def test_round_trip(tmp_path):
+    nodes = make_nodes()
+    assert chunk_store.write_store(str(tmp_path), nodes) == len(nodes)
+    store = chunk_store.open_store(str(tmp_path))
+    assert len(store) == len(nodes)
+    for i, node in enumerate(nodes):
+        assert store.text(i) == node.text
+        assert store.metadata(i) == node.metadata
+    assert store.pages.tolist() == [0, 1, 1, 3]
+    assert store.files == ["a.pdf", "b.pdf"]
+
+def test_batches_match_a_single_write(tmp_path):
+    nodes = make_nodes()
+    whole, batched = str(tmp_path / "whole"), str(tmp_path / "batched")
+    chunk_store.write_store(whole, nodes)
+    os.makedirs(batched)
+    files = []
+    chunk_store.append_batch(batched, nodes[:1], files)
+    chunk_store.append_batch(batched, nodes[1:], files)
+    assert chunk_store.commit(batched, files) == len(nodes)
+    for name in (CHUNKS_FILE, CHUNK_TEXT_FILE):
+        with open(os.path.join(whole, name), "rb") as a, open(os.path.join(batched, name), "rb") as b:
+            assert a.read() == b.read()
+    assert not os.path.exists(os.path.join(batched, chunk_store.PARTIAL_ROWS))
+
+def test_getitem_builds_text_nodes(tmp_path):
+    pytest.importorskip("llama_index.core.schema")
+    nodes = make_nodes()
+    chunk_store.write_store(str(tmp_path), nodes)
+    store = chunk_store.open_store(str(tmp_path))
+    assert store[-1].get_content() == nodes[-1].text
+    assert [node.metadata for node in store[1:3]] == [node.metadata for node in nodes[1:3]]
+    with pytest.raises(IndexError):
+        store[len(nodes)]
+
+def test_migrates_a_pickled_chunk_list(tmp_path):
+    schema = pytest.importorskip("llama_index.core.schema")
+    nodes = [schema.TextNode(text=node.text, metadata=node.metadata) for node in make_nodes()]
+    # caches appended frames to chunks.pkl while streaming
+    with open(tmp_path / LEGACY_CHUNKS_FILE, "wb") as f:
+        pickle.dump(nodes[:2], f)
+        pickle.dump(nodes[2:], f)
+    store = chunk_store.open_store(str(tmp_path))
+    assert not os.path.exists(tmp_path / LEGACY_CHUNKS_FILE)
+    assert [store.text(i) for i in range(len(store))] == [node.get_content() for node in nodes]
+    assert [store.metadata(i) for i in range(len(store))] == [node.metadata for node in nodes]
+    assert not chunk_store.migrate(str(tmp_path))
+
+def test_unknown_format_is_rejected(tmp_path):
+    chunk_store.write_store(str(tmp_path), make_nodes())
+    with open(tmp_path / CHUNK_META_FILE, "w") as f:
+        f.write('{"format": 99, "count": 4, "files": []}')
+    with pytest.raises(ValueError):
+        chunk_store.open_store(str(tmp_path))
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        chunk_store.open_store(str(tmp_path))
@@ -0,0 +1,58 @@
+import pytest
+from modules.chunker import _pack, get_text_nodes
+
+def units_of(tokens):
+    # (start, end, tokens) units laid end to end, one character per token
+    units, start = [], 0
+    for count in tokens:
+        units.append((start, start + count, count))
+        start += count
+    return units
+
+def span_tokens(units, span):
+    return sum(tokens for start, end, tokens in units if start >= span[0] and end <= span[1])
+
+@pytest.mark.parametrize("tokens,budget,overlap", [
+    ([5] * 20, 20, 5),
+    ([3, 7, 2, 9, 4, 1, 8, 6, 5, 2], 15, 4),
+    ([1] * 50, 10, 0),
+    ([10, 10, 10], 10, 5),
+])
+def test_pack_respects_the_budget_and_covers_every_unit(tokens, budget, overlap):
+    units = units_of(tokens)
+    spans = _pack(units, budget, overlap)
+    assert spans[0][0] == 0 and spans[-1][1] == units[-1][1]
+    for span in spans:
+        assert span_tokens(units, span) <= budget
+    # consecutive spans touch or overlap, and each one moves forward
+    for previous, current in zip(spans, spans[1:]):
+        assert current[0] <= previous[1]
+        assert current[0] > previous[0] and current[1] > previous[1]
+
+def test_pack_overlap_stays_within_overlap_tokens():
+    units = units_of([4] * 30)
+    spans = _pack(units, 24, 8)
+    for previous, current in zip(spans, spans[1:]):
+        assert 0 < span_tokens(units, (current[0], previous[1])) <= 8
+
+def test_pack_without_overlap_splits_cleanly():
+    units = units_of([2] * 10)
+    assert _pack(units, 6, 0) == [(0, 6), (6, 12), (12, 18), (18, 20)]
+
+def test_pack_unit_over_budget_gets_a_chunk_of_its_own():
+    units = units_of([3, 50, 3])
+    assert _pack(units, 10, 2) == [(0, 3), (3, 53), (53, 56)]
+
+def test_native_chunks_number_pages_from_one():
+    processed = {"doc_context": "Health Guard Policy.", "pages": [
+        {"page_number": 1, "text": "First clause applies. " * 200},
+        {"page_number": 2, "text": "Second clause applies."},
+    ]}
+    nodes = get_text_nodes(processed, "/tmp/policy.pdf")
+    pages = {}
+    for node in nodes:
+        assert node.metadata["file_name"] == "policy.pdf"
+        pages.setdefault(node.metadata["page_number"], []).append(node.metadata["chunk_number"])
+    assert list(pages) == ["Document Header", 1, 2]
+    assert all(numbers == list(range(1, len(numbers) + 1)) for numbers in pages.values())
+    assert len(pages[1]) > 1
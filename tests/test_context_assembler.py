@@ -0,0 +1,47 @@
+from modules import config
+from modules.chunk_store import HEADER_PAGE
+from modules.context_assembler import ELLIPSIS, assemble_context, assemble_passages, estimate_tokens, stitch
+
+class Node:
+    def __init__(self, text, page, chunk, file_name="policy.pdf"):
+        self.text = text
+        self.metadata = {"file_name": file_name, "page_number": page, "chunk_number": chunk}
+
+    def get_content(self):
+        return self.text
+
+def test_stitch_drops_the_overlap():
+    first = "Maternity expenses are covered after a waiting period of nine months."
+    second = "a waiting period of nine months. Caesarean delivery is included."
+    assert stitch(first, second) == first + " Caesarean delivery is included."
+    assert stitch(first, "Dental treatment is excluded.") is None
+
+def test_chunks_of_a_page_become_one_cited_passage():
+    nodes = [
+        Node("a waiting period of nine months. Caesarean delivery is included.", 4, 2),
+        Node("Maternity expenses are covered after a waiting period of nine months.", 4, 1),
+        Node("Room rent is capped at one percent of the sum insured.", 4, 7),
+        Node("Schedule of benefits", HEADER_PAGE, 0),
+    ]
+    passages = assemble_passages(nodes)
+    assert passages == [
+        ("[policy.pdf, page 4]", "Maternity expenses are covered after a waiting period of nine months. "
+                                 "Caesarean delivery is included." + ELLIPSIS + "Room rent is capped at one percent of the sum insured."),
+        ("[policy.pdf, document header]", "Schedule of benefits"),
+    ]
+
+def test_a_clause_printed_twice_is_sent_once():
+    clause = "AYUSH treatments are covered in a registered hospital."
+    nodes = [Node(clause, 2, 1), Node(clause, 9, 3), Node(clause, 1, 1, file_name="other.pdf")]
+    assert assemble_context(nodes) == f"[policy.pdf, page 2]\n{clause}"
+
+def test_overflow_is_trimmed_to_whole_sentences_at_its_rank(monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_MIN_PASSAGE_TOKENS", 5)
+    long_text = " ".join(f"Clause {i} covers item {i}." for i in range(40))
+    nodes = [Node("Room rent is capped.", 1, 1), Node(long_text, 2, 1), Node("Dental is excluded.", 3, 1)]
+    budget = 60
+    passages = assemble_passages(nodes, token_budget=budget)
+    assert [header for header, _ in passages] == ["[policy.pdf, page 1]", "[policy.pdf, page 2]", "[policy.pdf, page 3]"]
+    trimmed = passages[1][1]
+    assert long_text.startswith(trimmed) and trimmed.endswith(".")
+    assert sum(estimate_tokens(header) + estimate_tokens(text) for header, text in passages) <= budget
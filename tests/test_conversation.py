@@ -0,0 +1,38 @@
+import pytest
+from modules import config, indexer
+from modules.conversation import ConversationState
+from modules.reranker import chunk_id, clear_cache
+
+@pytest.fixture
+def conversation(policy_pdf):
+    pytest.importorskip("llama_index.core.schema")
+    clear_cache()
+    cache_path = indexer.build_document(policy_pdf)["cache_path"]
+    return ConversationState(cache_path, "Is maternity covered?")
+
+def test_first_turn_reranks_a_full_retrieval(conversation):
+    stats = {}
+    nodes = conversation.retrieve(stats=stats)
+    assert len(nodes) == config.TOP_K_FINAL
+    assert stats["new_candidates"] == stats["pool_size"] == len(conversation.pool)
+    assert stats["pairs_scored"] == len(conversation.pool)
+
+def test_follow_up_only_reranks_new_hits_and_the_previous_best(conversation):
+    conversation.retrieve()
+    pooled = len(conversation.pool)
+    conversation.add_details("The policy holder is 32 and had a caesarean delivery.")
+    stats = {}
+    nodes = conversation.retrieve(stats=stats)
+    assert "[User has provided new information:" in conversation.query
+    assert stats["pairs_scored"] + stats["pairs_cached"] <= stats["new_candidates"] + config.TOP_K_FINAL
+    assert len(conversation.pool) == pooled + stats["new_candidates"]
+    assert all(entry["query"] == conversation.query for entry in conversation.pool.values() if entry["node"] in nodes)
+
+def test_remember_tracks_what_the_llm_has_seen(conversation):
+    nodes = conversation.retrieve()
+    conversation.remember(nodes[:1], [1, 2, 3], continued=False)
+    conversation.remember(nodes[1:], [1, 2, 3, 4], continued=True)
+    assert conversation.sent_chunks == {chunk_id(node) for node in nodes}
+    assert conversation.llm_context == [1, 2, 3, 4]
+    conversation.remember(nodes[:1], None, continued=False)
+    assert conversation.sent_chunks == {chunk_id(nodes[0])} and conversation.llm_context is None
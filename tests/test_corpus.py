@@ -0,0 +1,84 @@
+import os
+import pytest
+from benchmarks.synthetic_pdf import generate_policy_pdf
+from modules import config, corpus, indexer
+from modules.index_registry import get_index
+
+def _build(path, pages, seed=7):
+    return indexer.build_document(generate_policy_pdf(str(path), pages, seed=seed))["cache_path"]
+
+def _query(cache_path, position=0):
+    index, _ = get_index(cache_path)
+    return index.reconstruct(position).reshape(1, -1)
+
+def _reload():
+    # as another process would see the corpus on disk
+    corpus._loaded = None
+
+def test_same_named_documents_from_different_paths_are_both_kept(tmp_path):
+    os.makedirs(tmp_path / "a")
+    os.makedirs(tmp_path / "b")
+    first = _build(tmp_path / "a" / "policy.pdf", 6, seed=1)
+    second = _build(tmp_path / "b" / "policy.pdf", 6, seed=2)
+    corpus.add_document(first, "policy.pdf", str(tmp_path / "a" / "policy.pdf"))
+    corpus.add_document(second, "policy.pdf", str(tmp_path / "b" / "policy.pdf"))
+    assert sorted(entry["cache_path"] for entry in corpus.list_documents().values()) == sorted([first, second])
+
+def test_a_new_version_of_the_same_source_replaces_the_old_one(tmp_path):
+    path = tmp_path / "policy.pdf"
+    old = _build(path, 6)
+    corpus.add_document(old, "policy.pdf", str(path))
+    new = _build(path, 8)
+    corpus.add_document(new, "policy.pdf", str(path))
+    assert [entry["cache_path"] for entry in corpus.list_documents().values()] == [new]
+    assert all(cache_path == new for _, cache_path, _ in corpus.search(_query(old), 5))
+
+def test_adding_the_same_cache_again_keeps_its_doc_id(tmp_path):
+    cache_path = _build(tmp_path / "policy.pdf", 4)
+    doc_id = corpus.add_document(cache_path, "policy.pdf")
+    assert corpus.add_document(cache_path, "policy.pdf") == doc_id
+    assert len(corpus.list_documents()) == 1
+
+def test_search_over_selected_documents(tmp_path):
+    first = _build(tmp_path / "first.pdf", 4, seed=1)
+    second = _build(tmp_path / "second.pdf", 4, seed=2)
+    corpus.add_document(first, "first.pdf")
+    corpus.add_document(second, "second.pdf")
+    score, cache_path, position = corpus.search(_query(first, 3), 1)[0]
+    assert (cache_path, position) == (first, 3) and score == pytest.approx(1.0, abs=1e-4)
+    assert {cache_path for _, cache_path, _ in corpus.search(_query(first, 3), 10, cache_paths=[second])} == {second}
+    assert corpus.search(_query(first), 1, cache_paths=[str(tmp_path / "missing_cache")]) is None
+
+@pytest.mark.parametrize("ratio", [0.0, 100.0])
+def test_adds_and_removals_survive_a_reload(tmp_path, monkeypatch, ratio):
+    # ratio 0 folds every add into a new base index, 100 keeps them all in the delta
+    monkeypatch.setattr(config, "CORPUS_DELTA_RATIO", ratio)
+    caches = [_build(tmp_path / f"doc{i}.pdf", 3, seed=i) for i in range(3)]
+    doc_ids = [corpus.add_document(cache_path, os.path.basename(cache_path)) for cache_path in caches]
+    assert corpus.remove_document(doc_ids[1])
+    expected = corpus.search(_query(caches[2], 1), 5)
+
+    _reload()
+    assert sorted(corpus.list_documents()) == [doc_ids[0], doc_ids[2]]
+    assert corpus.search(_query(caches[2], 1), 5) == expected
+    assert all(cache_path != caches[1] for _, cache_path, _ in corpus.search(_query(caches[1]), 20))
+    files = [name for name in os.listdir(config.CORPUS_DIR) if name.startswith("corpus.")]
+    assert len(files) == (1 if ratio == 0.0 else 3)
+
+def test_an_add_that_never_committed_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CORPUS_DELTA_RATIO", 100.0)
+    first = _build(tmp_path / "first.pdf", 3, seed=1)
+    second = _build(tmp_path / "second.pdf", 3, seed=2)
+    corpus.add_document(first, "first.pdf")
+    # the delta files are written, then the process dies before the manifest
+    with monkeypatch.context() as patch:
+        patch.setattr(corpus, "_commit", lambda manifest: None)
+        corpus.add_document(second, "second.pdf")
+
+    _reload()
+    assert [entry["cache_path"] for entry in corpus.list_documents().values()] == [first]
+    third = _build(tmp_path / "third.pdf", 3, seed=3)
+    corpus.add_document(third, "third.pdf")
+    _reload()
+    assert corpus.search(_query(third, 2), 1)[0][1:] == (third, 2)
+    assert all(cache_path != second for _, cache_path, _ in corpus.search(_query(second), 20))
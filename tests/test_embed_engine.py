@@ -0,0 +1,37 @@
+import numpy as np
+from modules import config, embed_engine
+from modules.models import get_embedder
+
+TEXTS = [("clause " * (i % 9 + 1)) + f"number {i}" for i in range(40)]
+
+def test_batches_cover_every_text_within_the_budget():
+    lengths = np.array([len(text.split()) for text in TEXTS], dtype=np.int64)
+    batches = embed_engine.plan_batches(lengths, token_budget=32, max_batch=6)
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(TEXTS)))
+    for batch in batches:
+        assert 1 <= len(batch) <= 6
+        # sorted longest first, so the first text sets the padded length
+        assert lengths[batch[0]] == lengths[batch].max()
+        assert len(batch) == 1 or len(batch) * lengths[batch[0]] <= 32
+
+def test_encode_keeps_the_input_order(monkeypatch):
+    monkeypatch.setattr(config, "EMBED_TOKEN_BUDGET", 24)
+    stats = {}
+    embeddings = embed_engine.encode(TEXTS, workers=1, stats=stats)
+    expected = np.asarray(get_embedder().encode(TEXTS), dtype='float32')
+    assert stats["batches"] > 1
+    np.testing.assert_allclose(embeddings, expected, rtol=1e-5, atol=1e-6)
+
+def test_worker_processes_match_in_process_encoding(monkeypatch):
+    monkeypatch.setattr(config, "EMBED_TOKEN_BUDGET", 24)
+    monkeypatch.setattr(config, "EMBED_PARALLEL_MIN_TEXTS", 1)
+    stats = {}
+    try:
+        parallel = embed_engine.encode(TEXTS, workers=2, stats=stats)
+    finally:
+        embed_engine.shutdown()
+    assert stats["workers"] == 2
+    np.testing.assert_allclose(parallel, embed_engine.encode(TEXTS, workers=1), rtol=1e-5, atol=1e-6)
+
+def test_empty_input():
+    assert embed_engine.encode([]).shape[0] == 0
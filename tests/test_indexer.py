@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from modules import indexer
+from modules.index_registry import is_indexed
+from modules.persistence import document_lock, get_cache_path
+
+def test_document_lock_serializes_threads(tmp_path):
+    cache_path = str(tmp_path / "doc_cache")
+    inside, overlaps = [], []
+
+    def hold():
+        with document_lock(cache_path):
+            inside.append(1)
+            overlaps.append(len(inside))
+            time.sleep(0.05)
+            inside.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1, 1, 1, 1]
+    assert not os.path.exists(f"{cache_path}.lock")
+
+def test_concurrent_builds_of_one_document_build_once(policy_pdf):
+    results = []
+
+    def build():
+        results.append(indexer.build_document(policy_pdf))
+
+    threads = [threading.Thread(target=build) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cache_path = get_cache_path(policy_pdf)
+    assert sorted(result["built"] for result in results) == [False, False, True]
+    assert all(result["cache_path"] == cache_path for result in results)
+    assert is_indexed(cache_path)
+    assert not os.path.exists(indexer.building_path(cache_path))
+    assert not os.path.exists(f"{os.path.abspath(cache_path)}.lock")
+
+def test_forced_rebuild_replaces_the_cache(policy_pdf):
+    first = indexer.build_document(policy_pdf)
+    second = indexer.build_document(policy_pdf, force=True)
+    assert second["built"] and second["chunks"] == first["chunks"]
+    assert is_indexed(first["cache_path"])
+    assert not os.path.exists(f"{first['cache_path']}.old")
+
+def test_same_named_pdf_elsewhere_is_not_a_previous_version(tmp_path):
+    from benchmarks.synthetic_pdf import generate_policy_pdf
+    from modules.corpus import add_document, list_documents
+    os.makedirs(tmp_path / "a")
+    os.makedirs(tmp_path / "b")
+    first = generate_policy_pdf(str(tmp_path / "a" / "policy.pdf"), 8, seed=1)
+    second = generate_policy_pdf(str(tmp_path / "b" / "policy.pdf"), 10, seed=2)
+    first_cache = indexer.build_document(first)["cache_path"]
+    add_document(first_cache, "policy.pdf")
+
+    result = indexer.build_document(second, incremental=True)
+    assert "reused" not in result and result["chunks"] > 0
+    assert is_indexed(first_cache)
+    assert [entry["cache_path"] for entry in list_documents().values()] == [first_cache]
+
+def test_new_version_of_the_same_file_reuses_and_replaces_the_old_cache(tmp_path):
+    from benchmarks.synthetic_pdf import generate_policy_pdf
+    path = str(tmp_path / "policy.pdf")
+    old_cache = indexer.build_document(generate_policy_pdf(path, 8))["cache_path"]
+    # the same pages plus two more
+    generate_policy_pdf(path, 10)
+    result = indexer.build_document(path, incremental=True)
+    assert result["cache_path"] != old_cache
+    assert result["reused"] > 0
+    assert not os.path.exists(old_cache)
+
+def test_watched_pdf_leaves_a_same_named_document_alone(tmp_path):
+    from benchmarks.synthetic_pdf import generate_policy_pdf
+    from modules.corpus import add_document, list_documents
+    os.makedirs(tmp_path / "elsewhere")
+    os.makedirs(tmp_path / "watched")
+    other = generate_policy_pdf(str(tmp_path / "elsewhere" / "policy.pdf"), 8, seed=1)
+    other_cache = indexer.build_document(other)["cache_path"]
+    add_document(other_cache, "policy.pdf")
+
+    dropped = generate_policy_pdf(str(tmp_path / "watched" / "policy.pdf"), 6, seed=2)
+    watcher = indexer.Indexer(str(tmp_path / "watched"), poll_seconds=0.0, quiet=True)
+    watcher.poll()
+    watcher.start()
+    try:
+        assert watcher.wait(dropped, timeout=60, partial=False) is not None
+    finally:
+        watcher.stop()
+    assert is_indexed(other_cache)
+    assert other_cache in [entry["cache_path"] for entry in list_documents().values()]
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pytest
+from modules import chunk_store
+from modules.index_registry import VECTORS_FILE
+from modules.ingest import PARTIAL_VECTORS, PROGRESS_FILE, _load_progress, ingest_pdf, update_index
+
+class Interrupted(Exception):
+    pass
+
+def contents(cache_path):
+    store = chunk_store.open_store(cache_path)
+    texts = [store.text(i) for i in range(len(store))]
+    pages = [store.metadata(i)["page_number"] for i in range(len(store))]
+    vectors = np.fromfile(os.path.join(cache_path, VECTORS_FILE), dtype='float32')
+    return texts, pages, vectors
+
+def interrupt_after(commits):
+    seen = []
+    def on_commit(cache_path, progress):
+        seen.append(progress["chunks"])
+        if len(seen) == commits:
+            raise Interrupted()
+    return on_commit
+
+def test_resumed_build_matches_a_full_build(policy_pdf, tmp_path):
+    full = str(tmp_path / "full")
+    assert ingest_pdf(policy_pdf, full, batch_size=2) > 0
+
+    resumed = str(tmp_path / "resumed")
+    with pytest.raises(Interrupted):
+        ingest_pdf(policy_pdf, resumed, batch_size=2, on_commit=interrupt_after(2))
+    assert os.path.exists(os.path.join(resumed, PROGRESS_FILE))
+    ingest_pdf(policy_pdf, resumed, batch_size=2)
+
+    full_texts, full_pages, full_vectors = contents(full)
+    texts, pages, vectors = contents(resumed)
+    assert texts == full_texts and pages == full_pages
+    np.testing.assert_array_equal(vectors, full_vectors)
+    assert not os.path.exists(os.path.join(resumed, PROGRESS_FILE))
+
+def test_writes_after_the_last_commit_are_truncated(policy_pdf, tmp_path):
+    cache_path = str(tmp_path / "cache")
+    with pytest.raises(Interrupted):
+        ingest_pdf(policy_pdf, cache_path, batch_size=2, on_commit=interrupt_after(1))
+    # a batch that crashed half-way through its writes
+    for name in (PARTIAL_VECTORS, chunk_store.PARTIAL_TEXT, chunk_store.PARTIAL_ROWS):
+        with open(os.path.join(cache_path, name), "ab") as f:
+            f.write(b"\0" * 24)
+    progress = _load_progress(cache_path, policy_pdf)
+    assert progress is not None
+    assert os.path.getsize(os.path.join(cache_path, PARTIAL_VECTORS)) == progress["vectors_bytes"]
+    assert os.path.getsize(os.path.join(cache_path, chunk_store.PARTIAL_ROWS)) == progress["rows_bytes"]
+
+def test_short_partial_files_restart_the_build(policy_pdf, tmp_path):
+    cache_path = str(tmp_path / "cache")
+    with pytest.raises(Interrupted):
+        ingest_pdf(policy_pdf, cache_path, batch_size=2, on_commit=interrupt_after(2))
+    with open(os.path.join(cache_path, PARTIAL_VECTORS), "r+b") as f:
+        f.truncate(8)
+    assert _load_progress(cache_path, policy_pdf) is None
+
+def test_changed_source_restarts_the_build(policy_pdf, tmp_path):
+    cache_path = str(tmp_path / "cache")
+    with pytest.raises(Interrupted):
+        ingest_pdf(policy_pdf, cache_path, batch_size=2, on_commit=interrupt_after(1))
+    os.utime(policy_pdf, ns=(0, 0))
+    assert _load_progress(cache_path, policy_pdf) is None
+
+def test_update_reuses_unchanged_pages(policy_pdf, tmp_path):
+    cache_path = str(tmp_path / "cache")
+    chunks = ingest_pdf(policy_pdf, cache_path)
+    before = contents(cache_path)
+    stats = update_index(policy_pdf, cache_path)
+    assert stats == {"reused": chunks, "recomputed": 0, "removed": 0}
+    after = contents(cache_path)
+    assert after[0] == before[0] and after[1] == before[1]
+    np.testing.assert_array_equal(after[2], before[2])
@@ -0,0 +1,65 @@
+import os
+import time
+import pytest
+from modules import chunk_store, lexical
+from modules.chunker import ChunkNode
+
+TEXTS = [
+    "Cataract surgery is covered after a waiting period of 24 months.",
+    "Room rent is capped at one percent of the sum insured.",
+    "Maternity expenses are excluded during the first policy year.",
+    "Claims under clause 4.2.1 need a hospitalisation of 24 hours.",
+]
+
+def write_cache(path, texts):
+    os.makedirs(path, exist_ok=True)
+    nodes = [ChunkNode(text, {"file_name": "a.pdf", "page_number": i + 1, "chunk_number": 1}) for i, text in enumerate(texts)]
+    chunk_store.write_store(path, nodes)
+    return path
+
+def test_tokenize_keeps_compounds_and_drops_stopwords():
+    tokens = lexical.tokenize("What is clause 4.2.1 of the pre-existing rules?")
+    assert "4.2.1" in tokens and "4" in tokens and "pre-existing" in tokens and "existing" in tokens
+    assert "the" not in tokens and "is" not in tokens
+
+def test_search_ranks_the_matching_chunk_first():
+    index = lexical.build(TEXTS)
+    hits = index.search("cataract waiting period", 3)
+    assert hits[0][2] == 0
+    assert hits[0][1] == pytest.approx(1.0)
+    assert all(score > 0 for score, _, _ in hits)
+
+def test_search_coverage_counts_unknown_terms():
+    index = lexical.build(TEXTS)
+    score, coverage, position = index.search("maternity dental", 1)[0]
+    assert position == 2
+    assert 0.0 < coverage < 1.0
+
+def test_no_match_and_empty_query():
+    index = lexical.build(TEXTS)
+    assert index.search("xylophone", 5) == []
+    assert index.search("the of and", 5) == []
+    assert lexical.build([]).search("cataract", 5) == []
+
+def test_saved_index_round_trips(tmp_path):
+    path = write_cache(str(tmp_path / "doc"), TEXTS)
+    built = lexical.build_for_cache(path)
+    loaded = lexical._load(path)
+    assert loaded.terms == built.terms
+    assert loaded.search("room rent sum insured", 4) == built.search("room rent sum insured", 4)
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = write_cache(str(tmp_path / "doc"), TEXTS)
+    lexical.build_for_cache(path)
+    assert lexical.get_lexical(path).count == len(TEXTS)
+    time.sleep(0.01)
+    write_cache(path, TEXTS[:2])
+    assert lexical.get_lexical(path).count == 2
+
+def test_documents_are_merged_by_rank(tmp_path):
+    # the second document repeats the term, so its raw scores are higher
+    first = write_cache(str(tmp_path / "first"), ["surgery limits apply.", "surgery surgery surgery covered.", "other"])
+    second = write_cache(str(tmp_path / "second"), ["surgery surgery surgery surgery.", "surgery surgery surgery.", "other"])
+    hits = lexical.search("surgery", [first, second], 4)
+    assert {path for _, _, path, _ in hits[:2]} == {first, second}
+    assert {path for _, _, path, _ in hits[2:]} == {first, second}
@@ -0,0 +1,28 @@
+import fitz
+import pytest
+from modules import config, loader
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_streamed_document_context_matches_the_full_extraction(policy_pdf, monkeypatch, workers):
+    monkeypatch.setattr(config, "PARALLEL_MIN_PAGES", 1)
+    expected = loader.extract_and_clean_pdf(policy_pdf, workers=1)
+    pages = list(loader.iter_clean_pages(policy_pdf, workers=workers))
+    assert pages[0] == {"page_number": "Document Header", "text": expected["doc_context"]}
+    assert expected["doc_context"]
+    assert pages[1:] == expected["pages"]
+
+def test_header_longer_than_the_kept_page_top(tmp_path):
+    # digits don't count when lines are compared, so all eight lines are headers
+    path = str(tmp_path / "long_header.pdf")
+    doc = fitz.open()
+    for page_index in range(4):
+        page = doc.new_page()
+        lines = [f"Schedule header {i}" for i in range(8)] + [f"Clause {page_index} covers {'x' * page_index} only", "End of page"]
+        for j, line in enumerate(lines):
+            page.insert_text((72, 72 + 16 * j), line)
+    doc.save(path)
+    doc.close()
+
+    expected = loader.extract_and_clean_pdf(path, workers=1)["doc_context"]
+    assert len(expected.split("\n")) > len(loader.HEADER_WEIGHTS)
+    assert next(loader.iter_clean_pages(path, workers=1))["text"] == expected
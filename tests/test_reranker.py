@@ -0,0 +1,55 @@
+import pytest
+from modules import config, reranker
+
+class Node:
+    def __init__(self, text):
+        self.text = text
+
+    def get_content(self):
+        return self.text
+
+NODES = [Node(text) for text in (
+    "maternity expenses are covered after a waiting period",
+    "room rent is capped for ICU admission",
+    "AYUSH treatments are covered in a registered hospital",
+    "cashless claims need the pre-authorization form",
+    "maternity expenses exclude the first nine months",
+    "dental treatment is excluded unless caused by an accident",
+)]
+BI_SCORES = [0.9, 0.3, 0.2, 0.1, 0.85, 0.05]
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    reranker.clear_cache()
+    yield
+    reranker.clear_cache()
+
+def test_the_same_question_is_served_from_the_cache():
+    first, second = {}, {}
+    scores = reranker.score_candidates("Are maternity expenses covered?", NODES, 3, stats=first)
+    again = reranker.score_candidates("  are maternity expenses COVERED ", NODES, 3, stats=second)
+    assert again == scores
+    assert (first["pairs_scored"], first["pairs_cached"]) == (len(NODES), 0)
+    assert (second["pairs_scored"], second["pairs_cached"]) == (0, len(NODES))
+
+def test_adaptive_pruning_is_off_by_default():
+    stats = {}
+    scores = reranker.score_candidates("Are maternity expenses covered?", NODES, 3, bi_scores=BI_SCORES, stats=stats)
+    assert len(scores) == len(NODES) and stats["pairs_skipped"] == 0
+
+def test_adaptive_pruning_skips_candidates_far_below_the_top(monkeypatch):
+    monkeypatch.setattr(config, "RERANK_ADAPTIVE", True)
+    monkeypatch.setattr(config, "RERANK_BATCH_SIZE", 2)
+    monkeypatch.setattr(config, "RERANK_MARGIN", 0.15)
+    stats = {}
+    top = reranker.rerank("Are maternity expenses covered?", NODES, 2, bi_scores=BI_SCORES, stats=stats)
+    assert stats["pairs_skipped"] > 0
+    assert [node.get_content() for _, node in top] == [NODES[0].get_content(), NODES[4].get_content()]
+
+def test_score_many_matches_score_candidates():
+    queries = ["Are maternity expenses covered?", "Is room rent capped?"]
+    many = reranker.score_many([(query, NODES) for query in queries])
+    reranker.clear_cache()
+    for query, row in zip(queries, many):
+        scores = reranker.score_candidates(query, NODES, 3)
+        assert row == [scores[i] for i in range(len(NODES))]
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from modules import config, indexer, llm_backends, service
+from modules.llm_backends import FAKE_REPLY, FakeBackend
+
+class SlowBackend(FakeBackend):
+    # streams the fake reply, then keeps talking until it is stopped
+    def __init__(self):
+        super().__init__()
+        self.tokens = 0
+        self.closed = threading.Event()
+
+    def stream(self, prompt, model=None, stats=None, context=None):
+        try:
+            for token in FAKE_REPLY.split(" ") + ["more "] * 400:
+                self.tokens += 1
+                time.sleep(0.01)
+                yield token + " "
+        finally:
+            self.closed.set()
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(llm_backends, "_backend", backend)
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    return backend
+
+async def _request(port, path, payload):
+    # (status, body) of one request; chunked bodies come back as their JSON lines
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ")[1])
+    if b"chunked" in head:
+        return status, [json.loads(line) for line in body.split(b"\r\n") if line.startswith(b"{")]
+    return status, json.loads(body)
+
+def _serve(requests):
+    # runs the service for the given (path, payload) requests, returns their responses
+    async def main():
+        query_service = service.QueryService()
+        server = await query_service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await _request(port, path, payload) for path, payload in requests]
+        finally:
+            server.close()
+            await query_service.stop()
+    return asyncio.run(main())
+
+def test_query_answers_from_an_indexed_pdf(policy_pdf, backend):
+    pytest.importorskip("llama_index.core.schema")
+    indexer.build_document(policy_pdf)
+    [(status, record)] = _serve([("/query", {"pdf": policy_pdf, "query": "Is maternity covered?"})])
+    assert status == 200 and record["status"] == "sufficient" and record["sources"]
+
+def test_request_errors(policy_pdf, backend, tmp_path):
+    responses = _serve([
+        ("/query", {"pdf": policy_pdf}),
+        ("/query", {"pdf": policy_pdf, "query": "Is maternity covered?"}),
+        ("/query", {"pdf": str(tmp_path / "missing.pdf"), "query": "Is maternity covered?"}),
+        ("/nowhere", {}),
+    ])
+    assert [status for status, _ in responses] == [400, 404, 404, 404]
+    assert "POST /index first" in responses[1][1]["error"]
+
+def test_stream_ends_with_an_error_line_when_generation_fails(policy_pdf, backend, monkeypatch):
+    pytest.importorskip("llama_index.core.schema")
+    indexer.build_document(policy_pdf)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("backend exploded")
+
+    monkeypatch.setattr(service, "stream_llm_with_context", broken)
+    [(status, lines)] = _serve([("/query/stream", {"pdf": policy_pdf, "query": "Is maternity covered?"})])
+    assert status == 200
+    assert lines[-1] == {"done": True, "status": "error", "error": "backend exploded"}
+
+def test_query_timeout_stops_the_generation(policy_pdf, monkeypatch):
+    pytest.importorskip("llama_index.core.schema")
+    indexer.build_document(policy_pdf)
+    slow = SlowBackend()
+    monkeypatch.setattr(llm_backends, "_backend", slow)
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "SERVICE_REQUEST_TIMEOUT", 1.0)
+    [(status, _)] = _serve([("/query", {"pdf": policy_pdf, "query": "Is maternity covered?"})])
+    assert status == 504
+    assert slow.closed.wait(5)
+    assert slow.tokens < 400
@@ -0,0 +1,59 @@
+from modules.llm_interface import StreamingVerdictParser, parse_llm_output
+
+APPROVED = (
+    "Justification: Clause 4.2 covers cataract surgery after 24 months.\n"
+    "Decision: Approved\n"
+    "---\n"
+    "Disclaimer: this is not legal advice.\n"
+)
+INSUFFICIENT = (
+    "Justification: The policy start date is not given.\n"
+    "Decision: Insufficient Information\n"
+    "Clarifying Questions:\n"
+    "1. When did the policy start?\n"
+    "2. Was the claim due to an accident?\n"
+    "---\n"
+    "Disclaimer: this is not legal advice.\n"
+)
+
+def stream(parser, text, size=3):
+    # feeds text a few characters at a time, returns what was shown
+    shown = [parser.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    shown.append(parser.finish())
+    return "".join(shown)
+
+def test_approval_completes_on_the_decision_line():
+    parser = StreamingVerdictParser()
+    shown = stream(parser, APPROVED)
+    assert parser.complete
+    assert parser.status == "sufficient"
+    assert parser.decision == "Approved"
+    assert shown == APPROVED.split("---")[0]
+    assert "Disclaimer" not in parser.text
+
+def test_insufficient_collects_questions_and_hides_the_boilerplate():
+    parser = StreamingVerdictParser()
+    shown = stream(parser, INSUFFICIENT)
+    assert parser.status == "insufficient"
+    assert parser.questions == ["1. When did the policy start?", "2. Was the claim due to an accident?"]
+    assert "---" not in shown and "Disclaimer" not in shown
+    assert parse_llm_output(parser.text)["questions"] == parser.questions
+
+def test_stop_marker_split_over_tokens_is_never_shown():
+    parser = StreamingVerdictParser()
+    shown = "".join(parser.feed(token) for token in ["Decision: Insufficient Information\n", "-", "-", "-\nmore\n"])
+    assert shown == "Decision: Insufficient Information\n"
+    assert parser.complete
+
+def test_without_stop_early_everything_is_shown():
+    parser = StreamingVerdictParser(stop_early=False)
+    shown = stream(parser, APPROVED)
+    assert not parser.complete
+    assert shown == APPROVED
+    assert parser.text == APPROVED
+    assert parser.decision == "Approved"
+
+def test_unterminated_last_line_is_flushed_by_finish():
+    parser = StreamingVerdictParser()
+    assert stream(parser, "Justification: none\nDecision: Denied") == "Justification: none\nDecision: Denied"
+    assert parser.decision == "Denied"